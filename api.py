@@ -0,0 +1,338 @@
+# Imported first, it starts the clock of the startup report
+from small_size_league_expert.startup import startup_report, startup_step
+
+import asyncio
+import json
+import math
+import traceback
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from api_settings import ApiSettings
+from small_size_league_expert.deadline import with_deadline
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.models import DiscordAnswer
+from small_size_league_expert.scheduler import (
+    AdmissionError,
+    AskScheduler,
+    Flight,
+    QueueFullError,
+)
+from small_size_league_expert.sessions import SESSION_INPUT
+from small_size_league_expert.workers import get_engine
+
+settings = ApiSettings()
+
+if settings.API_RUN_DISCORD_BOT:
+    # The bot answers with the same crews and the same scheduler as the API
+    import discord_bot
+
+    engine, scheduler = discord_bot.engine, discord_bot.scheduler
+else:
+    engine = get_engine()
+    scheduler = AskScheduler()
+startup_step("imports")
+
+
+async def run_discord_bot():
+    try:
+        await discord_bot.setup(discord_bot.bot)
+        await discord_bot.bot.start(discord_bot.settings.DISCORD_BOT_TOKEN)
+    except Exception as e:
+        print(f"❌ Discord bot stopped: {e}")
+        traceback.print_exc()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await engine.start()
+    startup_step("engine")
+    startup_report("api")
+    bot_task = None
+    if settings.API_RUN_DISCORD_BOT:
+        bot_task = asyncio.create_task(run_discord_bot())
+
+    try:
+        yield
+    finally:
+        print("🔄 Shutting down the API...")
+        if bot_task is not None:
+            await discord_bot.bot.close()
+            await bot_task
+        await engine.close()
+
+
+app = FastAPI(
+    title="RoboCup SSL Expert API",
+    description="Answers questions about the RoboCup Small Size League.",
+    lifespan=lifespan,
+)
+
+
+class AskRequest(BaseModel):
+    question: str = Field(
+        ..., min_length=1, description="A question about the RoboCup SSL"
+    )
+    user_id: str | None = Field(
+        default=None,
+        description="Who is asking, for the rate limits. Defaults to the client address.",
+    )
+    session_id: str | None = Field(
+        default=None,
+        description="The conversation of the question, whose follow-ups reuse its context.",
+    )
+
+
+class BatchAskRequest(BaseModel):
+    questions: list[str] = Field(..., min_length=1, description="The questions")
+    user_id: str | None = Field(
+        default=None,
+        description="Who is asking, for the rate limits. Defaults to the client address.",
+    )
+
+
+class BatchAnswer(BaseModel):
+    question: str = Field(..., description="The question")
+    status_code: int = Field(..., description="HTTP status of this question")
+    answer: DiscordAnswer | None = Field(default=None, description="The answer")
+    error: str | None = Field(default=None, description="Why there is no answer")
+    retry_after: float | None = Field(
+        default=None, description="Seconds to wait before asking again"
+    )
+
+
+class BatchAskResponse(BaseModel):
+    results: list[BatchAnswer] = Field(..., description="One result per question")
+
+
+class AskFailedError(Exception):
+    """A question could not be answered, with the HTTP status to report."""
+
+    def __init__(
+        self, status_code: int, message: str, retry_after: float | None = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def to_http(self) -> HTTPException:
+        headers = None
+        if self.retry_after is not None:
+            headers = {"Retry-After": str(math.ceil(self.retry_after))}
+        return HTTPException(self.status_code, str(self), headers=headers)
+
+
+def runner(question: str, session: str | None):
+    """The crew run answering a question, for the scheduler."""
+    inputs = {
+        "original_question": question,
+        "current_date": datetime.now().isoformat(),
+    }
+    if session is not None:
+        inputs[SESSION_INPUT] = session
+    inputs = with_deadline(inputs)
+    return lambda stream: engine.answer(inputs, stream)
+
+
+def admission_failed(error: AdmissionError) -> AskFailedError:
+    retry_after = (
+        error.retry_after
+        if error.retry_after and math.isfinite(error.retry_after)
+        else None
+    )
+    status_code = 503 if isinstance(error, QueueFullError) else 429
+    return AskFailedError(status_code, str(error), retry_after)
+
+
+def submit(question: str, user_id: str, session_id: str | None = None) -> Flight:
+    """Schedule a question with the scheduler shared with the Discord bot."""
+    session = f"api:{session_id}" if session_id else None
+    try:
+        return scheduler.submit(
+            question,
+            runner(question, session),
+            user_id=f"api:{user_id}",
+            session=session,
+        )
+    except AdmissionError as e:
+        raise admission_failed(e) from e
+
+
+def submit_batch(questions: list[str], user_id: str) -> list[Flight]:
+    """Schedule the questions of a batch, admitted or refused together."""
+    try:
+        return scheduler.submit_batch(
+            [(question, runner(question, None)) for question in questions],
+            user_id=f"api:{user_id}",
+        )
+    except AdmissionError as e:
+        raise admission_failed(e) from e
+
+
+async def wait_for_answer(flight: Flight, timeout: float) -> dict:
+    """Wait for the answer of a flight, as JSON-ready data."""
+    try:
+        answer = await asyncio.wait_for(flight.result(), timeout)
+    except asyncio.TimeoutError as e:
+        # Other callers may still wait for the flight, which keeps running
+        raise AskFailedError(
+            504, "The answer took too long, please try again later."
+        ) from e
+    except Exception as e:
+        print(f"❌ Error answering '{flight.key}': {e}")
+        traceback.print_exc()
+        raise AskFailedError(
+            502, "The question could not be answered, please try again."
+        ) from e
+
+    if not answer:
+        raise AskFailedError(
+            404, "No answer was found, please try rephrasing the question."
+        )
+    return answer.model_dump()
+
+
+def client_id(request: Request, user_id: str | None) -> str:
+    if user_id:
+        return user_id
+    return request.client.host if request.client else "unknown"
+
+
+@app.post("/ask", response_model=DiscordAnswer)
+async def ask(body: AskRequest, request: Request):
+    """Answer a question."""
+    user_id = client_id(request, body.user_id)
+    log_event("api_question_received", user=user_id, question=body.question)
+    try:
+        flight = submit(body.question, user_id, body.session_id)
+        return await wait_for_answer(flight, settings.API_REQUEST_TIMEOUT)
+    except AskFailedError as e:
+        raise e.to_http() from e
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def until(deadline: float, iterator: AsyncIterator) -> AsyncIterator:
+    """Iterate until the deadline of the event loop clock, then time out."""
+    loop = asyncio.get_running_loop()
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        try:
+            yield await asyncio.wait_for(iterator.__anext__(), remaining)
+        except StopAsyncIteration:
+            return
+
+
+@app.post("/ask/stream")
+async def ask_stream(body: AskRequest, request: Request):
+    """Answer a question with Server-Sent Events.
+
+    Sends `queued` events with the queue position while the question waits,
+    `delta` events with the new text of the Markdown answer while it is
+    generated, then a single `answer` event with the full answer, or an
+    `error` event.
+    """
+    user_id = client_id(request, body.user_id)
+    log_event("api_question_received", user=user_id, question=body.question)
+    try:
+        flight = submit(body.question, user_id, body.session_id)
+    except AskFailedError as e:
+        raise e.to_http() from e
+
+    async def events() -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.API_REQUEST_TIMEOUT
+        try:
+            async for position in until(deadline, flight.positions()):
+                yield sse_event("queued", {"position": position})
+
+            sent = 0
+            async for text in until(
+                deadline, flight.stream.updates(settings.API_STREAM_INTERVAL)
+            ):
+                yield sse_event("delta", {"text": text[sent:]})
+                sent = len(text)
+
+            answer = await wait_for_answer(flight, max(deadline - loop.time(), 0))
+            yield sse_event("answer", answer)
+        except asyncio.TimeoutError:
+            yield sse_event(
+                "error",
+                {
+                    "status_code": 504,
+                    "detail": "The answer took too long, please try again later.",
+                },
+            )
+        except AskFailedError as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/ask/batch", response_model=BatchAskResponse)
+async def ask_batch(body: BatchAskRequest, request: Request):
+    """Answer many questions at once.
+
+    The batch is admitted as a whole: it counts as a single request for the
+    rate limits, and is refused with a 429 or 503 status and a `retry_after`
+    when the limits or the queue can not take all of its questions. The
+    questions are then answered concurrently, and the ones that fail or time
+    out come back with their own status.
+    """
+    capacity = scheduler.max_concurrency + scheduler.max_queue
+    if len(body.questions) > min(settings.API_BATCH_MAX_QUESTIONS, capacity):
+        raise HTTPException(
+            413,
+            "A batch can not have more than "
+            f"{min(settings.API_BATCH_MAX_QUESTIONS, capacity)} questions.",
+        )
+
+    user_id = client_id(request, body.user_id)
+    log_event("api_batch_received", user=user_id, questions=len(body.questions))
+
+    try:
+        flights = submit_batch(body.questions, user_id)
+    except AskFailedError as e:
+        raise e.to_http() from e
+
+    async def answer(question: str, flight: Flight) -> BatchAnswer:
+        try:
+            data = await wait_for_answer(flight, settings.API_REQUEST_TIMEOUT)
+        except AskFailedError as e:
+            return BatchAnswer(
+                question=question,
+                status_code=e.status_code,
+                error=str(e),
+                retry_after=e.retry_after,
+            )
+        return BatchAnswer(question=question, status_code=200, answer=data)
+
+    results = await asyncio.gather(
+        *(answer(question, flight) for question, flight in zip(body.questions, flights))
+    )
+    return BatchAskResponse(results=results)
+
+
+@app.get("/health")
+async def health():
+    """Load of the crews, for the load balancer."""
+    return {
+        "status": "ok",
+        "running": scheduler.running,
+        "queued": scheduler.queued,
+        "max_concurrency": scheduler.max_concurrency,
+        "max_queue": scheduler.max_queue,
+    }
@@ -0,0 +1,20 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class ApiSettings(BaseSettings):
+    # Load the .env file
+    model_config = SettingsConfigDict(
+        env_file=".env", extra="ignore", env_file_encoding="utf-8"
+    )
+
+    # Time a request waits for its answer before failing with a 504, in seconds
+    API_REQUEST_TIMEOUT: float = 180.0
+    # Most questions accepted by a single batch request
+    API_BATCH_MAX_QUESTIONS: int = 20
+    # Minimum delay between two events of a streamed answer, in seconds
+    API_STREAM_INTERVAL: float = 0.25
+    # Also run the Discord bot in the API process, sharing its crews
+    API_RUN_DISCORD_BOT: bool = False
+
+
+api_settings = ApiSettings()
@@ -0,0 +1,6 @@
+"""Offline load and latency benchmarks of the SSL expert crew.
+
+The crews run end to end against a fake LLM and a fake MCP server, so the
+benchmarks need neither network access nor API keys. Run them from the root
+of the repository with `make bench`.
+"""
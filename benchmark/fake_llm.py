@@ -0,0 +1,143 @@
+import json
+import re
+import time
+from types import SimpleNamespace
+from typing import Any
+
+from crewai.llms.base_llm import BaseLLM
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+
+from small_size_league_expert.llm_cache import CachedCompletions
+
+ANSWER_SENTENCE = (
+    "In Division A the field is 12 m by 9 m, the robots are at most 180 mm wide "
+    "and 150 mm tall [SSL rules](https://robocup-ssl.github.io/ssl-rules/sslrules.html)."
+)
+
+QUESTION = {
+    "question": "What are the dimensions of the Division A field?",
+    "language_code": "en",
+    "keywords": ["field", "dimensions", "division"],
+    "technical_domains": ["rules"],
+    "sub_questions": ["What are the dimensions of the Division A field?"],
+}
+PASSAGE = {
+    "answer": "The Division A field is 12 m long and 9 m wide.",
+    "references": ["https://robocup-ssl.github.io/ssl-rules/sslrules.html"],
+}
+
+
+class FakeLLM(BaseLLM):
+    """A deterministic LLM with a configurable latency and output size.
+
+    Every call waits `latency` seconds, then `token_latency` seconds for each
+    of the `tokens` words of the answer. Agent tasks get a valid final answer
+    for their output model, the compact question analysis gets its JSON, and
+    streaming calls emit their words as stream chunks. The token usage is
+    reported to the callbacks like a real LLM does.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        token_latency: float = 0.002,
+        tokens: int = 120,
+        stream: bool = False,
+    ):
+        super().__init__(model="fake/benchmark", temperature=0)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.stream = stream
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def _markdown(self) -> str:
+        words = []
+        sentence = ANSWER_SENTENCE.split()
+        while len(words) < self.tokens:
+            words += sentence
+        return " ".join(words[: self.tokens])
+
+    def _reply(self, task_name: str | None, prompt: str) -> str:
+        if "Reply with the Markdown answer only" in prompt:
+            # The answer generation without a stream
+            return self._markdown()
+        if task_name is None:
+            analysis = {
+                "question": QUESTION["question"],
+                "language_code": "pt",
+                "sub_questions": QUESTION["sub_questions"],
+            }
+            if '"items" array' in prompt:
+                # The question analyses batched across crews
+                numbers = re.findall(r"^(\d+)\. ", prompt, flags=re.MULTILINE)
+                return json.dumps(
+                    {"items": [{"id": int(n), **analysis} for n in numbers]}
+                )
+            if "## Question" in prompt:
+                # The rankings batched across crews
+                numbers = re.findall(r"^## Question (\d+):", prompt, flags=re.MULTILINE)
+                return json.dumps(
+                    {
+                        "rankings": [
+                            {"question": int(n), "passages": [1]} for n in numbers
+                        ]
+                    }
+                )
+            # The compact question analysis of the local analysis stage
+            return json.dumps(analysis)
+
+        ranked = [{**PASSAGE, "rank": 1}]
+        output = {
+            "question_analysis_task": QUESTION,
+            "retrieval_task": {"results": [PASSAGE]},
+            "ranking_task": {**QUESTION, "ranked_answers": ranked},
+            "answer_generation_task": {
+                **QUESTION,
+                "ranked_answers": ranked,
+                "markdown_answer": self._markdown(),
+            },
+        }.get(task_name, {})
+        return (
+            f"Thought: I now know the final answer\nFinal Answer: {json.dumps(output)}"
+        )
+
+    def call(
+        self,
+        messages: str | list[dict[str, str]],
+        tools: list[dict] | None = None,
+        callbacks: list[Any] | None = None,
+        available_functions: dict[str, Any] | None = None,
+        from_task: Any | None = None,
+        from_agent: Any | None = None,
+    ) -> str:
+        prompt = messages if isinstance(messages, str) else json.dumps(messages)
+        time.sleep(self.latency)
+
+        if self.stream:
+            reply = self._markdown()
+            for word in reply.split(" "):
+                time.sleep(self.token_latency)
+                crewai_event_bus.emit(self, LLMStreamChunkEvent(chunk=word + " "))
+        else:
+            reply = self._reply(getattr(from_task, "name", None), prompt)
+            time.sleep(self.token_latency * self.tokens)
+
+        usage = SimpleNamespace(
+            prompt_tokens=len(prompt) // 4,
+            completion_tokens=len(re.findall(r"\S+", reply)),
+            prompt_tokens_details=None,
+        )
+        for callback in callbacks or []:
+            if hasattr(callback, "log_success_event"):
+                callback.log_success_event(
+                    kwargs={}, response_obj={"usage": usage}, start_time=0, end_time=0
+                )
+        return reply
+
+
+class CachedFakeLLM(CachedCompletions, FakeLLM):
+    """A `FakeLLM` going through the completion cache, like the real LLMs."""
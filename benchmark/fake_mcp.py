@@ -0,0 +1,91 @@
+import asyncio
+import json
+import multiprocessing
+import re
+import socket
+import time
+
+RULES_URL = "https://robocup-ssl.github.io/ssl-rules/sslrules.html"
+WEBSITE_URL = "https://ssl.robocup.org"
+
+RULES = [
+    "The Division A field is 12 m long and 9 m wide, Division B plays on a 9 m by 6 m field.",
+    "A robot must fit inside a cylinder of 180 mm diameter and must be at most 150 mm tall.",
+    "The ball is a standard orange golf ball of about 43 mm diameter and 46 g.",
+    "A goal is scored when the whole ball crosses the goal line between the goal posts.",
+    "The ball must not travel faster than 6.5 m/s, faster shots are punished with a free kick.",
+    "Each team can have at most 11 robots on the field in Division A and 6 in Division B.",
+    "A penalty kick is awarded when a defender touches the ball inside its defense area.",
+    "Robots must keep a distance of 0.5 m to the ball while the game is stopped.",
+]
+TDPS = [
+    "Our robots use four omni wheels driven by brushless motors and a solenoid kicker.",
+    "We track the ball with an extended Kalman filter fed by the SSL-Vision detections.",
+    "The path planner uses a rapidly exploring random tree, replanned at 60 Hz.",
+    "The dribbler is a rubber roller spinning backwards at 10 000 rpm.",
+]
+WEBSITE = [
+    "The RoboCup Small Size League is one of the oldest RoboCup soccer leagues.",
+    "SSL-Vision is the shared vision system of the league, with cameras above the field.",
+    "Teams must submit a team description paper to qualify for RoboCup.",
+]
+
+
+def _search(documents: list[str], query: str, url: str, top_k: int = 3) -> str:
+    """Rank the canned documents by the words they share with the query."""
+    words = set(re.findall(r"\w+", query.lower()))
+    ranked = sorted(
+        documents,
+        key=lambda document: -len(words & set(re.findall(r"\w+", document.lower()))),
+    )
+    return json.dumps(
+        [{"content": document, "url": url} for document in ranked[:top_k]]
+    )
+
+
+def serve(port: int, latency: float) -> None:
+    """Run a streamable-http MCP server with canned rules, TDP and website content."""
+    from mcp.server.fastmcp import FastMCP
+
+    server = FastMCP("fake-ssl", host="127.0.0.1", port=port, log_level="CRITICAL")
+
+    @server.tool()
+    async def search_rules(query: str) -> str:
+        """Search the SSL rulebook."""
+        await asyncio.sleep(latency)
+        return _search(RULES, query, RULES_URL)
+
+    @server.tool()
+    async def search_tdp(query: str) -> str:
+        """Search the team description papers."""
+        await asyncio.sleep(latency)
+        return _search(TDPS, query, "https://ssl.robocup.org/tdps/fake-team.pdf")
+
+    @server.tool()
+    async def search_website(query: str) -> str:
+        """Search the SSL website."""
+        await asyncio.sleep(latency)
+        return _search(WEBSITE, query, WEBSITE_URL)
+
+    server.run(transport="streamable-http")
+
+
+def start_fake_mcp_server(
+    port: int, latency: float = 0.05, timeout: float = 30.0
+) -> multiprocessing.process.BaseProcess:
+    """Start the fake MCP server in its own process and wait until it listens."""
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(port, latency), name="fake-mcp", daemon=True
+    )
+    process.start()
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError(f"The fake MCP server did not start on port {port}")
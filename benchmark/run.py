@@ -0,0 +1,429 @@
+"""Load and latency benchmark of the `/ask` flow.
+
+Questions go through the same path as on Discord: the `AskScheduler`, a
+`CrewPool` of `SmallSizeLeagueExpert` crews and the streamed answer. The LLM
+is a `FakeLLM`, the MCP server is a local fake serving canned rules, TDP and
+website passages, and Wikipedia is answered locally. Embeddings, including
+the ones of the knowledge files, come from the local hashing embedder.
+
+For each concurrency level, the benchmark reports the throughput, the
+p50/p95/p99 end-to-end and first-token latencies, the latency of each stage
+and the tokens spent. Results can be saved as the baseline, and later runs
+checked against it:
+
+    python -m benchmark.run --save-baseline
+    python -m benchmark.run --check
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmark.fake_llm import CachedFakeLLM
+from benchmark.fake_mcp import start_fake_mcp_server
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+QUESTIONS = [
+    "What is the diameter of the ball?",
+    "How big is the Division A field?",
+    "What is the maximum height of a robot?",
+    "When is a penalty kick awarded?",
+    "How fast can the ball be kicked?",
+    "How do teams track the ball with a Kalman filter and which vision system provides the detections?",
+    "Quais são as dimensões do campo na divisão A?",
+    "¿Cuántos robots puede tener un equipo en la división B?",
+    "How many robots can a team have on the field?",
+    "What does a team description paper contain?",
+]
+
+
+def configure_environment(args: argparse.Namespace, cache_dir: str) -> None:
+    """Point the settings to the fakes, before anything reads them."""
+    os.environ.update(
+        {
+            "MCP_ENDPOINT": f"http://127.0.0.1:{args.mcp_port}/mcp",
+            "MCP_TRANSPORT_TYPE": "streamable-http",
+            "CACHE_DIR": cache_dir,
+            "ANSWER_CACHE_ENABLED": str(args.answer_cache).lower(),
+            "LLM_CACHE_ENABLED": str(args.llm_cache).lower(),
+            "TOOL_CACHE_ENABLED": str(args.tool_cache).lower(),
+            "EMBEDDING_MODEL": args.embedding_model,
+            "KNOWLEDGE_EMBEDDER": "hashing",
+            "METRICS_PORT": "0",
+            "LOG_SAMPLE_RATE": "0",
+            "CREW_VERBOSE": "false",
+            "CREWAI_DISABLE_TELEMETRY": "true",
+            "OTEL_SDK_DISABLED": "true",
+        }
+    )
+
+
+def stub_wikipedia(latency: float) -> None:
+    """Answer the Wikipedia lookups locally, after the given latency."""
+    from small_size_league_expert.metrics import tool_call
+    from small_size_league_expert.tools.wikipedia_tool import (
+        WikipediaArticle,
+        WikipediaSearchTool,
+        WikipediaSection,
+    )
+
+    def articles(titles: list[str], language: str) -> list[WikipediaArticle]:
+        return [
+            WikipediaArticle(
+                title=title,
+                url=f"https://{language}.wikipedia.org/wiki/{title.replace(' ', '_')}",
+                sections=[
+                    WikipediaSection(
+                        "Introduction", f"{title} is a topic of the RoboCup SSL."
+                    )
+                ],
+            )
+            for title in titles
+        ]
+
+    def fetch(self, titles, language="en", terms=None):
+        with tool_call("wikipedia"):
+            time.sleep(latency)
+        return articles(titles, language)
+
+    async def afetch(self, titles, language="en", terms=None):
+        with tool_call("wikipedia"):
+            await asyncio.sleep(latency)
+        return articles(titles, language)
+
+    WikipediaSearchTool.fetch = fetch
+    WikipediaSearchTool.afetch = afetch
+
+
+def collect_runs() -> list:
+    """Keep the metrics of every crew run as it is recorded."""
+    from small_size_league_expert.metrics import RunMetrics
+
+    runs = []
+    observe = RunMetrics.observe
+
+    def observe_and_keep(run: RunMetrics) -> None:
+        observe(run)
+        runs.append(run)
+
+    RunMetrics.observe = observe_and_keep
+    return runs
+
+
+def crew_factory(args: argparse.Namespace):
+    from small_size_league_expert.crew import SmallSizeLeagueExpert
+
+    def fake_llm(stream: bool = False, tier: str = "large") -> CachedFakeLLM:
+        return CachedFakeLLM(
+            latency=args.llm_latency,
+            token_latency=args.llm_token_latency,
+            tokens=args.llm_tokens,
+            stream=stream,
+        )
+
+    def build() -> SmallSizeLeagueExpert:
+        expert = SmallSizeLeagueExpert()
+        # The agents are created with the crew, replace their LLM afterwards
+        expert.get_llm = fake_llm
+        for crew_agent in expert.crew().agents:
+            crew_agent.llm = fake_llm()
+        return expert
+
+    return build
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "mean": round(float(np.mean(values)), 4),
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def ask(engine, scheduler, question: str, user_id: str) -> dict:
+    """Ask a question like the Discord `/ask` command, following its stream."""
+    inputs = {
+        "original_question": question,
+        "current_date": "2025-07-01T12:00:00",
+    }
+    started = time.perf_counter()
+    flight = scheduler.submit(
+        question, lambda stream: engine.answer(inputs, stream), user_id=user_id
+    )
+    async for _ in flight.positions():
+        pass
+
+    first_token = None
+    async for _ in flight.stream.updates(0.01):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+
+    try:
+        answer = await flight.result()
+    except Exception as e:
+        print(f"⚠️ '{question}' failed: {e!r}")
+        answer = None
+    return {
+        "seconds": time.perf_counter() - started,
+        "first_token_seconds": first_token,
+        "answered": answer is not None,
+    }
+
+
+def summarize_stages(runs: list) -> dict:
+    stages: dict[str, dict] = {}
+    for run in runs:
+        for stage in run.stages:
+            summary = stages.setdefault(
+                stage.stage, {"seconds": [], "tokens": [], "modes": {}}
+            )
+            summary["seconds"].append(stage.seconds)
+            summary["tokens"].append(stage.prompt_tokens + stage.completion_tokens)
+            summary["modes"][stage.mode] = summary["modes"].get(stage.mode, 0) + 1
+
+    return {
+        name: {
+            "seconds": percentiles(summary["seconds"]),
+            "mean_tokens": round(float(np.mean(summary["tokens"])), 1),
+            "modes": summary["modes"],
+        }
+        for name, summary in stages.items()
+    }
+
+
+async def run_level(concurrency: int, requests: int, factory, runs: list) -> dict:
+    """Answer `requests` questions with `concurrency` clients asking in a loop."""
+    from small_size_league_expert.crew_pool import CrewPool
+    from small_size_league_expert.scheduler import AskScheduler
+
+    engine = CrewPool(size=concurrency, factory=factory)
+    await engine.start()
+    scheduler = AskScheduler(
+        max_concurrency=concurrency,
+        max_queue=requests,
+        user_rate=(requests, 1000.0),
+        guild_rate=(requests, 1000.0),
+    )
+
+    # Connects the MCP sessions and warms the caches up, out of the timing
+    await ask(engine, scheduler, QUESTIONS[0], "warm-up")
+    runs.clear()
+
+    indexes = itertools.count()
+
+    async def client(number: int) -> list[dict]:
+        results = []
+        while (index := next(indexes)) < requests:
+            # Distinct questions, so the scheduler does not merge them
+            question = f"{QUESTIONS[index % len(QUESTIONS)]} ({index})"
+            results.append(await ask(engine, scheduler, question, f"client-{number}"))
+        return results
+
+    started = time.perf_counter()
+    results = [
+        result
+        for client_results in await asyncio.gather(
+            *(client(number) for number in range(concurrency))
+        )
+        for result in client_results
+    ]
+    elapsed = time.perf_counter() - started
+
+    first_tokens = [
+        r["first_token_seconds"] for r in results if r["first_token_seconds"]
+    ]
+    return {
+        "requests": requests,
+        "errors": sum(not r["answered"] for r in results),
+        "throughput_qps": round(len(results) / elapsed, 3),
+        "latency": percentiles([r["seconds"] for r in results]),
+        "first_token": percentiles(first_tokens),
+        "stages": summarize_stages(runs),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    from small_size_league_expert.mcp_pool import get_mcp_pool
+
+    stub_wikipedia(args.mcp_latency)
+    runs = collect_runs()
+    factory = crew_factory(args)
+
+    levels = {}
+    try:
+        for concurrency in args.concurrency:
+            requests = args.requests or max(16, 4 * concurrency)
+            print(f"🏁 Concurrency {concurrency}: {requests} questions...")
+            levels[str(concurrency)] = await run_level(
+                concurrency, requests, factory, runs
+            )
+    finally:
+        await asyncio.to_thread(get_mcp_pool().stop)
+
+    return {
+        "config": {
+            "llm_latency": args.llm_latency,
+            "llm_token_latency": args.llm_token_latency,
+            "llm_tokens": args.llm_tokens,
+            "mcp_latency": args.mcp_latency,
+            "answer_cache": args.answer_cache,
+            "llm_cache": args.llm_cache,
+            "tool_cache": args.tool_cache,
+        },
+        "levels": levels,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """The metrics that got worse than the baseline by more than the tolerance."""
+    regressions = []
+    if results["config"] != baseline.get("config"):
+        print("⚠️ The baseline was measured with another configuration")
+
+    for level, current in results["levels"].items():
+        base = baseline.get("levels", {}).get(level)
+        if base is None:
+            continue
+
+        checks = [
+            (f"latency {key}", current["latency"][key], base["latency"][key])
+            for key in ("p50", "p95", "p99")
+        ]
+        checks.append(("peak RSS (MB)", current["peak_rss_mb"], base["peak_rss_mb"]))
+        for name, value, reference in checks:
+            if value > reference * (1 + tolerance):
+                regressions.append(
+                    f"concurrency {level}: {name} {reference} -> {value}"
+                )
+
+        if current["throughput_qps"] < base["throughput_qps"] * (1 - tolerance):
+            regressions.append(
+                f"concurrency {level}: throughput {base['throughput_qps']} -> "
+                f"{current['throughput_qps']} questions/s"
+            )
+    return regressions
+
+
+def print_report(results: dict) -> None:
+    print(
+        f"\n{'clients':>8} {'q/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+        f"{'first':>8} {'errors':>7} {'RSS MB':>8}"
+    )
+    for level, result in results["levels"].items():
+        latency = result["latency"]
+        print(
+            f"{level:>8} {result['throughput_qps']:>8} {latency['p50']:>8} "
+            f"{latency['p95']:>8} {latency['p99']:>8} "
+            f"{result['first_token'].get('p50', '-'):>8} {result['errors']:>7} "
+            f"{result['peak_rss_mb']:>8}"
+        )
+
+    for level, result in results["levels"].items():
+        print(f"\nStages at concurrency {level}:")
+        for name, stage in result["stages"].items():
+            print(
+                f"  {name:<24} p50 {stage['seconds']['p50']:>7}s  "
+                f"p95 {stage['seconds']['p95']:>7}s  {stage['mean_tokens']:>7} tokens  "
+                f"{stage['modes']}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the SSL expert crew offline."
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=0,
+        help="Questions per level (default: 4 per client, at least 16).",
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-token-latency", type=float, default=0.002)
+    parser.add_argument("--llm-tokens", type=int, default=120)
+    parser.add_argument("--mcp-latency", type=float, default=0.05)
+    parser.add_argument("--mcp-port", type=int, default=18888)
+    parser.add_argument(
+        "--answer-cache",
+        action="store_true",
+        help="Serve repeated questions from the answer cache (needs --embedding-model).",
+    )
+    parser.add_argument(
+        "--embedding-model",
+        default="",
+        help="Embedding model of the semantic lookups (default: local hashing embedder).",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        action="store_true",
+        help="Serve repeated LLM calls from the completion cache (off in production).",
+    )
+    parser.add_argument(
+        "--tool-cache",
+        action="store_true",
+        help="Serve repeated MCP and Wikipedia calls from the tool result cache.",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to this file.")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Fail when the results are worse than the baseline.",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    mcp_server = start_fake_mcp_server(args.mcp_port, args.mcp_latency)
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            configure_environment(args, cache_dir)
+            results = asyncio.run(run_benchmark(args))
+    finally:
+        mcp_server.terminate()
+
+    print_report(results)
+    text = json.dumps(results, indent=2) + "\n"
+    if args.output:
+        args.output.write_text(text)
+    if args.save_baseline:
+        BASELINE_PATH.write_text(text)
+        print(f"\n💾 Saved the baseline to {BASELINE_PATH}")
+
+    if args.check:
+        if not BASELINE_PATH.exists():
+            sys.exit(f"No baseline at {BASELINE_PATH}, run with --save-baseline first")
+        regressions = compare(
+            results, json.loads(BASELINE_PATH.read_text()), args.tolerance
+        )
+        if regressions:
+            print("\n❌ Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\n✅ No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+# Imported first, it starts the clock of the startup report
+from small_size_league_expert.startup import startup_report, startup_step
+
 import traceback
 from datetime import datetime
 
@@ -5,7 +8,12 @@ from discord import Intents, Interaction, Object, app_commands
 from discord.ext import commands
 
 from discord_settings import DiscordSettings
-from src.small_size_league_expert.crew import SmallSizeLeagueExpert
+from small_size_league_expert.deadline import with_deadline
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.models import DiscordAnswer
+from small_size_league_expert.scheduler import AdmissionError, AskScheduler
+from small_size_league_expert.sessions import SESSION_INPUT
+from small_size_league_expert.workers import CrewEngine, get_engine
 
 settings = DiscordSettings()
 
@@ -15,10 +23,10 @@ bot = commands.AutoShardedBot(command_prefix="!", intents=intents)
 
 
 class Ask(commands.Cog):
-    crew_instance = None
-
-    def __init__(self, bot):
+    def __init__(self, bot, engine: CrewEngine, scheduler: AskScheduler):
         self.bot = bot
+        self.engine = engine
+        self.scheduler = scheduler
 
     @app_commands.command(name="ask", description="Ask any question")
     @app_commands.describe(
@@ -26,47 +34,114 @@ class Ask(commands.Cog):
     )
     async def ask(self, interaction: Interaction, question: str):
         interactionID = interaction.id
-        print(f"🔔 Interaction ID: {interactionID} - Received question: {question}")
-        print(
-            f"[{interactionID}] 🔍 {interaction.user} asked: {question}. Deferring the response."
+        log_event(
+            "question_received",
+            interaction=interactionID,
+            user=str(interaction.user),
+            question=question,
         )
-        await interaction.response.defer(thinking=True)
-        print(f"[{interactionID}] 🔄 Processing question: {question}")
-
-        try:
-            inputs = {
+        # The time budget of the answer starts now, as the interaction is
+        # deferred, and covers the time spent in the queue
+        # A thread is a channel of its own, so each thread has its session
+        session_id = f"discord:{interaction.channel_id}"
+        inputs = with_deadline(
+            {
                 "original_question": question,
                 "current_date": datetime.now().isoformat(),
+                SESSION_INPUT: session_id,
             }
+        )
 
-            print(f"[{interactionID}] 🚀 Kicking off SSL expert crew...")
+        try:
+            flight = self.scheduler.submit(
+                question,
+                lambda stream: self.engine.answer(inputs, stream),
+                user_id=interaction.user.id,
+                guild_id=interaction.guild_id,
+                session=session_id,
+            )
+        except AdmissionError as e:
+            print(f"[{interactionID}] 🚦 Question not admitted: {e}")
+            retry_hint = (
+                f" Try again in {e.retry_after:.0f} seconds."
+                if e.retry_after and e.retry_after != float("inf")
+                else ""
+            )
+            await interaction.response.send_message(
+                f"🚦 {e}{retry_hint}", ephemeral=True
+            )
+            return
 
-            self.crew_instance = SmallSizeLeagueExpert()
-            result = await self.crew_instance.crew().kickoff_async(inputs=inputs)
+        await interaction.response.defer(thinking=True)
+
+        try:
+            message = None
+            content = None
+
+            # Tell the user where the question stands while it waits
+            async for position in flight.positions():
+                content = f"⏳ Your question is #{position} in the queue, it will be answered shortly."
+                try:
+                    if message is None:
+                        message = await interaction.followup.send(content, wait=True)
+                    else:
+                        await message.edit(content=content)
+                except Exception as queue_error:
+                    print(
+                        f"[{interactionID}] ⚠️ Failed to report the queue position: {queue_error}"
+                    )
+
+            # Post the answer as soon as its first tokens arrive, then keep
+            # editing the same message while it is generated
+            async for partial_answer in flight.stream.updates(
+                settings.DISCORD_STREAM_EDIT_INTERVAL
+            ):
+                content = DiscordAnswer.format_message(
+                    partial_answer,
+                    user_mention=interaction.user.mention,
+                    original_question=question,
+                )
+                try:
+                    if message is None:
+                        message = await interaction.followup.send(content, wait=True)
+                    else:
+                        await message.edit(content=content)
+                except Exception as stream_error:
+                    # A failed edit is not worth failing the answer for, the
+                    # next update or the final answer will replace it
+                    print(
+                        f"[{interactionID}] ⚠️ Failed to stream the answer: {stream_error}"
+                    )
+
+            answer = await flight.result()
 
             # Use the safer crew execution method
-            if not result or not result.pydantic:
+            if not answer:
                 print(
                     f"[{interactionID}] ❌ Crew execution returned no result or invalid pydantic output."
                 )
-                await interaction.followup.send(
-                    f"{interaction.user.mention}, I couldn't find an answer to your question. Please try rephrasing it."
-                )
+                not_found_message = f"{interaction.user.mention}, I couldn't find an answer to your question. Please try rephrasing it."
+                if message is None:
+                    await interaction.followup.send(not_found_message)
+                else:
+                    await message.edit(content=not_found_message)
                 return
 
-            crew_markdown_result = result.pydantic.get_final_answer(
+            crew_markdown_result = answer.get_final_answer(
                 user_mention=interaction.user.mention, original_question=question
             )
 
-            print(
-                f"[{interactionID}] ✅ Crew execution completed successfully. Returning result to Discord with size {len(crew_markdown_result)}."
+            log_event(
+                "question_answered",
+                interaction=interactionID,
+                characters=len(crew_markdown_result),
+                answer=answer.model_dump(),
             )
 
-            print(
-                f"[{interactionID}] Full result: {result.pydantic.model_dump_json(indent=2)}"
-            )
-
-            await interaction.followup.send(crew_markdown_result)
+            if message is None:
+                await interaction.followup.send(crew_markdown_result)
+            elif content != crew_markdown_result:
+                await message.edit(content=crew_markdown_result)
 
         except Exception as e:
             print(f"[{interactionID}] ❌ Error in ask command: {e}")
@@ -145,8 +220,17 @@ class Feedback(commands.Cog):
         await interaction.response.send_message(feedback_info)
 
 
+# Crews run in worker processes, off the gateway event loop
+engine = get_engine()
+scheduler = AskScheduler()
+startup_step("imports")
+
+
 async def setup(bot):
-    await bot.add_cog(Ask(bot))
+    await engine.start()
+    startup_step("engine")
+
+    await bot.add_cog(Ask(bot, engine, scheduler))
     await bot.add_cog(Help(bot))
     await bot.add_cog(Contact(bot))
     await bot.add_cog(Feedback(bot))
@@ -164,6 +248,8 @@ async def on_ready():
     print("🌐 Syncing commands to global scope")
     await bot.tree.sync()
     print("✅ Bot is ready and commands are synced!")
+    startup_step("discord")
+    startup_report("gateway")
 
 
 @bot.event
@@ -188,5 +274,6 @@ if __name__ == "__main__":
         finally:
             print("🔄 Cleaning up bot...")
             await bot.close()
+            await engine.close()
 
     asyncio.run(main())
@@ -9,6 +9,8 @@ class DiscordSettings(BaseSettings):
 
     DISCORD_BOT_TOKEN: str
     DISCORD_GUILD_ID: int | None = None
+    # Minimum delay between two edits of a streamed answer, in seconds
+    DISCORD_STREAM_EDIT_INTERVAL: float = 1.0
 
 
 discord_settings = DiscordSettings()
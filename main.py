@@ -1,5 +1,7 @@
 import argparse
+import sys
 
+from small_size_league_expert.batch import add_arguments, run_batch
 from small_size_league_expert.crew import SmallSizeLeagueExpert
 
 
@@ -7,11 +9,25 @@ def main():
     parser = argparse.ArgumentParser(description="Run the article generator.")
 
     parser.add_argument(
-        "topic", type=str, help="The topic to generate an article about"
+        "topic", type=str, nargs="?", help="The topic to generate an article about"
     )
+    parser.add_argument(
+        "--batch",
+        metavar="QUESTIONS",
+        help="Answer the questions of a JSONL file ('-' for stdin) concurrently.",
+    )
+    add_arguments(parser)
 
     args = parser.parse_args()
 
+    if args.resume and not args.output:
+        parser.error("--resume needs an --output file")
+    if args.batch:
+        unanswered = run_batch(args.batch, args.output, args.concurrency, args.resume)
+        sys.exit(1 if unanswered else 0)
+    if not args.topic:
+        parser.error("a topic or --batch is required")
+
     print(f'Starting to generate article based on topic: "{args.topic}"')
 
     inputs = {"original_question": args.topic}
@@ -0,0 +1,873 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+from crewai.llms.base_llm import BaseLLM
+
+from small_size_league_expert.embeddings import STOPWORDS, tokenize
+from small_size_league_expert.models import Question
+from small_size_league_expert.structured import (
+    AnalysisReply,
+    BatchAnalysisReply,
+    count_output,
+    load_json,
+    with_schema,
+)
+
+KNOWLEDGE_DESCRIPTION = Path("knowledge") / "content_description.txt"
+
+ANALYSIS_STAGE = "question_analysis_task"
+
+# Function words of each supported language, used to detect the question language
+LANGUAGE_PROFILES = {
+    "en_US": set(STOPWORDS) | {"many", "much", "should", "could", "would", "has"},
+    "pt_BR": {
+        "o",
+        "a",
+        "os",
+        "as",
+        "um",
+        "uma",
+        "de",
+        "do",
+        "da",
+        "dos",
+        "das",
+        "em",
+        "no",
+        "na",
+        "nos",
+        "nas",
+        "que",
+        "qual",
+        "quais",
+        "quanto",
+        "quantos",
+        "como",
+        "por",
+        "para",
+        "com",
+        "é",
+        "são",
+        "se",
+        "não",
+        "tem",
+        "pode",
+        "deve",
+        "ao",
+        "aos",
+        "mais",
+        "onde",
+        "quando",
+        "porque",
+        "isso",
+    },
+    "es_ES": {
+        "el",
+        "la",
+        "los",
+        "las",
+        "un",
+        "una",
+        "de",
+        "del",
+        "en",
+        "que",
+        "cuál",
+        "cuáles",
+        "cual",
+        "cuanto",
+        "cuántos",
+        "cómo",
+        "como",
+        "por",
+        "para",
+        "con",
+        "es",
+        "son",
+        "se",
+        "no",
+        "tiene",
+        "puede",
+        "debe",
+        "al",
+        "más",
+        "dónde",
+        "cuándo",
+        "qué",
+        "hay",
+        "y",
+    },
+    "de_DE": {
+        "der",
+        "die",
+        "das",
+        "den",
+        "dem",
+        "des",
+        "ein",
+        "eine",
+        "einen",
+        "und",
+        "ist",
+        "sind",
+        "wie",
+        "was",
+        "welche",
+        "welcher",
+        "wo",
+        "wann",
+        "warum",
+        "mit",
+        "für",
+        "von",
+        "zu",
+        "im",
+        "auf",
+        "nicht",
+        "kann",
+        "muss",
+        "gibt",
+        "es",
+        "zwischen",
+        "funktioniert",
+    },
+    "fr_FR": {
+        "le",
+        "la",
+        "les",
+        "un",
+        "une",
+        "des",
+        "du",
+        "de",
+        "et",
+        "est",
+        "sont",
+        "quel",
+        "quelle",
+        "quels",
+        "quelles",
+        "comment",
+        "pourquoi",
+        "où",
+        "quand",
+        "avec",
+        "pour",
+        "dans",
+        "sur",
+        "ne",
+        "pas",
+        "peut",
+        "doit",
+        "au",
+        "aux",
+        "combien",
+        "qu",
+        "ce",
+    },
+    "it_IT": {
+        "il",
+        "lo",
+        "la",
+        "i",
+        "gli",
+        "le",
+        "un",
+        "una",
+        "di",
+        "del",
+        "della",
+        "e",
+        "è",
+        "sono",
+        "quale",
+        "quali",
+        "come",
+        "perché",
+        "dove",
+        "quando",
+        "con",
+        "per",
+        "nel",
+        "nella",
+        "non",
+        "può",
+        "deve",
+        "quanto",
+        "quanti",
+        "che",
+    },
+}
+
+# Scripts that identify a language on their own
+SCRIPT_LANGUAGES = (
+    ("HIRAGANA", "ja_JP"),
+    ("KATAKANA", "ja_JP"),
+    ("HANGUL", "ko_KR"),
+    ("CJK", "zh_CN"),
+    ("CYRILLIC", "ru_RU"),
+    ("ARABIC", "ar_SA"),
+)
+
+# SSL terms: the English keyword, its technical domain and its aliases in the
+# supported languages
+SSL_LEXICON: dict[str, tuple[str, tuple[str, ...]]] = {
+    "field": ("rules", ("field", "pitch", "campo", "cancha", "spielfeld", "terrain")),
+    "dimensions": (
+        "rules",
+        (
+            "dimensions",
+            "dimension",
+            "size",
+            "measurements",
+            "dimensões",
+            "dimensão",
+            "tamanho",
+            "medidas",
+            "dimensiones",
+            "tamaño",
+            "abmessungen",
+            "größe",
+            "maße",
+            "taille",
+            "dimensioni",
+        ),
+    ),
+    "robot": (
+        "hardware",
+        ("robot", "robots", "robô", "robôs", "robo", "robos", "roboter"),
+    ),
+    "ball": ("rules", ("ball", "bola", "pelota", "balón", "balle", "palla")),
+    "goal": (
+        "rules",
+        (
+            "goal",
+            "goals",
+            "gol",
+            "gols",
+            "tor",
+            "tore",
+            "buts",
+            "porta",
+            "portería",
+            "arco",
+        ),
+    ),
+    "penalty": (
+        "rules",
+        ("penalty", "pênalti", "penalti", "pénalty", "elfmeter", "rigore", "penal"),
+    ),
+    "defense area": (
+        "rules",
+        (
+            "defense",
+            "defence",
+            "defesa",
+            "defensa",
+            "verteidigung",
+            "défense",
+            "difesa",
+        ),
+    ),
+    "foul": ("rules", ("foul", "fouls", "falta", "faltas", "faute", "fallo")),
+    "yellow card": (
+        "rules",
+        ("yellow", "amarelo", "amarillo", "gelbe", "jaune", "giallo"),
+    ),
+    "red card": ("rules", ("red", "vermelho", "rojo", "rote", "rouge", "rosso")),
+    "referee": (
+        "rules",
+        (
+            "referee",
+            "árbitro",
+            "arbitro",
+            "schiedsrichter",
+            "arbitre",
+            "autoref",
+            "autoreferee",
+        ),
+    ),
+    "game controller": ("rules", ("controller", "gamecontroller")),
+    "match duration": (
+        "rules",
+        (
+            "duration",
+            "half",
+            "halftime",
+            "duração",
+            "duración",
+            "dauer",
+            "durée",
+            "durata",
+            "tempo",
+            "tiempo",
+        ),
+    ),
+    "division a": ("rules", ("diva",)),
+    "division b": ("rules", ("divb",)),
+    "division": (
+        "rules",
+        ("division", "divisions", "divisão", "división", "divisione"),
+    ),
+    "team": (
+        "events",
+        (
+            "team",
+            "teams",
+            "equipe",
+            "equipes",
+            "equipo",
+            "equipos",
+            "mannschaft",
+            "équipe",
+            "squadra",
+        ),
+    ),
+    "vision": (
+        "computer vision",
+        (
+            "vision",
+            "visão",
+            "visión",
+            "sehen",
+            "visione",
+            "ssl-vision",
+            "camera",
+            "cameras",
+            "câmera",
+            "cámara",
+            "kamera",
+            "caméra",
+        ),
+    ),
+    "tracking": (
+        "computer vision",
+        (
+            "tracking",
+            "track",
+            "rastreamento",
+            "rastreo",
+            "verfolgung",
+            "suivi",
+            "tracciamento",
+        ),
+    ),
+    "kicker": (
+        "hardware",
+        (
+            "kick",
+            "kicker",
+            "chute",
+            "chutar",
+            "patada",
+            "patear",
+            "schuss",
+            "tir",
+            "calcio",
+        ),
+    ),
+    "chip kick": ("hardware", ("chip",)),
+    "dribbler": ("hardware", ("dribbler", "dribble", "drible", "regate", "dribbel")),
+    "omni wheel": (
+        "hardware",
+        (
+            "wheel",
+            "wheels",
+            "omni",
+            "omniwheel",
+            "roda",
+            "rodas",
+            "rueda",
+            "ruedas",
+            "rad",
+            "räder",
+            "roue",
+            "roues",
+            "ruota",
+        ),
+    ),
+    "motor": (
+        "hardware",
+        ("motor", "motors", "motores", "motoren", "moteur", "motore", "brushless"),
+    ),
+    "battery": (
+        "hardware",
+        ("battery", "batteries", "bateria", "batería", "batterie", "batteria", "lipo"),
+    ),
+    "height": ("rules", ("height", "tall", "altura", "höhe", "hauteur", "altezza")),
+    "diameter": (
+        "rules",
+        ("diameter", "diâmetro", "diámetro", "durchmesser", "diamètre", "diametro"),
+    ),
+    "communication": (
+        "communication",
+        (
+            "communication",
+            "comunicação",
+            "comunicación",
+            "kommunikation",
+            "comunicazione",
+        ),
+    ),
+    "radio": (
+        "communication",
+        (
+            "radio",
+            "rádio",
+            "wireless",
+            "funk",
+            "frequency",
+            "frequência",
+            "frecuencia",
+            "frequenz",
+            "fréquence",
+        ),
+    ),
+    "path planning": (
+        "algorithms",
+        (
+            "path",
+            "planning",
+            "planejamento",
+            "planificación",
+            "pfadplanung",
+            "trajectory",
+            "trajetória",
+            "trayectoria",
+        ),
+    ),
+    "control": (
+        "control",
+        ("control", "controle", "controlo", "regelung", "contrôle", "controllo", "pid"),
+    ),
+    "strategy": (
+        "strategy",
+        (
+            "strategy",
+            "strategies",
+            "estratégia",
+            "estrategia",
+            "strategie",
+            "stratégie",
+            "strategia",
+            "tactics",
+            "tática",
+            "táctica",
+            "taktik",
+            "play",
+            "plays",
+        ),
+    ),
+    "simulation": (
+        "software",
+        (
+            "simulation",
+            "simulator",
+            "simulação",
+            "simulador",
+            "simulación",
+            "grsim",
+            "ersim",
+        ),
+    ),
+    "software": ("software", ("software", "framework", "código", "code")),
+    "team description paper": (
+        "team description papers",
+        ("tdp", "tdps", "paper", "papers", "artigo", "artículo"),
+    ),
+    "competition": (
+        "events",
+        (
+            "competition",
+            "competição",
+            "competición",
+            "wettbewerb",
+            "compétition",
+            "competizione",
+            "tournament",
+            "torneio",
+            "torneo",
+            "turnier",
+            "event",
+            "events",
+            "evento",
+            "eventos",
+        ),
+    ),
+    "registration": (
+        "events",
+        (
+            "registration",
+            "register",
+            "inscrição",
+            "inscripción",
+            "anmeldung",
+            "inscription",
+            "qualification",
+            "qualificação",
+            "clasificación",
+        ),
+    ),
+    "rules": (
+        "rules",
+        (
+            "rule",
+            "rules",
+            "regra",
+            "regras",
+            "regla",
+            "reglas",
+            "regel",
+            "regeln",
+            "règle",
+            "règles",
+            "regola",
+            "regole",
+            "rulebook",
+        ),
+    ),
+}
+
+_ALIASES = {
+    alias: keyword for keyword, (_, aliases) in SSL_LEXICON.items() for alias in aliases
+}
+
+# Openers of questions that ask for a single fact
+FACTUAL_OPENERS = (
+    "what is",
+    "what are",
+    "what's",
+    "how many",
+    "how much",
+    "how big",
+    "how tall",
+    "how long",
+    "how heavy",
+    "when",
+    "where",
+    "which",
+    "who",
+    "is",
+    "are",
+    "does",
+    "do",
+    "can",
+)
+
+ANALYSIS_PROMPT = """You prepare questions about the RoboCup Small Size League (SSL) for a search engine.
+
+Question: {question}
+
+Reply with only a JSON object with these keys:
+{keys}
+"""
+
+BATCH_ANALYSIS_PROMPT = """You prepare questions about the RoboCup Small Size League (SSL) for a search engine.
+
+Questions:
+{questions}
+
+Reply with only a JSON object whose "items" array holds one object per question, in the same order, with these keys:
+- "id": the number of the question
+{keys}
+"""
+
+ANALYSIS_KEYS = {
+    "question": '- "question": the question in English (unchanged if it already is in English)',
+    "follow_up": '- "question": the question in English, rewritten to stand on its own when it is the follow-up of another question',
+    "language_code": '- "language_code": the language of the question as an ISO code such as "en_US", "pt_BR" or "es_ES"',
+    "sub_questions": '- "sub_questions": up to 3 focused sub-questions in English, each covering a different knowledge domain (rules, technical, strategy)',
+}
+
+
+@dataclass
+class LocalAnalysis:
+    """What can be learned about a question without calling an LLM."""
+
+    language_code: str
+    language_confident: bool
+    keywords: list[str] = field(default_factory=list)
+    technical_domains: list[str] = field(default_factory=list)
+    short_factual: bool = False
+    # The question this one follows up in its session, see `sessions`
+    previous_question: str | None = None
+
+    def prompt_question(self, question: str) -> str:
+        """The question as shown to the LLM, with the one it follows up."""
+        if self.previous_question is None:
+            return question
+        return f'{question} (follow-up of: "{self.previous_question}")'
+
+    def to_question(
+        self, question: str, sub_questions: list[str] | None = None
+    ) -> Question:
+        if self.previous_question is not None and sub_questions is None:
+            # Searched together with the question it follows up
+            question = f"{question} ({self.previous_question})"
+        return Question(
+            question=question,
+            language_code=self.language_code,
+            keywords=self.keywords,
+            technical_domains=self.technical_domains,
+            sub_questions=(sub_questions or [question])[:3],
+        )
+
+
+def _words(text: str) -> list[str]:
+    return re.findall(r"[\w'-]+", text.lower())
+
+
+def detect_language(text: str) -> tuple[str, bool]:
+    """Detect the language of a text from its script and function words.
+
+    Returns the language code and whether the detection is confident.
+    """
+    for character in text:
+        if character.isalpha() and ord(character) > 0x24F:
+            name = unicodedata.name(character, "")
+            for script, language in SCRIPT_LANGUAGES:
+                if script in name:
+                    return language, True
+
+    words = _words(text)
+    scores = {
+        language: sum(word in profile for word in words)
+        for language, profile in LANGUAGE_PROFILES.items()
+    }
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (best, best_score), (_, second_score) = ranked[0], ranked[1]
+
+    if best_score == 0:
+        return "en_US", False
+    return best, best_score >= 2 and best_score > second_score
+
+
+@lru_cache(maxsize=1)
+def source_profiles() -> dict[str, set[str]]:
+    """Read the knowledge sources and the words describing when to use them."""
+    if not KNOWLEDGE_DESCRIPTION.exists():
+        return {}
+
+    profiles: dict[str, set[str]] = {}
+    current = None
+    for line in KNOWLEDGE_DESCRIPTION.read_text(encoding="utf-8").splitlines():
+        heading = re.match(r"^##\s*\d*\.?\s*(.+)$", line)
+        if heading:
+            current = re.sub(
+                r"small size soccer|content|\(.*?\)", "", heading.group(1).lower()
+            )
+            current = " ".join(current.split())
+            profiles[current] = set()
+        elif current and re.search(r"\*\*(purpose|when to use)\*\*", line.lower()):
+            profiles[current] |= set(tokenize(line.split(":", 1)[-1]))
+    return profiles
+
+
+def classify_domains(keywords: list[str], words: list[str]) -> list[str]:
+    """Classify a question in technical domains and knowledge sources."""
+    domains = [
+        SSL_LEXICON[keyword][0] for keyword in keywords if keyword in SSL_LEXICON
+    ]
+
+    terms = set(tokenize(" ".join(keywords + words)))
+    for source, profile in source_profiles().items():
+        if len(terms & profile) >= 2:
+            domains.append(source)
+
+    return list(dict.fromkeys(domains))
+
+
+def extract_keywords(text: str, language_code: str, max_keywords: int = 6) -> list[str]:
+    """Extract English keywords with the SSL lexicon.
+
+    English questions also keep their other content words, which can not be
+    translated for the other languages.
+    """
+    words = _words(text)
+    joined = " ".join(words)
+
+    keywords = []
+    for division in ("a", "b"):
+        if re.search(
+            rf"\b(division|divisão|división|divisione)\s+{division}\b", joined
+        ):
+            keywords.append(f"division {division}")
+    for word in words:
+        keyword = _ALIASES.get(word)
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+
+    if language_code.startswith("en"):
+        covered = set(tokenize(" ".join(keywords)))
+        for token in tokenize(text):
+            if token in covered or token in _ALIASES or token in keywords:
+                continue
+            if not token.isdigit():
+                keywords.append(token)
+
+    if any(k.startswith("division ") and k != "division" for k in keywords):
+        keywords = [k for k in keywords if k != "division"]
+    return keywords[:max_keywords]
+
+
+def is_short_factual(text: str, language_code: str, max_words: int = 12) -> bool:
+    """Whether a question is a short English question asking for one fact."""
+    if not language_code.startswith("en"):
+        return False
+
+    lowered = " ".join(_words(text))
+    return (
+        len(lowered.split()) <= max_words
+        and text.count("?") <= 1
+        and " and " not in f" {lowered} "
+        and f"{lowered} ".startswith(tuple(f"{opener} " for opener in FACTUAL_OPENERS))
+    )
+
+
+def analyze_question(
+    text: str, max_words: int = 12, previous: Question | None = None
+) -> LocalAnalysis:
+    """Analyze a question locally, without any LLM call.
+
+    A follow-up of a `previous` question adds its keywords to its own, and
+    always needs the LLM to be rewritten as a question of its own.
+    """
+    language_code, confident = detect_language(text)
+    keywords = extract_keywords(text, language_code)
+    if previous is not None:
+        keywords = list(dict.fromkeys(keywords + previous.keywords))[:6]
+    return LocalAnalysis(
+        language_code=language_code,
+        language_confident=confident,
+        keywords=keywords,
+        technical_domains=classify_domains(keywords, tokenize(text)),
+        short_factual=previous is None
+        and confident
+        and is_short_factual(text, language_code, max_words),
+        previous_question=previous.question if previous is not None else None,
+    )
+
+
+def is_complex_question(question: Question, max_words: int = 12) -> bool:
+    """Whether answering a question needs the large model.
+
+    Short factual questions never do, whatever their language, since their
+    English translation is checked. Others do when they are long, or when
+    they span several sub-questions or technical domains.
+    """
+    if is_short_factual(question.question, "en_US", max_words):
+        return False
+
+    sub_questions = {" ".join(_words(q)) for q in question.sub_questions}
+    return (
+        len(_words(question.question)) > max_words
+        or len(sub_questions) > 1
+        or len(question.technical_domains) > 1
+    )
+
+
+def _analysis_keys(analyses: list[LocalAnalysis]) -> str:
+    follow_up = any(analysis.previous_question for analysis in analyses)
+    keys = ["follow_up" if follow_up else "question", "sub_questions"]
+    if not all(analysis.language_confident for analysis in analyses):
+        keys.insert(1, "language_code")
+    return "\n".join(ANALYSIS_KEYS[key] for key in keys)
+
+
+def complete_analysis(
+    llm: BaseLLM,
+    original_question: str,
+    analysis: LocalAnalysis,
+    callbacks: list | None = None,
+) -> Question | None:
+    """Ask the LLM only for what the local analysis can not do.
+
+    That is the English translation and the sub-questions, plus the language
+    when the local detection is not confident. Returns None when the reply can
+    not be used. `callbacks` receive the token usage of the call.
+    """
+    prompt = ANALYSIS_PROMPT.format(
+        question=analysis.prompt_question(original_question),
+        keys=_analysis_keys([analysis]),
+    )
+    reply = with_schema(llm, AnalysisReply).call(prompt, callbacks=callbacks)
+    data, repaired = load_json(str(reply))
+    return _counted(_question_from_reply(data, analysis), repaired)
+
+
+def complete_analyses(
+    llm: BaseLLM,
+    requests: list[tuple[str, LocalAnalysis]],
+    callbacks: list | None = None,
+) -> list[Question | None]:
+    """`complete_analysis` for several questions with a single LLM call.
+
+    Each request is an original question and its local analysis. The result
+    of a question is None when the reply has nothing usable for it.
+    """
+    if len(requests) == 1:
+        return [complete_analysis(llm, *requests[0], callbacks=callbacks)]
+
+    prompt = BATCH_ANALYSIS_PROMPT.format(
+        questions="\n".join(
+            f"{number}. {analysis.prompt_question(question)}"
+            for number, (question, analysis) in enumerate(requests, start=1)
+        ),
+        keys=_analysis_keys([analysis for _, analysis in requests]),
+    )
+    reply = with_schema(llm, BatchAnalysisReply).call(prompt, callbacks=callbacks)
+    items, repaired = load_json(str(reply))
+    if isinstance(items, dict):
+        items = items.get("items")
+
+    by_number = {}
+    for position, item in enumerate(items if isinstance(items, list) else [], 1):
+        if isinstance(item, dict):
+            number = item.get("id", position)
+            by_number[int(number) if str(number).isdigit() else position] = item
+    return [
+        _counted(_question_from_reply(by_number.get(number), analysis), repaired)
+        for number, (_, analysis) in enumerate(requests, start=1)
+    ]
+
+
+def _counted(question: Question | None, repaired: bool) -> Question | None:
+    if question is None:
+        count_output(ANALYSIS_STAGE, "failed")
+    else:
+        count_output(ANALYSIS_STAGE, "repaired" if repaired else "parsed")
+    return question
+
+
+def _question_from_reply(data: dict | None, analysis: LocalAnalysis) -> Question | None:
+    """Complete the local analysis with the LLM reply, None when it is not usable."""
+    if not isinstance(data, dict) or not isinstance(data.get("question"), str):
+        return None
+
+    sub_questions = data.get("sub_questions") or []
+    if isinstance(sub_questions, str):
+        sub_questions = [sub_questions]
+    sub_questions = [q for q in sub_questions if isinstance(q, str)]
+    language_code = (
+        not analysis.language_confident and data.get("language_code")
+    ) or analysis.language_code
+    english = data["question"]
+
+    keywords = analysis.keywords
+    if not language_code.startswith("en") or not keywords:
+        # Non-English questions only got their lexicon terms, complete them
+        # with the words of the translation
+        keywords = list(dict.fromkeys(keywords + extract_keywords(english, "en_US")))[
+            :6
+        ]
+
+    return Question(
+        question=english,
+        language_code=language_code,
+        keywords=keywords,
+        technical_domains=classify_domains(keywords, tokenize(english)),
+        sub_questions=sub_questions[:3] or [english],
+    )
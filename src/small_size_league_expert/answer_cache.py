@@ -0,0 +1,267 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from small_size_league_expert.embeddings import Embedder, get_embedder
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.models import DiscordAnswer, Question
+from small_size_league_expert.settings import get_settings
+
+
+def same_language(first: str, second: str) -> bool:
+    """Compare language codes by their primary subtag (`pt_BR` matches `pt`)."""
+    return (
+        first.replace("-", "_").split("_")[0].lower()
+        == second.replace("-", "_").split("_")[0].lower()
+    )
+
+
+_DIVISION_PATTERN = re.compile(r"\bdivision\s+([ab])\b", re.IGNORECASE)
+_NUMBER_PATTERN = re.compile(r"\b\d+(?:[.,]\d+)?\b")
+
+
+def question_entities(question: Question) -> list[str]:
+    """The divisions and numbers a question is about.
+
+    Questions differing only in these read alike to an embedder, but do not
+    have the same answer.
+    """
+    entities = {
+        keyword.lower()
+        for keyword in question.keywords
+        if keyword.lower() in ("division a", "division b")
+    }
+    entities.update(
+        f"division {division.lower()}"
+        for division in _DIVISION_PATTERN.findall(question.question)
+    )
+    entities.update(
+        number.replace(",", ".")
+        for number in _NUMBER_PATTERN.findall(question.question)
+    )
+    return sorted(entities)
+
+
+class SemanticAnswerCache:
+    """A persistent cache of final answers, looked up by question similarity.
+
+    Entries are keyed on the embedding of the normalized English question
+    produced by the question analysis. A lookup returns the closest stored
+    answer above the similarity threshold, preferring one already written in
+    the asker's language, and only among the entries about the same divisions
+    and numbers (see `question_entities`). Entries expire after a TTL and the
+    least recently used ones are evicted once the cache is full.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedder: Embedder,
+        threshold: float = 0.92,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 1000,
+    ):
+        self.path = path
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                language_code TEXT NOT NULL,
+                entities TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(answers)")}
+        if "entities" not in columns:
+            # Entries stored without their entities can not be matched safely
+            self._db.execute(
+                "ALTER TABLE answers ADD COLUMN entities TEXT NOT NULL DEFAULT '[]'"
+            )
+            self._db.execute("DELETE FROM answers")
+        self._db.commit()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Load every stored embedding into an in-memory matrix."""
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        rows = self._db.execute(
+            "SELECT id, language_code, entities, embedding FROM answers ORDER BY id"
+        ).fetchall()
+
+        # Entries embedded by another embedder can not be compared anymore
+        width = self.embedder.dimension * np.dtype(np.float32).itemsize
+        stale = [(row[0],) for row in rows if len(row[3]) != width]
+        if stale:
+            self._db.executemany("DELETE FROM answers WHERE id = ?", stale)
+            self._db.commit()
+            rows = [row for row in rows if len(row[3]) == width]
+
+        self._ids = [row[0] for row in rows]
+        self._languages = [row[1] for row in rows]
+        self._entities = [row[2] for row in rows]
+        if rows:
+            self._matrix = np.vstack(
+                [np.frombuffer(row[3], dtype=np.float32) for row in rows]
+            )
+        else:
+            self._matrix = np.zeros((0, self.embedder.dimension), dtype=np.float32)
+
+    def _reload_if_changed(self) -> None:
+        """Reload the index when another process (a crew worker) changed the cache."""
+        if self._db.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._load_index()
+
+    def _expire(self, now: float) -> None:
+        cursor = self._db.execute(
+            "DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        if cursor.rowcount:
+            self._db.commit()
+            self._load_index()
+
+    def _embed(self, question: Question) -> np.ndarray:
+        return self.embedder.embed([question.question])[0].astype(np.float32)
+
+    def lookup(self, question: Question) -> DiscordAnswer | None:
+        """Find a stored answer for a question close enough to this one."""
+        embedding = self._embed(question)
+        entities = json.dumps(question_entities(question))
+
+        with self._lock:
+            now = time.time()
+            self._reload_if_changed()
+            self._expire(now)
+
+            if not self._ids:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ embedding
+            candidates = [
+                index
+                for index in np.flatnonzero(similarities >= self.threshold)
+                if self._entities[index] == entities
+            ]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            in_language = [
+                index
+                for index in candidates
+                if same_language(self._languages[index], question.language_code)
+            ]
+            pool = in_language or candidates
+            best = max(pool, key=lambda index: similarities[index])
+            entry_id = self._ids[best]
+
+            row = self._db.execute(
+                "SELECT answer FROM answers WHERE id = ?", (entry_id,)
+            ).fetchone()
+            self._db.execute(
+                "UPDATE answers SET accessed_at = ? WHERE id = ?", (now, entry_id)
+            )
+            self._db.commit()
+
+            self.hits += 1
+            log_event(
+                "answer_cache_hit",
+                question=question.question,
+                similarity=round(float(similarities[best]), 3),
+            )
+            return DiscordAnswer.model_validate_json(row[0])
+
+    def store(self, question: Question, answer: DiscordAnswer) -> None:
+        """Store the final answer of a question."""
+        embedding = self._embed(question)
+
+        with self._lock:
+            now = time.time()
+            self._db.execute(
+                """
+                INSERT INTO answers (
+                    question, language_code, entities, embedding, answer,
+                    created_at, accessed_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    question.question,
+                    question.language_code,
+                    json.dumps(question_entities(question)),
+                    embedding.tobytes(),
+                    answer.model_dump_json(),
+                    now,
+                    now,
+                ),
+            )
+            # Evict the least recently used entries once the cache is full
+            self._db.execute(
+                """
+                DELETE FROM answers WHERE id IN (
+                    SELECT id FROM answers ORDER BY accessed_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._db.commit()
+            self._load_index()
+
+    def clear(self) -> None:
+        """Remove every stored answer."""
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+            self._load_index()
+
+
+_answer_cache: SemanticAnswerCache | None = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache | None:
+    """Get the process-wide answer cache, or None when it is disabled.
+
+    It needs a real `EMBEDDING_MODEL`: the hashing embedder only sees shared
+    words, so it misses paraphrases and matches questions that differ in a
+    single word.
+    """
+    global _answer_cache
+
+    settings = get_settings()
+    if not settings.ANSWER_CACHE_ENABLED or not settings.EMBEDDING_MODEL:
+        return None
+
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                path=os.path.join(settings.CACHE_DIR, "answers.sqlite3"),
+                embedder=get_embedder(),
+                threshold=settings.ANSWER_CACHE_THRESHOLD,
+                ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+                max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            )
+        return _answer_cache
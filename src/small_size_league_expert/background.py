@@ -0,0 +1,33 @@
+import asyncio
+import threading
+from typing import Any, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Get the process-wide event loop that runs in a background thread.
+
+    Async clients bound to this loop (HTTP connection pools, for instance)
+    outlive a single crew run, unlike the ones created under `asyncio.run`.
+    """
+    global _loop
+
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="background-loop", daemon=True
+            ).start()
+        return _loop
+
+
+def run_in_background(
+    coroutine: Coroutine[Any, Any, T], timeout: float | None = None
+) -> T:
+    """Run a coroutine on the background loop and wait for its result."""
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_background_loop())
+    return future.result(timeout=timeout)
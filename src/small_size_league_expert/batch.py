@@ -0,0 +1,261 @@
+"""Answer many questions at once from the command line.
+
+Questions are read from a JSONL file or stdin, one per line: either an object
+with a `question` and an optional `id`, a JSON string, or plain text. They are
+answered concurrently by the same crew engine as the gateway (in-process crews
+or worker processes), and a JSON line is written as soon as each question is
+done:
+
+    {"id": ..., "question": ..., "answer": <DiscordAnswer>, "error": null, "seconds": ...}
+
+With `--resume`, the questions already answered in the output file are
+skipped, so a batch that crashed continues where it stopped:
+
+    python -m small_size_league_expert.batch faq.jsonl --output answers.jsonl --resume
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any
+
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.workers import CrewEngine
+
+
+def parse_question(line: str, number: int) -> dict[str, Any] | None:
+    """Read the id and the text of a question from an input line."""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        data = json.loads(line)
+    except ValueError:
+        data = line
+
+    if isinstance(data, dict):
+        text = str(data.get("question") or data.get("original_question") or "")
+        question_id = data.get("id", number)
+    else:
+        text, question_id = str(data), number
+    if not text.strip():
+        return None
+    return {"id": question_id, "question": text.strip()}
+
+
+def read_questions(lines: list[str]) -> list[dict[str, Any]]:
+    """The questions of the input lines, without repeated ids."""
+    questions: dict[str, dict[str, Any]] = {}
+    for number, line in enumerate(lines, start=1):
+        question = parse_question(line, number)
+        if question is not None:
+            questions.setdefault(json.dumps(question["id"]), question)
+    return list(questions.values())
+
+
+def answered_ids(path: Path) -> set[str]:
+    """Ids of the questions with an answer in an output file of a previous run."""
+    if not path.exists():
+        return set()
+
+    done = set()
+    with path.open(encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line of a crashed run can be incomplete
+                continue
+            if isinstance(record, dict) and record.get("answer") is not None:
+                done.add(json.dumps(record.get("id")))
+    return done
+
+
+def default_concurrency() -> int:
+    settings = get_settings()
+    return settings.SCHEDULER_MAX_CONCURRENCY or settings.CREW_POOL_SIZE * max(
+        settings.WORKER_PROCESSES, 1
+    )
+
+
+def build_engine(concurrency: int) -> CrewEngine:
+    """The crew engine of the batch, without the metrics server of the gateway."""
+    if get_settings().WORKER_PROCESSES > 0:
+        from small_size_league_expert.workers import WorkerFleet
+
+        return WorkerFleet()
+
+    from small_size_league_expert.crew_pool import CrewPool
+
+    return CrewPool(size=concurrency)
+
+
+async def answer_batch(
+    questions: list[dict[str, Any]],
+    output: IO[str],
+    concurrency: int,
+    engine: CrewEngine | None = None,
+) -> int:
+    """Answer the questions with `concurrency` crews at once, writing each
+    result to `output` as soon as it is done. Returns the number answered."""
+    engine = engine or build_engine(concurrency)
+    pending: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+    for question in questions:
+        pending.put_nowait(question)
+    answered = 0
+    finished = 0
+
+    async def worker() -> None:
+        nonlocal answered, finished
+        while not pending.empty():
+            question = pending.get_nowait()
+            inputs = {
+                "original_question": question["question"],
+                "current_date": datetime.now().isoformat(),
+            }
+            started = time.perf_counter()
+            answer, error = None, None
+            try:
+                answer = await engine.answer(inputs)
+                if answer is None:
+                    error = "No answer was found"
+            except Exception as e:
+                error = repr(e)
+
+            record = {
+                **question,
+                "answer": answer.model_dump() if answer else None,
+                "error": error,
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+            finished += 1
+            answered += answer is not None
+            status = "✅" if answer is not None else f"❌ {error}"
+            print(
+                f"{status} [{finished}/{len(questions)}] {question['question']}",
+                file=sys.stderr,
+            )
+
+    await engine.start()
+    try:
+        await asyncio.gather(
+            *(worker() for _ in range(max(1, min(concurrency, len(questions)))))
+        )
+    finally:
+        await engine.close()
+    return answered
+
+
+def open_output(path: str | None, resume: bool) -> IO[str]:
+    """The output of the answers.
+
+    On stdout, everything else printed by this process and its workers goes
+    to stderr, so the output only holds the JSON lines.
+    """
+    if path is None:
+        output = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        return output
+
+    file = Path(path)
+    if resume and file.exists() and file.stat().st_size:
+        # Finish the line a crash may have cut before appending
+        with file.open("rb") as existing:
+            existing.seek(-1, os.SEEK_END)
+            complete = existing.read(1) == b"\n"
+        output = file.open("a", encoding="utf-8")
+        if not complete:
+            output.write("\n")
+        return output
+    return file.open("w", encoding="utf-8")
+
+
+def run_batch(
+    source: str,
+    output_path: str | None = None,
+    concurrency: int | None = None,
+    resume: bool = False,
+) -> int:
+    """Answer the questions of a JSONL file, or stdin for "-". Returns the
+    number of questions without an answer."""
+    if resume and output_path is None:
+        raise ValueError("Resuming a batch needs an output file")
+
+    if source == "-":
+        lines = sys.stdin.readlines()
+    else:
+        lines = Path(source).read_text(encoding="utf-8").splitlines()
+    questions = read_questions(lines)
+
+    if resume:
+        done = answered_ids(Path(output_path))
+        questions = [q for q in questions if json.dumps(q["id"]) not in done]
+        print(
+            f"⏭️ Skipping {len(done)} questions answered by a previous run",
+            file=sys.stderr,
+        )
+    if not questions:
+        print("✅ Nothing to answer", file=sys.stderr)
+        return 0
+
+    concurrency = concurrency or default_concurrency()
+    print(
+        f"📦 Answering {len(questions)} questions, {concurrency} at a time",
+        file=sys.stderr,
+    )
+    with open_output(output_path, resume) as output:
+        answered = asyncio.run(answer_batch(questions, output, concurrency))
+    print(f"🏁 Answered {answered} of {len(questions)} questions", file=sys.stderr)
+    return len(questions) - answered
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--output",
+        help="JSONL file receiving the answers, stdout by default.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Questions answered at once, all the crews by default.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the questions already answered in the output file.",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Answer a batch of questions.")
+    parser.add_argument(
+        "questions",
+        nargs="?",
+        default="-",
+        help="JSONL file of questions, stdin by default.",
+    )
+    add_arguments(parser)
+    arguments = parser.parse_args()
+    if arguments.resume and not arguments.output:
+        parser.error("--resume needs an --output file")
+
+    unanswered = run_batch(
+        arguments.questions,
+        arguments.output,
+        arguments.concurrency,
+        arguments.resume,
+    )
+    sys.exit(1 if unanswered else 0)
+
+
+if __name__ == "__main__":
+    main()
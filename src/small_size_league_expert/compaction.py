@@ -0,0 +1,252 @@
+"""Compaction of the retrieved passages before an LLM reads them.
+
+Overlapping rule excerpts and long Wikipedia extracts make up most of the
+prompts of the ranking and answer generation stages. The compactor:
+
+- merges near-duplicate passages, found by how many of the word shingles of
+  the smaller one the other contains, keeping the references of both,
+- trims each passage to the sentences that best match the question and its
+  sub-questions, in their original order,
+- keeps the passages within the token budget of the next stage, best first.
+
+Tokens are estimated from the length of the text, about 4 characters each.
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+from small_size_league_expert.embeddings import tokenize
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.models import (
+    Answer,
+    Question,
+    RankedAnswer,
+    RankResult,
+    RetrieverResult,
+)
+from small_size_league_expert.ranking import bm25_scores
+from small_size_league_expert.settings import get_settings
+
+CHARS_PER_TOKEN = 4
+# Joins two sentences that were not next to each other in the passage
+ELLIPSIS = " … "
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=\S)|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens of a text."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split a passage into sentences and list items."""
+    return [
+        sentence.strip() for sentence in _SENTENCE_BREAK.split(text) if sentence.strip()
+    ]
+
+
+def shingles(text: str, size: int = 5) -> set[int]:
+    """Hashes of the runs of `size` consecutive words of a text."""
+    words = tokenize(text, keep_stopwords=True)
+    runs = [words[i : i + size] for i in range(max(len(words) - size + 1, 1))]
+    return {zlib.crc32(" ".join(run).encode()) for run in runs if run}
+
+
+def containment(first: set[int], second: set[int]) -> float:
+    """Share of the shingles of the smaller set found in the other one."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / min(len(first), len(second))
+
+
+class PassageCompactor:
+    """Deduplicates, trims and budgets the passages handed to the next stage."""
+
+    def __init__(
+        self,
+        duplicate_threshold: float = 0.7,
+        max_sentences: int = 8,
+        ranking_tokens: int = 3000,
+        answer_tokens: int = 2000,
+        shingle_size: int = 5,
+    ):
+        self.duplicate_threshold = duplicate_threshold
+        self.max_sentences = max_sentences
+        self.ranking_tokens = ranking_tokens
+        self.answer_tokens = answer_tokens
+        self.shingle_size = shingle_size
+
+    def deduplicate(self, answers: list[Answer]) -> list[Answer]:
+        """Merge near-duplicates into the longer passage, keeping every reference."""
+        kept: list[tuple[Answer, set[int]]] = []
+        for answer in answers:
+            answer_shingles = shingles(answer.answer, self.shingle_size)
+            duplicate = next(
+                (
+                    index
+                    for index, (_, kept_shingles) in enumerate(kept)
+                    if containment(answer_shingles, kept_shingles)
+                    >= self.duplicate_threshold
+                ),
+                None,
+            )
+            if duplicate is None:
+                kept.append(
+                    (
+                        answer.model_copy(
+                            update={"references": list(answer.references)}
+                        ),
+                        answer_shingles,
+                    )
+                )
+                continue
+
+            original, original_shingles = kept[duplicate]
+            references = list(dict.fromkeys([*original.references, *answer.references]))
+            if len(answer_shingles) > len(original_shingles):
+                # The longer passage covers the other one, it takes its place
+                kept[duplicate] = (
+                    answer.model_copy(update={"references": references}),
+                    answer_shingles,
+                )
+            else:
+                original.references = references
+        return [answer for answer, _ in kept]
+
+    def compact(
+        self,
+        question: Question,
+        answers: list[Answer],
+        max_tokens: int,
+        by_relevance: bool = True,
+    ) -> list[Answer]:
+        """Deduplicate and trim the passages, then fit them in the token budget.
+
+        The budget goes to the most relevant passages first, or to the first
+        ones when `by_relevance` is False. The passages keep their order.
+        """
+        before = sum(estimate_tokens(answer.answer) for answer in answers)
+        answers = self.deduplicate(answers)
+        if not answers:
+            return []
+
+        queries = list(dict.fromkeys([question.question, *question.sub_questions]))
+        if question.keywords:
+            queries.append(" ".join(question.keywords))
+
+        sentences = [
+            split_sentences(answer.answer) or [answer.answer] for answer in answers
+        ]
+        flat = [sentence for passage in sentences for sentence in passage]
+        scores = bm25_scores(
+            [tokenize(query) for query in queries], [tokenize(s) for s in flat]
+        )
+        best = scores.max(axis=1, keepdims=True)
+        best[best == 0] = 1.0
+        relevance = (scores / best).max(axis=0)
+
+        # The best sentences of each passage, most relevant first; passages
+        # without any matching sentence keep their first one
+        candidates: list[list[int]] = []
+        passage_scores = []
+        start = 0
+        for passage in sentences:
+            passage_relevance = relevance[start : start + len(passage)]
+            ranked = [
+                int(index)
+                for index in np.argsort(-passage_relevance, kind="stable")
+                if passage_relevance[index] > 0
+            ][: self.max_sentences]
+            candidates.append(ranked or [0])
+            passage_scores.append(float(passage_relevance.max()))
+            start += len(passage)
+
+        order = (
+            sorted(range(len(answers)), key=lambda i: -passage_scores[i])
+            if by_relevance
+            else range(len(answers))
+        )
+        budget = max_tokens
+        texts: dict[int, str] = {}
+        for index in order:
+            chosen = list(candidates[index])
+            text = self._join(sentences[index], chosen)
+            while len(chosen) > 1 and estimate_tokens(text) > budget:
+                chosen.pop()
+                text = self._join(sentences[index], chosen)
+            if estimate_tokens(text) > budget:
+                if texts:
+                    continue
+                # Even the best sentence is over budget, cut it at a word
+                text = text[: budget * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + "…"
+            texts[index] = text
+            budget -= estimate_tokens(text)
+            if budget <= 0:
+                break
+
+        compacted = [
+            answers[index].model_copy(update={"answer": texts[index]})
+            for index in sorted(texts)
+        ]
+        after = sum(estimate_tokens(answer.answer) for answer in compacted)
+        log_event(
+            "passages_compacted",
+            passages=len(answers),
+            compacted=len(compacted),
+            tokens_before=before,
+            tokens_after=after,
+        )
+        return compacted
+
+    @staticmethod
+    def _join(passage: list[str], chosen: list[int]) -> str:
+        text = ""
+        previous = None
+        for index in sorted(chosen):
+            if previous is not None:
+                text += " " if index == previous + 1 else ELLIPSIS
+            elif index > 0:
+                text += "… "
+            text += passage[index]
+            previous = index
+        return text
+
+    def compact_retrieval(
+        self, question: Question, result: RetrieverResult
+    ) -> RetrieverResult:
+        """Compact the retrieved passages within the budget of the ranking stage."""
+        return RetrieverResult(
+            results=self.compact(question, result.results, self.ranking_tokens)
+        )
+
+    def compact_ranking(self, result: RankResult) -> RankResult:
+        """Compact the ranked passages within the budget of the answer generation."""
+        answers = self.compact(
+            result, result.ranked_answers, self.answer_tokens, by_relevance=False
+        )
+        return result.model_copy(
+            update={
+                "ranked_answers": [
+                    RankedAnswer(
+                        answer=answer.answer, references=answer.references, rank=rank
+                    )
+                    for rank, answer in enumerate(answers, start=1)
+                ]
+            }
+        )
+
+
+def get_passage_compactor() -> PassageCompactor | None:
+    """Build the compactor configured by the settings, None when it is disabled."""
+    settings = get_settings()
+    if not settings.COMPACTION_ENABLED:
+        return None
+    return PassageCompactor(
+        duplicate_threshold=settings.COMPACTION_DUPLICATE_THRESHOLD,
+        max_sentences=settings.COMPACTION_MAX_SENTENCES,
+        ranking_tokens=settings.COMPACTION_RANKING_TOKENS,
+        answer_tokens=settings.COMPACTION_ANSWER_TOKENS,
+    )
@@ -0,0 +1,427 @@
+"""Offline index of the SSL rulebook, website pages and team description papers.
+
+Documents are split into chunks that are indexed twice: in a BM25 inverted
+index and in an embedding matrix memory-mapped from disk. Searching them takes
+milliseconds and does not depend on the MCP server.
+
+Build or update the index with:
+
+    python -m small_size_league_expert.corpus ingest --source rules path/to/ssl-rules
+    python -m small_size_league_expert.corpus ingest --source tdp path/to/tdps
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+from small_size_league_expert.embeddings import (
+    Embedder,
+    embedder_id,
+    get_embedder,
+    tokenize,
+)
+from small_size_league_expert.models import Answer
+from small_size_league_expert.settings import get_settings
+
+# The retrieval sources the corpus can hold, named as in `retrieval`
+CORPUS_SOURCES = ("rules", "website", "tdp")
+SUPPORTED_SUFFIXES = {".txt", ".md", ".adoc", ".html", ".htm", ".pdf"}
+
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.json"
+POSTINGS_FILE = "postings.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+_HEADING = re.compile(
+    r"^(?:#{1,6}\s+|={1,6}\s+|\d+(?:\.\d+)*\.?\s+(?=[A-Z]))(?P<title>\S.{0,100})$",
+    re.MULTILINE,
+)
+_HTML_BLOCK = re.compile(r"<(script|style)[^>]*>.*?</\1>", re.DOTALL | re.IGNORECASE)
+_HTML_HEADING = re.compile(r"<h[1-6][^>]*>(.*?)</h[1-6]>", re.DOTALL | re.IGNORECASE)
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+
+@dataclass
+class Chunk:
+    document: str
+    source: str
+    title: str
+    text: str
+    reference: str
+
+    def to_answer(self) -> Answer:
+        text = f"{self.title}\n{self.text}" if self.title else self.text
+        return Answer(answer=text, references=[self.reference])
+
+
+def read_document(path: Path) -> str:
+    """Read the plain text of a rulebook, web page or paper."""
+    if path.suffix.lower() == ".pdf":
+        import pdfplumber
+
+        with pdfplumber.open(path) as pdf:
+            return "\n\n".join(page.extract_text() or "" for page in pdf.pages)
+
+    text = path.read_text(encoding="utf-8", errors="ignore")
+    if path.suffix.lower() in (".html", ".htm"):
+        text = _HTML_BLOCK.sub("", text)
+        text = _HTML_HEADING.sub(lambda match: f"\n# {match.group(1)}\n", text)
+        text = _HTML_TAG.sub(" ", text)
+    return text
+
+
+def chunk_document(
+    text: str, max_words: int = 180, overlap: int = 30
+) -> list[tuple[str, str]]:
+    """Split a document into (section title, text) chunks.
+
+    The text is first split at its headings, then each section is cut into
+    overlapping windows of at most `max_words` words.
+    """
+    matches = list(_HEADING.finditer(text))
+    sections = [("", text[: matches[0].start()] if matches else text)]
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        sections.append((match.group("title").strip(" =#"), text[match.end() : end]))
+
+    chunks = []
+    step = max(max_words - overlap, 1)
+    for title, body in sections:
+        words = body.split()
+        for start in range(0, len(words), step):
+            chunks.append((title, " ".join(words[start : start + max_words])))
+            if start + max_words >= len(words):
+                break
+    return chunks
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CorpusIndex:
+    """The on-disk index of the SSL corpus.
+
+    Ingesting is incremental: documents whose content did not change keep
+    their chunks and embeddings, and documents removed from disk are dropped.
+    Searches reload the index when another process updated it, and rank with
+    BM25 alone while its embeddings come from another embedder than the
+    configured one, until the next ingest embeds them again.
+    """
+
+    def __init__(self, directory: str, embedder: Embedder, lexical_weight: float = 0.5):
+        self.directory = Path(directory)
+        self.embedder = embedder
+        self.lexical_weight = lexical_weight
+
+        self._lock = threading.Lock()
+        self._loaded_at: float | None = None
+        self.manifest: dict = {"embedder": embedder_id(embedder), "documents": {}}
+        self.chunks: list[Chunk] = []
+        self._postings: dict[str, list[list[int]]] = {}
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._embeddings = np.zeros((0, embedder.dimension), dtype=np.float32)
+
+    @property
+    def exists(self) -> bool:
+        return (self.directory / MANIFEST_FILE).exists()
+
+    def sources(self) -> set[str]:
+        self._refresh()
+        return {document["source"] for document in self.manifest["documents"].values()}
+
+    def _refresh(self) -> None:
+        """Load the index from disk when it changed since the last load."""
+        manifest_path = self.directory / MANIFEST_FILE
+        if not manifest_path.exists():
+            return
+
+        modified_at = manifest_path.stat().st_mtime
+        with self._lock:
+            if modified_at == self._loaded_at:
+                return
+
+            self.manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            chunks = json.loads(
+                (self.directory / CHUNKS_FILE).read_text(encoding="utf-8")
+            )
+            self.chunks = [Chunk(**chunk) for chunk in chunks]
+            postings = json.loads(
+                (self.directory / POSTINGS_FILE).read_text(encoding="utf-8")
+            )
+            self._postings = postings["postings"]
+            self._lengths = np.asarray(postings["lengths"], dtype=np.float32)
+            if self.chunks:
+                self._embeddings = np.load(
+                    self.directory / EMBEDDINGS_FILE, mmap_mode="r"
+                )
+            else:
+                self._embeddings = np.zeros(
+                    (0, self.embedder.dimension), dtype=np.float32
+                )
+            self._loaded_at = modified_at
+
+            if self.chunks and not self._same_embedder():
+                print(
+                    f"⚠️ The corpus index was embedded with "
+                    f"{self.manifest.get('embedder')}, not "
+                    f"{embedder_id(self.embedder)}: searching it with BM25 only "
+                    f"until the next ingest"
+                )
+
+    def _same_embedder(self) -> bool:
+        """Whether the stored embeddings come from the configured embedder."""
+        return self.manifest.get("embedder") == embedder_id(self.embedder)
+
+    def ingest(
+        self, paths: list[str], source: str, reference: str | None = None
+    ) -> tuple[int, int, int]:
+        """Add or update the documents under the given paths.
+
+        Returns how many documents were added or changed, kept and removed.
+        """
+        self._refresh()
+
+        files = []
+        for path in map(Path, paths):
+            candidates = sorted(path.rglob("*")) if path.is_dir() else [path]
+            files += [
+                f
+                for f in candidates
+                if f.is_file() and f.suffix.lower() in SUPPORTED_SUFFIXES
+            ]
+
+        # Embeddings of another embedder can not be reused, the chunks of the
+        # unchanged documents are embedded again
+        reusable = self._same_embedder()
+
+        documents = {
+            key: document
+            for key, document in self.manifest["documents"].items()
+            if Path(document["path"]).exists()
+        }
+        removed = len(self.manifest["documents"]) - len(documents)
+
+        changed = {}
+        for file in files:
+            key = str(file.resolve())
+            digest = _file_digest(file)
+            previous = documents.get(key)
+            if (
+                previous
+                and previous["sha256"] == digest
+                and previous["source"] == source
+            ):
+                continue
+            documents[key] = {
+                "path": key,
+                "source": source,
+                "reference": reference or f"corpus://{source}/{file.name}",
+                "sha256": digest,
+            }
+            changed[key] = file
+
+        settings = get_settings()
+        chunks: list[Chunk] = []
+        rows: list[np.ndarray] = []
+        pending: list[Chunk] = []
+        for key, document in documents.items():
+            start = len(chunks)
+            if key in changed:
+                text = read_document(changed[key])
+                new_chunks = [
+                    Chunk(key, document["source"], title, body, document["reference"])
+                    for title, body in chunk_document(
+                        text, settings.CORPUS_CHUNK_WORDS, settings.CORPUS_CHUNK_OVERLAP
+                    )
+                ]
+                chunks += new_chunks
+                pending += new_chunks
+                rows.append(np.empty((0, self.embedder.dimension), dtype=np.float32))
+            else:
+                old_start, old_end = document["chunks"]
+                chunks += self.chunks[old_start:old_end]
+                if reusable:
+                    rows.append(np.asarray(self._embeddings[old_start:old_end]))
+                else:
+                    pending += self.chunks[old_start:old_end]
+                    rows.append(
+                        np.empty((0, self.embedder.dimension), dtype=np.float32)
+                    )
+            document["chunks"] = [start, len(chunks)]
+
+        # Embed the pending chunks in batches, then put every row at its place
+        embedded = [
+            self.embedder.embed([f"{c.title}\n{c.text}" for c in pending[i : i + 64]])
+            for i in range(0, len(pending), 64)
+        ]
+        new_rows = iter(np.vstack(embedded) if embedded else [])
+        embeddings = np.zeros((len(chunks), self.embedder.dimension), dtype=np.float32)
+        for (key, document), old_rows in zip(documents.items(), rows):
+            start, end = document["chunks"]
+            if key in changed or not reusable:
+                for row in range(start, end):
+                    embeddings[row] = next(new_rows)
+            else:
+                embeddings[start:end] = old_rows
+
+        self._write(documents, chunks, embeddings)
+        self._loaded_at = None
+        self._refresh()
+        return len(changed), len(documents) - len(changed), removed
+
+    def _write(
+        self, documents: dict, chunks: list[Chunk], embeddings: np.ndarray
+    ) -> None:
+        postings: dict[str, list[list[int]]] = {}
+        lengths = []
+        for index, chunk in enumerate(chunks):
+            tokens = tokenize(f"{chunk.title} {chunk.text}")
+            lengths.append(len(tokens))
+            for term, count in _counts(tokens).items():
+                postings.setdefault(term, []).append([index, count])
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        def replace(name: str, write) -> None:
+            # Write next to the target and swap it in, so readers never see a
+            # partially written file
+            temporary = self.directory / f".{name}.tmp"
+            with temporary.open("wb") as file:
+                write(file)
+            os.replace(temporary, self.directory / name)
+
+        replace(EMBEDDINGS_FILE, lambda file: np.save(file, embeddings))
+        replace(
+            CHUNKS_FILE,
+            lambda file: file.write(json.dumps([asdict(c) for c in chunks]).encode()),
+        )
+        replace(
+            POSTINGS_FILE,
+            lambda file: file.write(
+                json.dumps({"lengths": lengths, "postings": postings}).encode()
+            ),
+        )
+        # The manifest goes last, its change is what makes readers reload
+        manifest = {"embedder": embedder_id(self.embedder), "documents": documents}
+        replace(MANIFEST_FILE, lambda file: file.write(json.dumps(manifest).encode()))
+
+    def _bm25(self, tokens: list[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        if not len(self._lengths):
+            return scores
+
+        average_length = max(float(self._lengths.mean()), 1.0)
+        for term in set(tokens):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            rows, counts = np.asarray(postings, dtype=np.int64).T
+            idf = np.log1p((len(self.chunks) - len(rows) + 0.5) / (len(rows) + 0.5))
+            counts = counts.astype(np.float32)
+            norms = k1 * (1 - b + b * self._lengths[rows] / average_length)
+            np.add.at(scores, rows, idf * counts * (k1 + 1) / (counts + norms))
+        return scores
+
+    def search(
+        self, query: str, top_k: int = 5, sources: list[str] | None = None
+    ) -> list[Chunk]:
+        """Find the chunks that best match a query, optionally within some sources."""
+        self._refresh()
+        if not self.chunks:
+            return []
+
+        lexical = self._bm25(tokenize(query))
+        if lexical.max() > 0:
+            lexical /= lexical.max()
+        if self._same_embedder():
+            semantic = np.asarray(self._embeddings @ self.embedder.embed([query])[0])
+            scores = (
+                self.lexical_weight * lexical + (1 - self.lexical_weight) * semantic
+            )
+        else:
+            # Vectors of another embedder can not be compared with the query's
+            scores = lexical
+
+        if sources:
+            allowed = np.array([chunk.source in sources for chunk in self.chunks])
+            scores = np.where(allowed, scores, -np.inf)
+
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            self.chunks[i] for i in best if np.isfinite(scores[i]) and scores[i] > 0
+        ]
+
+
+def _counts(tokens: list[str]) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+_corpus_index: CorpusIndex | None = None
+_corpus_index_lock = threading.Lock()
+
+
+def get_corpus_index() -> CorpusIndex:
+    """Get the process-wide corpus index, stored under `Settings.CACHE_DIR`."""
+    global _corpus_index
+
+    with _corpus_index_lock:
+        if _corpus_index is None:
+            settings = get_settings()
+            _corpus_index = CorpusIndex(
+                directory=os.path.join(settings.CACHE_DIR, "corpus"),
+                embedder=get_embedder(),
+                lexical_weight=settings.RANKING_LEXICAL_WEIGHT,
+            )
+        return _corpus_index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the offline SSL corpus index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Add or update documents in the index.")
+    ingest.add_argument("paths", nargs="+", help="Files or directories to ingest.")
+    ingest.add_argument("--source", choices=CORPUS_SOURCES, required=True)
+    ingest.add_argument(
+        "--reference", help="URL cited for these documents, e.g. the online rulebook."
+    )
+
+    search = commands.add_parser("search", help="Search the index.")
+    search.add_argument("query")
+    search.add_argument("--top-k", type=int, default=5)
+
+    arguments = parser.parse_args()
+    index = get_corpus_index()
+
+    if arguments.command == "ingest":
+        changed, kept, removed = index.ingest(
+            arguments.paths, arguments.source, arguments.reference
+        )
+        print(
+            f"📦 Corpus index updated: {changed} documents ingested, "
+            f"{kept} unchanged, {removed} removed ({len(index.chunks)} chunks)"
+        )
+    else:
+        for chunk in index.search(arguments.query, arguments.top_k):
+            print(f"[{chunk.source}] {chunk.title} ({chunk.reference})\n{chunk.text}\n")
+
+
+if __name__ == "__main__":
+    main()
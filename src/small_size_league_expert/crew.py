@@ -1,23 +1,82 @@
+from contextlib import nullcontext
+from typing import Callable
+
 from crewai import LLM, Agent, Crew, Process, Task
-from crewai.knowledge.source.text_file_knowledge_source import TextFileKnowledgeSource
-from crewai.project import CrewBase, agent, crew, task
+from crewai.agents.agent_builder.utilities.base_token_process import TokenProcess
+from crewai.knowledge.knowledge_config import KnowledgeConfig
+from crewai.knowledge.utils.knowledge_utils import extract_knowledge_context
+from crewai.project import CrewBase, agent, before_kickoff, crew, task
+from crewai.tasks.task_output import TaskOutput
 from crewai.tools import BaseTool
-from crewai_tools import MCPServerAdapter
+from crewai.utilities.token_counter_callback import TokenCalcHandler
 
+from small_size_league_expert.analysis import (
+    analyze_question,
+    complete_analyses,
+    complete_analysis,
+)
+from small_size_league_expert.answer_cache import get_answer_cache, same_language
+from small_size_league_expert.compaction import get_passage_compactor
+from small_size_league_expert.corpus import get_corpus_index
+from small_size_league_expert.deadline import (
+    BUDGET_SPENT_MESSAGE,
+    answer_reserve,
+    current_deadline,
+    partial_markdown,
+)
+from small_size_league_expert.knowledge import get_knowledge
+from small_size_league_expert.mcp_pool import get_mcp_pool
+from small_size_league_expert.metrics import (
+    DEADLINE_FALLBACKS,
+    REGISTRY,
+    StageMetrics,
+    log_event,
+)
+from small_size_league_expert.microbatch import (
+    MicroBatcher,
+    get_micro_batcher,
+    split_shares,
+)
 from small_size_league_expert.models import (
+    Answer,
     DiscordAnswer,
     Question,
     RankResult,
     RetrieverResult,
 )
-from small_size_league_expert.settings import Settings
-
-from .tools import WikipediaSearchTool
+from small_size_league_expert.ranking import get_local_ranker, rank_with_llm
+from small_size_league_expert.retrieval import (
+    SpeculativeRetrieval,
+    answer_from_text,
+    build_retrieval_fanout,
+    merge_answers,
+)
+from small_size_league_expert.routing import (
+    LARGE_TIER,
+    agent_tier,
+    build_llm,
+    tier_for_question,
+)
+from small_size_league_expert.sessions import (
+    SESSION_INPUT,
+    SessionContext,
+    get_session_store,
+    is_follow_up,
+)
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.stages import StageTask
+from small_size_league_expert.streaming import AnswerStream
+from small_size_league_expert.tool_cache import cache_tool
 
-# Create a text file knowledge source
-text_source = TextFileKnowledgeSource(file_paths=["content_description.txt"])
+from .tools import SSLCorpusSearchTool, WikipediaSearchTool
 
-settings = Settings()
+# The counters of a TokenProcess split across the requests of a batched call
+_USAGE_FIELDS = (
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_prompt_tokens",
+    "successful_requests",
+)
 
 
 @CrewBase
@@ -32,56 +91,61 @@ class SmallSizeLeagueExpert:
 
     # If you would like to add tools to your agents, you can learn more about it here:
     # https://docs.crewai.com/concepts/agents#agent-tools
+    # MCP tools come from the process-wide connection pool shared by all crews.
     mcp_tools: list[BaseTool] = []
-    mcp_adapter: MCPServerAdapter = None
-
-    mcp_server_params = [
-        {
-            "url": settings.MCP_ENDPOINT,
-            "transport": settings.MCP_TRANSPORT_TYPE,
-        }
-    ]
 
     def __init__(self):
         """Initialize with choice of LLM provider."""
-        self.settings = Settings()
+        self.settings = get_settings()
+        self._cached_answer: DiscordAnswer | None = None
+        self._answered_from_cache = False
+        # Whether a stage handed over a degraded output to meet the deadline
+        self._degraded = False
+        self._inputs: dict = {}
+        self._speculation: SpeculativeRetrieval | None = None
+        # The session of a follow-up, and the terms its previous question lacks
+        self._session: SessionContext | None = None
+        self._follow_up_terms: list[str] = []
+        # The passages retrieved before compaction, kept for the session
+        self._retrieved: RetrieverResult | None = None
+        # The "auto" tier of the answer generator is resolved for each question
+        self._answer_generator_tier = agent_tier("answer_generator", self.settings)
+        # Set by the caller to receive the final answer while it is generated
+        self.stream: AnswerStream | None = None
 
-    def get_llm(self):
-        """Get the appropriate LLM based on the configuration."""
-        return LLM(
-            model=self.settings.MODEL,
-            temperature=0,  # Using this to not hallucinate inside the SSL content
-        )
+    def get_llm(self, stream: bool = False, tier: str = LARGE_TIER) -> LLM:
+        """Get the LLM of a model tier, see `routing`."""
+        return build_llm(tier, stream=stream, settings=self.settings)
 
     @agent
     def question_handler(self) -> Agent:
         """Create the language detector and decomposer agent."""
         return Agent(
             config=self.agents_config["question_handler"],
-            llm=self.get_llm(),
-            verbose=True,
+            llm=self.get_llm(tier=agent_tier("question_handler", self.settings)),
+            verbose=self.settings.CREW_VERBOSE,
         )
 
     @agent
     def retriever(self) -> Agent:
         tools = [WikipediaSearchTool()]
-        print(
-            f"Default tools for retriever agent: {''.join([f'\n- {tool.name}' for tool in tools])}"
-        )
-
-        self.mcp_tools = self.get_mcp_tools()
-
-        if self.mcp_tools and len(self.mcp_tools) > 0:
-            print("🔌 Adding MCP tools to retriever agent.")
-            print(
-                f"Available MCP tools: {''.join([f'\n- {tool.name}' for tool in self.mcp_tools])}"
+        if get_corpus_index().exists:
+            tools.insert(
+                0,
+                cache_tool(
+                    SSLCorpusSearchTool(),
+                    keep=lambda result: result != BUDGET_SPENT_MESSAGE,
+                ),
             )
+        self.mcp_tools = get_mcp_pool().get_tools()
+        if self.mcp_tools:
             tools += self.mcp_tools
+        log_event("retriever_tools", tools=[tool.name for tool in tools])
 
         return Agent(
             config=self.agents_config["retriever"],
-            llm=self.get_llm(),
-            verbose=True,
+            llm=self.get_llm(tier=agent_tier("retriever", self.settings)),
+            verbose=self.settings.CREW_VERBOSE,
             tools=tools,
             max_iter=15,
         )
@@ -91,8 +155,8 @@ class SmallSizeLeagueExpert:
         """Create the ranker agent."""
         return Agent(
             config=self.agents_config["ranker"],
-            llm=self.get_llm(),
-            verbose=True,
+            llm=self.get_llm(tier=agent_tier("ranker", self.settings)),
+            verbose=self.settings.CREW_VERBOSE,
         )
 
     @agent
@@ -100,43 +164,665 @@ class SmallSizeLeagueExpert:
         """Create the answer generator agent."""
         return Agent(
             config=self.agents_config["answer_generator"],
-            llm=self.get_llm(),
-            verbose=True,
-            knowledge_sources=[text_source],
+            llm=self.get_llm(tier=agent_tier("answer_generator", self.settings)),
+            verbose=self.settings.CREW_VERBOSE,
+            # Shared by every crew and embedded once, see `knowledge`
+            knowledge=get_knowledge(),
+            knowledge_config=KnowledgeConfig(
+                results_limit=self.settings.KNOWLEDGE_TOP_K,
+                score_threshold=self.settings.KNOWLEDGE_MIN_SCORE,
+            ),
         )
 
     @task
     def question_analysis_task(self) -> Task:
         """Detect language and decompose the question."""
-        return Task(
+        return StageTask(
             config=self.tasks_config["question_analysis_task"],
             output_pydantic=Question,
+            local_runner=self._analyze_locally,
+            known_fields=self._known_fields,
         )
 
     @task
     def retrieval_task(self) -> Task:
         """Retrieve relevant content."""
-        return Task(
+        return StageTask(
             config=self.tasks_config["retrieval_task"],
             output_pydantic=RetrieverResult,
+            local_runner=self._retrieve_locally,
+            post_processor=self._compact_retrieval,
+            fallback=self._partial_retrieval,
         )
 
     @task
     def ranking_task(self) -> Task:
         """Rank and filter the content."""
-        return Task(
+        return StageTask(
             config=self.tasks_config["ranking_task"],
             output_pydantic=RankResult,
+            local_runner=self._rank_locally,
+            post_processor=self._compact_ranking,
+            fallback=self._rank_out_of_time,
+            known_fields=self._known_fields,
         )
 
     @task
     def answer_generation_task(self) -> Task:
         """Generate the final answer in Markdown for Discord."""
-        return Task(
+        return StageTask(
             config=self.tasks_config["answer_generation_task"],
             output_pydantic=DiscordAnswer,
+            local_runner=self._generate_answer_locally,
+            callback=self._store_answer,
+            fallback=self._partial_answer,
+            known_fields=self._known_fields,
+        )
+
+    @before_kickoff
+    def prepare_run(self, inputs):
+        """Clear the state left by the previous question."""
+        self._cached_answer = None
+        self._answered_from_cache = False
+        self._degraded = False
+        self._inputs = inputs or {}
+        self._session = None
+        self._follow_up_terms = []
+        self._retrieved = None
+        self._take_speculation()
+        return inputs
+
+    def _analyze_locally(self) -> Question | None:
+        """Analyze the question without the question handler agent.
+
+        Language, keywords and domains are found locally. Short factual English
+        questions need nothing else, the others get their translation and
+        sub-questions from a single compact LLM call.
+        """
+        text = str(self._inputs.get("original_question", "")).strip()
+        if not text:
+            return None
+
+        previous = self._previous_question(text)
+        analysis = analyze_question(
+            text, self.settings.ANALYSIS_SHORT_QUESTION_WORDS, previous
+        )
+        if previous is not None:
+            # Stored passages must mention what the follow-up adds
+            self._follow_up_terms = [
+                keyword
+                for keyword in analysis.keywords
+                if keyword not in previous.keywords
+            ]
+        if self._out_of_time("question_analysis_task"):
+            return analysis.to_question(text)
+        if self.settings.ANALYSIS_MODE != "local":
+            self._speculate(analysis.to_question(text))
+            return None
+        if analysis.short_factual:
+            log_event("question_analyzed", question=text, mode="local")
+            return analysis.to_question(text)
+
+        self._speculate(analysis.to_question(text))
+        try:
+            handler = self.question_handler()
+            batcher = get_micro_batcher()
+            question = None
+            if batcher is not None:
+                # Sent with the analyses of the other crews of the process
+                question = self._submit_batched(
+                    batcher,
+                    ("analysis", handler.llm.model),
+                    (text, analysis),
+                    len(text),
+                    lambda requests, callbacks: complete_analyses(
+                        handler.llm, requests, callbacks=callbacks
+                    ),
+                    handler,
+                )
+            if question is None:
+                question = complete_analysis(
+                    handler.llm,
+                    text,
+                    analysis,
+                    callbacks=[TokenCalcHandler(handler._token_process)],
+                )
+        except Exception as e:
+            log_event("analysis_failed", sample_rate=1.0, error=repr(e))
+            return None
+
+        if question is not None:
+            log_event("question_analyzed", question=text, mode="compact")
+        return question
+
+    def _previous_question(self, text: str) -> Question | None:
+        """The question a follow-up leans on, from the session of its channel."""
+        session_store = get_session_store()
+        session_id = self._inputs.get(SESSION_INPUT)
+        if (
+            session_store is None
+            or not session_id
+            or not is_follow_up(text, self.settings.SESSION_FOLLOW_UP_WORDS)
+        ):
+            return None
+
+        self._session = session_store.load(str(session_id))
+        if self._session is None:
+            return None
+        log_event("follow_up", question=text, previous=self._session.question.question)
+        return self._session.question
+
+    def _analyzed_question(self) -> Question | None:
+        output = self.question_analysis_task().output
+        return output.pydantic if output else None
+
+    def _known_fields(self) -> dict:
+        """What the previous stages know of the output of the current one, to
+        repair an agent output that lacks it."""
+        question = self._analyzed_question()
+        if question is None:
+            text = str(self._inputs.get("original_question", "")).strip()
+            if not text:
+                return {}
+            analysis = analyze_question(
+                text, self.settings.ANALYSIS_SHORT_QUESTION_WORDS
+            )
+            return analysis.to_question(text).model_dump()
+
+        fields = question.model_dump()
+        output = self.ranking_task().output
+        if output is not None and isinstance(output.pydantic, RankResult):
+            fields["ranked_answers"] = [
+                ranked.model_dump() for ranked in output.pydantic.ranked_answers
+            ]
+        return fields
+
+    def _out_of_time(self, stage: str, reserve: float | None = None) -> bool:
+        """Whether the time budget of a stage is spent, so it must hand over
+        what it has. Stages before the answer generation keep its reserve."""
+        deadline = current_deadline()
+        reserve = answer_reserve() if reserve is None else reserve
+        if deadline is None or not deadline.spent(reserve):
+            return False
+
+        log_event("deadline_fallback", stage=stage)
+        REGISTRY.inc(DEADLINE_FALLBACKS, stage=stage)
+        self._degraded = True
+        return True
+
+    def _retrieve_locally(self) -> RetrieverResult | None:
+        """Serve the retrieval from the answer cache or the concurrent fan-out,
+        or hand over what was found once the budget is spent."""
+        return (
+            self._retrieve_from_cache()
+            or self._retrieve_concurrently()
+            or self._partial_retrieval()
+        )
+
+    def _partial_retrieval(self) -> RetrieverResult | None:
+        """The passages found so far, once the budget of the retrieval is spent.
+
+        Also the fallback of the retriever agent, whose tool results become
+        the passages.
+        """
+        if not self._out_of_time("retrieval_task"):
+            return None
+
+        results = [
+            answer_from_text(str(tool_result["result"]), tool_result["tool_name"])
+            for tool_result in self.retriever().tools_results
+            if str(tool_result.get("result") or "").strip()
+            and tool_result["result"] != BUDGET_SPENT_MESSAGE
+        ]
+        return RetrieverResult(results=merge_answers(results))
+
+    def _speculate(self, question: Question) -> None:
+        """Start retrieving for the raw question while the analysis runs.
+
+        The question comes from the local analysis only, the retrieval stage
+        keeps what matches the analyzed question and searches the rest.
+        """
+        if (
+            self.settings.RETRIEVAL_MODE != "fanout"
+            or not self.settings.RETRIEVAL_SPECULATIVE
+        ):
+            return
+
+        fanout = build_retrieval_fanout(get_mcp_pool())
+        if fanout is not None:
+            self._speculation = fanout.speculate(question)
+
+    def _take_speculation(self, cancel: bool = True) -> SpeculativeRetrieval | None:
+        """Hand over the speculative retrieval of the question, or cancel it."""
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None and cancel:
+            speculation.cancel()
+            return None
+        return speculation
+
+    def _retrieve_concurrently(self) -> RetrieverResult | None:
+        question = self._analyzed_question()
+        if self.settings.RETRIEVAL_MODE != "fanout" or question is None:
+            self._take_speculation()
+            return None
+
+        speculation = self._take_speculation(cancel=False)
+        fanout = (
+            speculation.fanout
+            if speculation is not None
+            else build_retrieval_fanout(get_mcp_pool())
+        )
+        if fanout is None:
+            return None
+
+        result = fanout.retrieve(
+            question,
+            speculation,
+            reuse=self._session.passages if self._session is not None else None,
+            required=self._follow_up_terms,
+        )
+        # Without any passage the retriever agent still gets its chance
+        return result if result.results else None
+
+    def _retrieve_from_cache(self) -> RetrieverResult | None:
+        """Look the analyzed question up in the answer cache.
+
+        On a hit the cached passages stand in for the retrieval, and the
+        ranking and answer generation stages are served from the same entry.
+        """
+        answer_cache = get_answer_cache()
+        question = self._analyzed_question()
+        if answer_cache is None or question is None:
+            return None
+
+        self._cached_answer = answer_cache.lookup(question)
+        if self._cached_answer is None:
+            return None
+
+        self._take_speculation()
+        return RetrieverResult(
+            results=[
+                Answer(answer=ranked.answer, references=ranked.references)
+                for ranked in self._cached_answer.ranked_answers
+            ]
+        )
+
+    def _compact_retrieval(self, result: RetrieverResult) -> RetrieverResult:
+        """Trim the retrieved passages to the budget of the ranking stage."""
+        if isinstance(result, RetrieverResult):
+            self._retrieved = result
+        compactor = get_passage_compactor()
+        question = self._analyzed_question()
+        if (
+            compactor is None
+            or question is None
+            or not isinstance(result, RetrieverResult)
+        ):
+            return result
+        return compactor.compact_retrieval(question, result)
+
+    def _rank_locally(self) -> RankResult | None:
+        """Serve the ranking from the answer cache, the local ranker or a
+        batched LLM call."""
+        return (
+            self._rank_from_cache()
+            or self._rank_with_engine()
+            or self._rank_out_of_time()
+            or self._rank_with_llm()
         )
 
+    def _rank_with_engine(self) -> RankResult | None:
+        question = self._analyzed_question()
+        output = self.retrieval_task().output
+        if (
+            self.settings.RANKING_MODE != "local"
+            or question is None
+            or output is None
+            or not isinstance(output.pydantic, RetrieverResult)
+        ):
+            return None
+
+        return get_local_ranker().rank(question, output.pydantic.results)
+
+    def _rank_out_of_time(self) -> RankResult | None:
+        """Rank with the local ranker, without the LLM, once the budget of the
+        ranking is spent. Also the fallback of the ranker agent."""
+        question = self._analyzed_question()
+        output = self.retrieval_task().output
+        if (
+            question is None
+            or output is None
+            or not isinstance(output.pydantic, RetrieverResult)
+            or not self._out_of_time("ranking_task")
+        ):
+            return None
+
+        return get_local_ranker().rank(question, output.pydantic.results)
+
+    def _rank_with_llm(self) -> RankResult | None:
+        """Rank with a compact LLM call, batched with the other crews.
+
+        Falls back to the ranker agent when the reply is not usable.
+        """
+        question = self._analyzed_question()
+        output = self.retrieval_task().output
+        batcher = get_micro_batcher()
+        if (
+            self.settings.RANKING_MODE != "llm"
+            or batcher is None
+            or question is None
+            or output is None
+            or not isinstance(output.pydantic, RetrieverResult)
+            or not output.pydantic.results
+        ):
+            return None
+
+        ranker = self.ranker()
+        answers = output.pydantic.results
+        return self._submit_batched(
+            batcher,
+            ("ranking", ranker.llm.model),
+            (question, answers),
+            len(question.question) + sum(len(answer.answer) for answer in answers),
+            lambda requests, callbacks: rank_with_llm(
+                ranker.llm,
+                requests,
+                self.settings.RANKING_MAX_RESULTS,
+                callbacks=callbacks,
+            ),
+            ranker,
+        )
+
+    @staticmethod
+    def _submit_batched(
+        batcher: MicroBatcher,
+        key: tuple,
+        request: tuple,
+        size: int,
+        call: Callable[[list, list], list],
+        batch_agent: Agent,
+    ):
+        """Submit a request to the micro-batcher and charge the agent its share.
+
+        `call` makes the batched LLM call of the requests with the given
+        callbacks. Its token usage is split across the requests by prompt
+        size, each agent is charged the share of its own request.
+        """
+
+        def run(items: list[tuple[tuple, int]]) -> list[tuple[object, list[int]]]:
+            usage = TokenProcess()
+            results = call([item for item, _ in items], [TokenCalcHandler(usage)])
+            sizes = [item_size for _, item_size in items]
+            shares = [
+                split_shares(getattr(usage, field), sizes) for field in _USAGE_FIELDS
+            ]
+            return [
+                (result, [share[index] for share in shares])
+                for index, result in enumerate(results)
+            ]
+
+        reply = batcher.submit(key, (request, size), run)
+        if reply is None:
+            return None
+
+        result, share = reply
+        usage = dict(zip(_USAGE_FIELDS, share))
+        token_process = batch_agent._token_process
+        token_process.sum_prompt_tokens(usage["prompt_tokens"])
+        token_process.sum_completion_tokens(usage["completion_tokens"])
+        token_process.sum_cached_prompt_tokens(usage["cached_prompt_tokens"])
+        token_process.sum_successful_requests(usage["successful_requests"])
+        return result
+
+    def _rank_from_cache(self) -> RankResult | None:
+        question = self._analyzed_question()
+        if self._cached_answer is None or question is None:
+            return None
+
+        return RankResult(
+            **question.model_dump(),
+            ranked_answers=self._cached_answer.ranked_answers,
+        )
+
+    def _compact_ranking(self, result: RankResult) -> RankResult:
+        """Trim the ranked passages to the budget of the answer generation."""
+        compactor = get_passage_compactor()
+        if compactor is None or not isinstance(result, RankResult):
+            return result
+        return compactor.compact_ranking(result)
+
+    def _answer_from_cache(self) -> DiscordAnswer | None:
+        """Reuse the cached answer when it is already in the asker's language.
+
+        Otherwise the answer generator re-renders the cached ranked passages in
+        the asker's language, which costs a single LLM call.
+        """
+        question = self._analyzed_question()
+        if self._cached_answer is None or question is None:
+            return None
+        if not same_language(self._cached_answer.language_code, question.language_code):
+            return None
+
+        self._answered_from_cache = True
+        return DiscordAnswer(
+            **question.model_dump(),
+            ranked_answers=self._cached_answer.ranked_answers,
+            markdown_answer=self._cached_answer.markdown_answer,
+        )
+
+    def _generate_answer_locally(self) -> DiscordAnswer | None:
+        """Serve the answer from the cache or stream it to the caller, or make
+        it of the best passages when no time is left to write it."""
+        self._route_answer_generator()
+        return (
+            self._answer_from_cache()
+            or self._partial_answer()
+            or self._answer_markdown()
+            or self._partial_answer()
+        )
+
+    def _partial_answer(self) -> DiscordAnswer | None:
+        """The best ranked passages as the answer, once the whole budget is
+        spent. Also the fallback of the answer generator agent."""
+        output = self.ranking_task().output
+        if (
+            output is None
+            or not isinstance(output.pydantic, RankResult)
+            or not output.pydantic.ranked_answers
+            or not self._out_of_time("answer_generation_task", reserve=0.0)
+        ):
+            return None
+
+        return DiscordAnswer(
+            **output.pydantic.model_dump(),
+            markdown_answer=partial_markdown(output.pydantic),
+        )
+
+    def _limit_to_deadline(self, llm: LLM) -> LLM:
+        """Make the calls of an LLM, and of its fallback, end by the deadline."""
+        deadline = current_deadline()
+        timeout = max(deadline.remaining(), 1.0) if deadline else None
+        for model in (llm, getattr(llm, "fallback", None)):
+            if model is not None:
+                model.timeout = timeout
+        return llm
+
+    def _answer_tier(self) -> str:
+        return tier_for_question(
+            agent_tier("answer_generator", self.settings),
+            self._analyzed_question(),
+            self.settings,
+        )
+
+    def _route_answer_generator(self) -> None:
+        """Give the answer generator the model tier the question needs."""
+        tier = self._answer_tier()
+        if tier != self._answer_generator_tier:
+            self.answer_generator().llm = self.get_llm(tier=tier)
+            self._answer_generator_tier = tier
+        self._limit_to_deadline(self.answer_generator().llm)
+
+    def _knowledge_context(self, generator: Agent, question: Question) -> str:
+        """The knowledge snippets of an agent about a question, as the agent
+        itself would add them to its task prompt."""
+        if generator.knowledge is None:
+            return ""
+        try:
+            snippets = generator.knowledge.query(
+                [question.question],
+                results_limit=self.settings.KNOWLEDGE_TOP_K,
+                score_threshold=self.settings.KNOWLEDGE_MIN_SCORE,
+            )
+        except Exception as e:
+            log_event("knowledge_search_failed", sample_rate=1.0, error=repr(e))
+            return ""
+        return extract_knowledge_context(snippets)
+
+    def _answer_markdown(self) -> DiscordAnswer | None:
+        """Stream the Markdown answer with a single LLM call.
+
+        Only used when the caller follows the answer, so its tokens can be
+        shown as they arrive. Only the Markdown is generated, the rest of the
+        answer is copied from the ranking, so nothing has to be parsed.
+        """
+        output = self.ranking_task().output
+        streaming = self.stream is not None and self.settings.ANSWER_STREAMING
+        if (
+            not streaming
+            or output is None
+            or not isinstance(output.pydantic, RankResult)
+        ):
+            return None
+
+        task = self.answer_generation_task()
+        generator = self.answer_generator()
+        llm = self._limit_to_deadline(
+            self.get_llm(stream=streaming, tier=self._answer_tier())
+        )
+        knowledge = self._knowledge_context(generator, output.pydantic)
+        messages = [
+            {
+                "role": "system",
+                "content": f"You are {generator.role}. {generator.backstory}",
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"{task.description}\n\n"
+                    f"Ranked content:\n{output.pydantic.model_dump_json()}\n\n"
+                    + (f"{knowledge}\n\n" if knowledge else "")
+                    + f"{task.expected_output}\n\n"
+                    "Reply with the Markdown answer only, without JSON or code fences."
+                ),
+            },
+        ]
+
+        try:
+            with self.stream.attach(llm) if streaming else nullcontext():
+                markdown = llm.call(
+                    messages,
+                    callbacks=[TokenCalcHandler(generator._token_process)],
+                    from_task=task,
+                    from_agent=generator,
+                )
+        except Exception as e:
+            log_event("markdown_answer_failed", sample_rate=1.0, error=repr(e))
+            return None
+
+        if not markdown or not markdown.strip():
+            return None
+        return DiscordAnswer(
+            **output.pydantic.model_dump(), markdown_answer=markdown.strip()
+        )
+
+    def _store_session(self) -> None:
+        """Keep the question and its passages for the follow-ups of its session."""
+        session_store = get_session_store()
+        session_id = self._inputs.get(SESSION_INPUT)
+        question = self._analyzed_question()
+        if (
+            session_store is None
+            or not session_id
+            or question is None
+            or self._retrieved is None
+        ):
+            return
+
+        session_store.save(str(session_id), question, self._retrieved.results)
+
+    def _store_answer(self, output: TaskOutput) -> None:
+        self._store_session()
+        answer_cache = get_answer_cache()
+        question = self._analyzed_question()
+        if (
+            answer_cache is None
+            or question is None
+            or self._answered_from_cache
+            or self._degraded
+            or not isinstance(output.pydantic, DiscordAnswer)
+        ):
+            return
+
+        answer_cache.store(question, output.pydantic)
+
+    def stage_metrics(self) -> list[StageMetrics]:
+        """The wall time, tokens and retries of each task of the last run.
+
+        Every agent runs a single task, so the tokens counted by the agent are
+        the ones of its task, including the LLM calls of the local runners.
+        """
+        stages = []
+        for crew_task in self.crew().tasks:
+            if crew_task.start_time is None:
+                continue
+
+            usage = crew_task.agent._token_process.get_summary()
+            stages.append(
+                StageMetrics(
+                    stage=crew_task.name,
+                    mode="local"
+                    if getattr(crew_task, "ran_locally", False)
+                    else "agent",
+                    seconds=crew_task.execution_duration or 0.0,
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens,
+                    retries=crew_task.retry_count + crew_task.agent._times_executed,
+                )
+            )
+        return stages
+
+    def reset(self) -> None:
+        """Clear the per-run state so the same crew can answer another question."""
+        crew = self.crew()
+
+        crew.usage_metrics = None
+        for crew_task in crew.tasks:
+            crew_task.output = None
+            crew_task.retry_count = 0
+            crew_task.used_tools = 0
+            crew_task.tools_errors = 0
+            crew_task.delegations = 0
+            crew_task.prompt_context = None
+            crew_task.start_time = None
+            crew_task.end_time = None
+            crew_task.processed_by_agents = set()
+
+        for crew_agent in crew.agents:
+            crew_agent.tools_results = []
+            crew_agent._times_executed = 0
+            crew_agent._token_process = TokenProcess()
+
+        # Crews built while the MCP server was unreachable get its tools as
+        # soon as the pool has listed them.
+        if not self.mcp_tools:
+            self.mcp_tools = get_mcp_pool().get_tools(timeout=0)
+            if self.mcp_tools:
+                log_event(
+                    "retriever_tools_added",
+                    tools=[tool.name for tool in self.mcp_tools],
+                )
+                self.retriever().tools += self.mcp_tools
+
     @crew
     def crew(self) -> Crew:
         """Creates the SSL Q&A crew for Discord."""
@@ -153,6 +839,6 @@ class SmallSizeLeagueExpert:
                 self.ranking_task(),
                 self.answer_generation_task(),
             ],
-            verbose=True,
+            verbose=self.settings.CREW_VERBOSE,
             process=Process.sequential,
         )
@@ -0,0 +1,133 @@
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, AsyncIterator, Callable
+
+from crewai.crews.crew_output import CrewOutput
+
+from small_size_league_expert.crew import SmallSizeLeagueExpert
+from small_size_league_expert.deadline import (
+    deadline_scope,
+    pop_deadline,
+    with_deadline,
+)
+from small_size_league_expert.knowledge import load_knowledge
+from small_size_league_expert.mcp_pool import get_mcp_pool
+from small_size_league_expert.metrics import log_event, track_run
+from small_size_league_expert.microbatch import get_micro_batcher
+from small_size_league_expert.models import DiscordAnswer
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.streaming import AnswerStream
+
+
+class CrewPool:
+    """A fixed-size pool of pre-built crews.
+
+    Building a crew reads the YAML configs, creates every agent, task and LLM
+    and attaches the tools. The pool does this once at startup and then leases
+    one crew per question, so concurrent questions never share a crew.
+    """
+
+    def __init__(
+        self,
+        size: int | None = None,
+        factory: Callable[[], SmallSizeLeagueExpert] = SmallSizeLeagueExpert,
+    ):
+        self.size = size or get_settings().CREW_POOL_SIZE
+        self._factory = factory
+        self._idle: asyncio.Queue[SmallSizeLeagueExpert] = asyncio.Queue()
+        self._pending: set[asyncio.Task] = set()
+        self._started = False
+
+    def _build(self) -> SmallSizeLeagueExpert:
+        """Create a crew and instantiate all of its agents and tasks."""
+        expert = self._factory()
+        expert.crew()
+        return expert
+
+    async def start(self) -> None:
+        """Build all the crews of the pool and load their knowledge files."""
+        if self._started:
+            return
+
+        print(f"🏗️ Building {self.size} crews for the crew pool...")
+        *experts, _ = await asyncio.gather(
+            *(asyncio.to_thread(self._build) for _ in range(self.size)),
+            asyncio.to_thread(load_knowledge),
+        )
+        for expert in experts:
+            self._idle.put_nowait(expert)
+
+        self._started = True
+        print(f"✅ Crew pool ready with {self.size} crews")
+
+    async def close(self) -> None:
+        """Close the MCP sessions shared by the crews."""
+        await asyncio.to_thread(get_mcp_pool().stop)
+
+    @property
+    def available(self) -> int:
+        """Number of crews that are not leased right now."""
+        return self._idle.qsize()
+
+    async def _release(self, expert: SmallSizeLeagueExpert) -> None:
+        """Reset a crew off the request path and put it back in the pool."""
+        try:
+            await asyncio.to_thread(expert.reset)
+        except Exception as e:
+            log_event("crew_reset_failed", sample_rate=1.0, error=repr(e))
+            expert = await asyncio.to_thread(self._build)
+        self._idle.put_nowait(expert)
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[SmallSizeLeagueExpert]:
+        """Lease a crew, waiting for one to be released if all are busy."""
+        if not self._started:
+            await self.start()
+
+        expert = await self._idle.get()
+        try:
+            yield expert
+        finally:
+            release = asyncio.create_task(self._release(expert))
+            self._pending.add(release)
+            release.add_done_callback(self._pending.discard)
+
+    async def kickoff(
+        self, inputs: dict[str, Any], stream: AnswerStream | None = None
+    ) -> CrewOutput:
+        """Run a leased crew with the given inputs.
+
+        When a stream is given, the final answer is pushed to it while it is
+        generated, and the stream is closed once the crew finishes. The metrics
+        of the run are recorded either way. Every stage and tool call of the
+        run ends by the deadline of the inputs, `DEADLINE_SECONDS` from now
+        when they have none.
+        """
+        inputs, deadline = pop_deadline(with_deadline(inputs))
+        batcher = get_micro_batcher()
+        async with self.lease() as expert:
+            expert.stream = stream
+            with (
+                track_run(str(inputs.get("original_question", ""))) as run,
+                deadline_scope(deadline),
+                # Lets the stage calls of a lone crew skip the batching window
+                batcher.crew() if batcher is not None else nullcontext(),
+            ):
+                try:
+                    return await expert.crew().kickoff_async(inputs=inputs)
+                except Exception:
+                    run.outcome = "error"
+                    raise
+                finally:
+                    expert.stream = None
+                    if stream is not None:
+                        stream.close()
+                    run.stages = expert.stage_metrics()
+                    run.observe()
+
+    async def answer(
+        self, inputs: dict[str, Any], stream: AnswerStream | None = None
+    ) -> DiscordAnswer | None:
+        """Run a leased crew and return its final answer, if it produced one."""
+        result = await self.kickoff(inputs, stream)
+        return result.pydantic if result else None
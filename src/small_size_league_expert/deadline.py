@@ -0,0 +1,120 @@
+"""End-to-end time budget of a question.
+
+A deadline is set when a question is accepted (when `/ask` is deferred, for
+Discord) and travels with the crew inputs, as a wall-clock timestamp, to the
+worker that runs the crew. There it is the deadline of the current context,
+so every stage and tool call can cap its own timeout with `time_left`.
+
+The last `DEADLINE_ANSWER_RESERVE` seconds belong to the answer generation:
+once only those remain, the retrieval and ranking stages stop searching and
+hand over what they already have. When even the answer generation runs out of
+time, the answer is made of the best passages found.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from small_size_league_expert.models import RankResult
+from small_size_league_expert.settings import get_settings
+
+# Key of the deadline in the crew inputs
+DEADLINE_INPUT = "deadline"
+
+BUDGET_SPENT_MESSAGE = (
+    "The time budget of this question is spent. Do not call any other tool: "
+    "give your final answer now with the information you already found."
+)
+
+
+class Deadline:
+    """The time by which a question must be answered."""
+
+    def __init__(self, expires_at: float):
+        # Wall-clock time, so it means the same in every process
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.time() + seconds)
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """Seconds left before the deadline, minus `reserve`."""
+        return max(0.0, self.expires_at - time.time() - reserve)
+
+    def spent(self, reserve: float = 0.0) -> bool:
+        return self.remaining(reserve) <= 0
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.1f}s)"
+
+
+_current_deadline: ContextVar[Deadline | None] = ContextVar(
+    "current_deadline", default=None
+)
+
+
+def current_deadline() -> Deadline | None:
+    """The deadline of the question being answered, if any."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline | None) -> Iterator[Deadline | None]:
+    """Make `deadline` the deadline of the threads and tasks started inside."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def time_left(limit: float, reserve: float = 0.0) -> float:
+    """A timeout of at most `limit` seconds that ends before the deadline."""
+    deadline = current_deadline()
+    if deadline is None:
+        return limit
+    return min(limit, deadline.remaining(reserve))
+
+
+def answer_reserve() -> float:
+    """Seconds of the budget kept for the answer generation."""
+    return get_settings().DEADLINE_ANSWER_RESERVE
+
+
+def with_deadline(inputs: dict[str, Any]) -> dict[str, Any]:
+    """The crew inputs with a deadline, `DEADLINE_SECONDS` from now unless they
+    already have one."""
+    seconds = get_settings().DEADLINE_SECONDS
+    if inputs.get(DEADLINE_INPUT) is not None or seconds <= 0:
+        return inputs
+    return {**inputs, DEADLINE_INPUT: time.time() + seconds}
+
+
+def pop_deadline(inputs: dict[str, Any]) -> tuple[dict[str, Any], Deadline | None]:
+    """Split the deadline off the crew inputs, which are interpolated in the
+    task prompts."""
+    inputs = dict(inputs)
+    expires_at = inputs.pop(DEADLINE_INPUT, None)
+    return inputs, Deadline(float(expires_at)) if expires_at is not None else None
+
+
+def partial_markdown(
+    result: RankResult, max_passages: int = 3, max_chars: int = 500
+) -> str:
+    """An answer made of the best passages, when no time is left to write one."""
+    lines = [
+        "⏱️ I ran out of time before writing a complete answer. "
+        "These are the most relevant passages I found:"
+    ]
+    for passage in sorted(result.ranked_answers, key=lambda p: p.rank)[:max_passages]:
+        text = " ".join(passage.answer.split())
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit(" ", 1)[0] + "..."
+        sources = ", ".join(
+            f"[source {index}]({reference})"
+            for index, reference in enumerate(passage.references[:2], start=1)
+        )
+        lines.append(f"> {text}\n{sources}".rstrip())
+    return "\n\n".join(lines)
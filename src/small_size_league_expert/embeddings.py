@@ -0,0 +1,110 @@
+import hashlib
+import re
+import threading
+from functools import lru_cache
+from typing import Protocol
+
+import numpy as np
+
+from small_size_league_expert.settings import get_settings
+
+STOPWORDS = frozenset(
+    """
+    a an and are as at be by can do does for from how i in is it its of on or
+    that the their there these this to was what when where which who why will
+    with you your about into than then them they we our us my me
+    """.split()
+)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+
+
+def tokenize(text: str, keep_stopwords: bool = False) -> list[str]:
+    """Split a text into lowercase word tokens."""
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    if keep_stopwords:
+        return tokens
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+class Embedder(Protocol):
+    """Turns texts into L2-normalized embedding vectors."""
+
+    dimension: int
+
+    def embed(self, texts: list[str]) -> np.ndarray: ...
+
+
+class HashingEmbedder:
+    """A local embedder based on the hashing trick.
+
+    Words and word bigrams are hashed into a fixed number of signed buckets.
+    It needs no model or network access and is deterministic, which makes it a
+    good default for near-duplicate detection over normalized English text.
+    """
+
+    def __init__(self, dimension: int = 1024):
+        self.dimension = dimension
+
+    def _bucket(self, feature: str) -> tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        sign = 1.0 if value & 1 else -1.0
+        return (value >> 1) % self.dimension, sign
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                index, sign = self._bucket(feature)
+                vectors[row, index] += sign
+        return normalize(vectors)
+
+
+class LiteLLMEmbedder:
+    """An embedder backed by any embedding model supported by LiteLLM."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.dimension = len(self._request(["dimension probe"])[0])
+
+    def _request(self, texts: list[str]) -> list[list[float]]:
+        import litellm
+
+        response = litellm.embedding(model=self.model, input=texts)
+        return [item["embedding"] for item in response.data]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return normalize(np.asarray(self._request(texts), dtype=np.float32))
+
+
+def embedder_id(embedder: Embedder) -> str:
+    """Identify an embedder, to tell whether stored embeddings can be reused."""
+    return f"{type(embedder).__name__}:{getattr(embedder, 'model', '')}:{embedder.dimension}"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a matrix, leaving zero rows untouched."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+_embedder_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _build_embedder(model: str) -> Embedder:
+    if model:
+        return LiteLLMEmbedder(model)
+    return HashingEmbedder()
+
+
+def get_embedder() -> Embedder:
+    """Get the embedder configured by `Settings.EMBEDDING_MODEL`."""
+    with _embedder_lock:
+        return _build_embedder(get_settings().EMBEDDING_MODEL)
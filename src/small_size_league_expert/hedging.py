@@ -0,0 +1,131 @@
+"""Hedged tool calls.
+
+Most calls of a search tool take about the same time, and the few that take
+much longer are usually stuck behind a slow server or connection rather than
+doing more work. Once a call has run for longer than the p95 latency of its
+tool, a duplicate call is sent and the first one to answer is used, the other
+is cancelled. Only the read-only search tools are hedged, so a duplicate is
+harmless, and at most one duplicate is sent per call.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from small_size_league_expert.metrics import REGISTRY, TOOL_HEDGES
+from small_size_league_expert.settings import get_settings
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """The latencies of the recent calls of each tool."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tool: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(tool)
+            if samples is None:
+                samples = self._samples[tool] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, tool: str, q: float, min_samples: int = 1) -> float | None:
+        """The q-quantile of the recent latencies, None with too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(tool, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class Hedger:
+    """Sends a second call when the first one is slower than most."""
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        min_delay: float = 0.05,
+        window: int = 200,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = LatencyTracker(window)
+
+    def delay(self, tool: str) -> float | None:
+        """How long a call of the tool runs alone, None until it is known."""
+        latency = self.latencies.percentile(tool, self.percentile, self.min_samples)
+        return None if latency is None else max(latency, self.min_delay)
+
+    async def _attempt(self, tool: str, compute: Callable[[], Awaitable[T]]) -> T:
+        # Only completed calls are sampled: a cancelled hedge loser was cut
+        # short, and its time would pull the p95 down
+        started = time.perf_counter()
+        result = await compute()
+        self.latencies.record(tool, time.perf_counter() - started)
+        return result
+
+    async def call(self, tool: str, compute: Callable[[], Awaitable[T]]) -> T:
+        """The result of `compute()`, hedged once it is slower than the p95."""
+        delay = self.delay(tool)
+        primary = asyncio.ensure_future(self._attempt(tool, compute))
+        attempts = {primary}
+        try:
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                REGISTRY.inc(TOOL_HEDGES, tool=tool, outcome="sent")
+                attempts.add(asyncio.ensure_future(self._attempt(tool, compute)))
+
+            pending = attempts
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # A failed attempt only counts when the other one failed too
+                finished = next(
+                    (attempt for attempt in done if attempt.exception() is None),
+                    None,
+                )
+                if finished is not None or not pending:
+                    finished = finished or done.pop()
+                    break
+
+            if len(attempts) > 1:
+                outcome = "primary_won" if finished is primary else "hedge_won"
+                REGISTRY.inc(TOOL_HEDGES, tool=tool, outcome=outcome)
+            return finished.result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+
+_hedger: Hedger | None = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger | None:
+    """Get the process-wide hedger, or None when hedging is disabled."""
+    global _hedger
+
+    settings = get_settings()
+    if not settings.HEDGING_ENABLED:
+        return None
+
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(
+                percentile=settings.HEDGING_PERCENTILE,
+                min_samples=settings.HEDGING_MIN_SAMPLES,
+                min_delay=settings.HEDGING_MIN_DELAY,
+            )
+        return _hedger
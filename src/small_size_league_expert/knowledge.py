@@ -0,0 +1,304 @@
+"""Knowledge files of the agents, embedded once and persisted on disk.
+
+crewai chunks and embeds the knowledge sources of an agent again every time
+its crew is kicked off. Here each file under `knowledge/` is chunked and
+embedded the first time it is needed, and stored under `CACHE_DIR/knowledge`
+keyed by the hash of its content, the chunking and the embedder. Unchanged
+files are loaded from disk on the next starts, and every crew of the process
+shares the same vectors.
+
+The embedder is the one crewai uses for knowledge, unless `EMBEDDING_MODEL`
+names another model or `KNOWLEDGE_EMBEDDER` opts into the local hashing
+embedder (see `knowledge_embedder`).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from crewai.knowledge.knowledge import Knowledge
+from crewai.knowledge.storage.knowledge_storage import KnowledgeStorage
+from crewai.utilities.constants import KNOWLEDGE_DIRECTORY
+
+from small_size_league_expert.corpus import chunk_document
+from small_size_league_expert.embeddings import (
+    Embedder,
+    HashingEmbedder,
+    embedder_id,
+    get_embedder,
+    normalize,
+)
+from small_size_league_expert.settings import get_settings
+
+
+class CrewAIEmbedder:
+    """The default embedder of the crewai knowledge storage.
+
+    Its embedding function is only built on the first call, as it needs the
+    OpenAI API key, so the cached vectors can be loaded without it.
+    """
+
+    # The model and width of the default crewai embedding function
+    model = "text-embedding-3-small"
+    dimension = 1536
+
+    def __init__(self):
+        self._function = None
+        self._lock = threading.Lock()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        with self._lock:
+            if self._function is None:
+                from crewai.utilities.embedding_configurator import (
+                    EmbeddingConfigurator,
+                )
+
+                self._function = EmbeddingConfigurator().configure_embedder(None)
+        return normalize(np.asarray(self._function(texts), dtype=np.float32))
+
+
+def knowledge_embedder() -> Embedder:
+    """The embedder of the knowledge files.
+
+    `EMBEDDING_MODEL` when it is set, the local hashing embedder when
+    `KNOWLEDGE_EMBEDDER` opts into it, and the crewai default otherwise.
+    """
+    settings = get_settings()
+    if settings.EMBEDDING_MODEL:
+        return get_embedder()
+    if settings.KNOWLEDGE_EMBEDDER == "hashing":
+        return HashingEmbedder()
+    return CrewAIEmbedder()
+
+
+class PersistentKnowledgeStorage(KnowledgeStorage):
+    """Knowledge storage searched in memory, with its embeddings cached on disk.
+
+    Stands in for the ChromaDB storage of crewai, so `Agent.knowledge` can use
+    it without re-embedding anything on kickoff. Documents saved through
+    `save` are stored next to the files, and loaded with them on the next
+    starts.
+    """
+
+    def __init__(
+        self,
+        paths: list[Path],
+        directory: str,
+        embedder: Embedder,
+        chunk_words: int = 180,
+        chunk_overlap: int = 30,
+    ):
+        # The ChromaDB collection and embedding function of the parent are
+        # never created
+        self.collection_name = "knowledge"
+        self.paths = paths
+        self.directory = Path(directory)
+        self.embedder = embedder
+        self.chunk_words = chunk_words
+        self.chunk_overlap = chunk_overlap
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._passages: list[dict[str, Any]] = []
+        self._embeddings = np.zeros((0, embedder.dimension), dtype=np.float32)
+
+    def initialize_knowledge_storage(self) -> None:
+        # Loading waits for the first search or an explicit `load`
+        pass
+
+    def _cache_key(self, content: bytes) -> str:
+        digest = hashlib.sha256(content)
+        digest.update(
+            f"{embedder_id(self.embedder)}:{self.chunk_words}:{self.chunk_overlap}".encode()
+        )
+        return digest.hexdigest()
+
+    @staticmethod
+    def _path_prefix(path: Path) -> str:
+        return hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:16]
+
+    def _load_file(self, path: Path) -> tuple[list[dict[str, Any]], np.ndarray]:
+        """Chunks and embeddings of a file, from the cache when it is unchanged."""
+        content = path.read_bytes()
+        prefix = self._path_prefix(path)
+        cached = self.directory / f"{prefix}-{self._cache_key(content)}.npz"
+        if cached.exists():
+            with np.load(cached) as data:
+                passages = json.loads(str(data["passages"]))
+                return passages, data["embeddings"]
+
+        passages = [
+            {"context": f"{title}\n{text}" if title else text, "source": str(path)}
+            for title, text in chunk_document(
+                content.decode("utf-8", errors="ignore"),
+                self.chunk_words,
+                self.chunk_overlap,
+            )
+        ]
+        embeddings = self.embedder.embed([passage["context"] for passage in passages])
+
+        self._write(cached, passages, embeddings)
+        # The vectors of the previous contents of the file are not needed anymore
+        for stale in self.directory.glob(f"{prefix}-*.npz"):
+            if stale != cached:
+                stale.unlink(missing_ok=True)
+        print(f"📚 Embedded {len(passages)} knowledge passages of {path}")
+        return passages, embeddings
+
+    def _write(
+        self, cached: Path, passages: list[dict[str, Any]], embeddings: np.ndarray
+    ) -> None:
+        # Write next to the target and swap it in, other processes may be
+        # loading the same file
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = self.directory / f".{cached.name}.{os.getpid()}.tmp"
+        with temporary.open("wb") as file:
+            np.savez(
+                file,
+                passages=json.dumps(passages),
+                embeddings=embeddings,
+                embedder=embedder_id(self.embedder),
+            )
+        os.replace(temporary, cached)
+
+    def _load_saved(self) -> tuple[list[dict[str, Any]], list[np.ndarray]]:
+        """Chunks and embeddings of the documents saved by `save`."""
+        passages: list[dict[str, Any]] = []
+        rows: list[np.ndarray] = []
+        for cached in sorted(self.directory.glob("saved-*.npz")):
+            with np.load(cached) as data:
+                # Saved with another embedder, its vectors can not be compared
+                if str(data["embedder"]) != embedder_id(self.embedder):
+                    continue
+                passages += json.loads(str(data["passages"]))
+                rows.append(np.asarray(data["embeddings"], dtype=np.float32))
+        return passages, rows
+
+    def load(self) -> None:
+        """Load the embeddings of every knowledge file, embedding the new ones."""
+        with self._lock:
+            if self._loaded:
+                return
+
+            passages: list[dict[str, Any]] = []
+            rows = [self._embeddings]
+            for path in self.paths:
+                if not path.is_file():
+                    print(f"⚠️ Knowledge file not found: {path}")
+                    continue
+                file_passages, file_embeddings = self._load_file(path)
+                passages += file_passages
+                rows.append(np.asarray(file_embeddings, dtype=np.float32))
+
+            saved_passages, saved_rows = self._load_saved()
+            passages += saved_passages
+            rows += saved_rows
+
+            self._passages = passages
+            self._embeddings = np.vstack(rows)
+            self._loaded = True
+
+    def search(
+        self,
+        query: list[str],
+        limit: int = 3,
+        filter: dict | None = None,
+        score_threshold: float = 0.35,
+    ) -> list[dict[str, Any]]:
+        self.load()
+        if not self._passages:
+            return []
+
+        scores = self._embeddings @ self.embedder.embed([" ".join(query)])[0]
+        best = np.argsort(-scores)[:limit]
+        return [
+            {
+                "id": str(index),
+                "metadata": {"source": self._passages[index]["source"]},
+                "context": self._passages[index]["context"],
+                "score": float(scores[index]),
+            }
+            for index in best
+            if scores[index] >= score_threshold
+        ]
+
+    def save(
+        self,
+        documents: list[str],
+        metadata: dict[str, Any] | list[dict[str, Any]] | None = None,
+    ) -> None:
+        """Embed documents and add them to the knowledge, on disk and in memory."""
+        if not documents:
+            return
+        if not isinstance(metadata, list):
+            metadata = [metadata or {}] * len(documents)
+
+        passages = [
+            {"context": document, "source": str(meta.get("source", "saved"))}
+            for document, meta in zip(documents, metadata)
+        ]
+        embeddings = self.embedder.embed(documents).astype(np.float32)
+
+        # Loaded first, so the file written below is not read back on top
+        self.load()
+        content = json.dumps(passages, sort_keys=True).encode()
+        self._write(
+            self.directory / f"saved-{self._cache_key(content)}.npz",
+            passages,
+            embeddings,
+        )
+        with self._lock:
+            self._passages = self._passages + passages
+            self._embeddings = np.vstack([self._embeddings, embeddings])
+
+    def reset(self) -> None:
+        """Forget the loaded embeddings and remove the cached ones."""
+        with self._lock:
+            for cached in self.directory.glob("*.npz"):
+                cached.unlink()
+            self._passages = []
+            self._embeddings = np.zeros((0, self.embedder.dimension), dtype=np.float32)
+            self._loaded = False
+
+
+_knowledge: Knowledge | None = None
+_knowledge_lock = threading.Lock()
+
+
+def get_knowledge() -> Knowledge:
+    """Get the process-wide knowledge of the answer generator.
+
+    Building it is cheap, the files are loaded on the first search or by
+    `load_knowledge`.
+    """
+    global _knowledge
+
+    with _knowledge_lock:
+        if _knowledge is None:
+            settings = get_settings()
+            storage = PersistentKnowledgeStorage(
+                paths=[
+                    Path(KNOWLEDGE_DIRECTORY) / name
+                    for name in settings.KNOWLEDGE_FILES
+                ],
+                directory=os.path.join(settings.CACHE_DIR, "knowledge"),
+                embedder=knowledge_embedder(),
+                chunk_words=settings.CORPUS_CHUNK_WORDS,
+                chunk_overlap=settings.CORPUS_CHUNK_OVERLAP,
+            )
+            _knowledge = Knowledge(
+                collection_name="answer_generator", sources=[], storage=storage
+            )
+        return _knowledge
+
+
+def load_knowledge() -> None:
+    """Load the knowledge files now rather than on the first question."""
+    get_knowledge().storage.load()
@@ -0,0 +1,196 @@
+"""Persistent cache of the completions of the temperature-0 LLM calls.
+
+With `temperature=0` the same prompt to the same model gives the same
+completion, so repeated sub-questions, reruns after a transient error and
+regression runs can reuse it instead of paying for the call again. Entries are
+keyed by the hash of the model, the stop words, the messages and the tool
+schema, stored in SQLite, and the least recently used ones are evicted once
+the completions take more than the size limit.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from crewai.utilities.events import crewai_event_bus
+from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+
+from small_size_league_expert.metrics import LLM_CACHE_LOOKUPS, REGISTRY
+from small_size_league_expert.settings import get_settings
+
+
+class CompletionCache:
+    """Completions of LLM calls, keyed by the hash of everything they depend on."""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                completion TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS completions_accessed_at "
+            "ON completions (accessed_at)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(
+        model: str,
+        messages: str | list[dict],
+        tools: list[dict] | None = None,
+        stop: list[str] | None = None,
+        response_format: type | None = None,
+    ) -> str:
+        """Hash of the model, stop words, messages, tool schema and response
+        schema of a call."""
+        call = {"model": model, "stop": stop, "messages": messages, "tools": tools}
+        if response_format is not None:
+            call["response_format"] = response_format.model_json_schema()
+        payload = json.dumps(call, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str, model: str) -> str | None:
+        """The stored completion of a call, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT completion FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                REGISTRY.inc(LLM_CACHE_LOOKUPS, model=model, outcome="miss")
+                return None
+
+            self._db.execute(
+                "UPDATE completions SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._db.commit()
+            self.hits += 1
+            REGISTRY.inc(LLM_CACHE_LOOKUPS, model=model, outcome="hit")
+            return row[0]
+
+    def put(self, key: str, model: str, completion: str) -> None:
+        """Store the completion of a call."""
+        size = len(completion.encode())
+        with self._lock:
+            now = time.time()
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO completions
+                    (key, model, completion, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, completion, size, now, now),
+            )
+            total = self._db.execute("SELECT SUM(size) FROM completions").fetchone()[0]
+            if total > self.max_bytes:
+                # Evict the least recently used completions over the size limit
+                self._db.execute(
+                    """
+                    DELETE FROM completions WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (
+                                ORDER BY accessed_at DESC, key
+                            ) AS kept
+                            FROM completions
+                        ) WHERE kept > ?
+                    )
+                    """,
+                    (self.max_bytes,),
+                )
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Remove every stored completion."""
+        with self._lock:
+            self._db.execute("DELETE FROM completions")
+            self._db.commit()
+
+
+_completion_cache: CompletionCache | None = None
+_completion_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache | None:
+    """Get the process-wide completion cache, or None when it is disabled."""
+    global _completion_cache
+
+    settings = get_settings()
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+
+    with _completion_cache_lock:
+        if _completion_cache is None:
+            _completion_cache = CompletionCache(
+                path=os.path.join(settings.CACHE_DIR, "completions.sqlite3"),
+                max_bytes=int(settings.LLM_CACHE_MAX_MB * 1024 * 1024),
+            )
+        return _completion_cache
+
+
+class CachedCompletions:
+    """Serves the temperature-0 calls of an LLM from the completion cache.
+
+    Mixed in before the LLM class. Calls that run tools themselves
+    (`available_functions`) are never cached, and a cached completion of a
+    streaming LLM is emitted as a single stream chunk.
+    """
+
+    def call(
+        self,
+        messages,
+        tools=None,
+        callbacks=None,
+        available_functions=None,
+        from_task=None,
+        from_agent=None,
+    ):
+        arguments = dict(
+            tools=tools,
+            callbacks=callbacks,
+            available_functions=available_functions,
+            from_task=from_task,
+            from_agent=from_agent,
+        )
+        cache = get_completion_cache()
+        if cache is None or available_functions or self.temperature != 0:
+            return super().call(messages, **arguments)
+
+        key = cache.key(
+            self.model,
+            messages,
+            tools,
+            self.stop,
+            getattr(self, "response_format", None),
+        )
+        completion = cache.get(key, self.model)
+        if completion is not None:
+            if getattr(self, "stream", False):
+                crewai_event_bus.emit(self, LLMStreamChunkEvent(chunk=completion))
+            return completion
+
+        completion = super().call(messages, **arguments)
+        if isinstance(completion, str) and completion:
+            cache.put(key, self.model, completion)
+        return completion
@@ -4,6 +4,7 @@ import warnings
 
 from dotenv import load_dotenv
 
+from small_size_league_expert.batch import main as batch_main
 from small_size_league_expert.crew import SmallSizeLeagueExpert
 
 # Load environment variables
@@ -28,5 +29,13 @@ def run():
         raise Exception(f"An error occurred while running the crew: {e}")
 
 
+def batch():
+    """Answer the questions of a JSONL file or stdin concurrently.
+
+    Takes the arguments of `python -m small_size_league_expert.batch`.
+    """
+    batch_main()
+
+
 if __name__ == "__main__":
     run()
@@ -0,0 +1,430 @@
+import asyncio
+import concurrent.futures
+import random
+import sys
+import threading
+from contextlib import AsyncExitStack
+from datetime import timedelta
+from functools import partial
+
+import anyio
+import httpx
+from crewai.tools import BaseTool
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CallToolResult, TextContent, Tool
+from mcpadapt.crewai_adapter import CrewAIAdapter
+
+from small_size_league_expert.deadline import (
+    BUDGET_SPENT_MESSAGE,
+    answer_reserve,
+    time_left,
+)
+from small_size_league_expert.hedging import get_hedger
+from small_size_league_expert.metrics import log_event, tool_call
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.tool_cache import get_tool_cache
+
+if sys.version_info < (3, 11):
+    from exceptiongroup import BaseExceptionGroup
+
+
+class MCPPoolUnavailableError(RuntimeError):
+    """Raised when no MCP session could be obtained in time."""
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Whether a failed call means the connection of its session is gone.
+
+    A slow call times out on a healthy session, so timeouts never count.
+    """
+    if isinstance(error, BaseExceptionGroup):
+        return any(is_connection_error(e) for e in error.exceptions)
+    if isinstance(error, (TimeoutError, httpx.TimeoutException)):
+        return False
+    return isinstance(
+        error,
+        (
+            OSError,
+            httpx.TransportError,
+            anyio.ClosedResourceError,
+            anyio.BrokenResourceError,
+            anyio.EndOfStream,
+        ),
+    )
+
+
+class _PooledSession:
+    """One long-lived MCP session, reconnected with backoff when it breaks."""
+
+    def __init__(self, pool: "MCPConnectionPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.session: ClientSession | None = None
+        self.in_flight = 0
+        self.ready = asyncio.Event()
+        self.broken = asyncio.Event()
+
+    def mark_broken(self, reason: str) -> None:
+        if self.ready.is_set():
+            log_event(
+                "mcp_session_broken", sample_rate=1.0, session=self.index, reason=reason
+            )
+        self.ready.clear()
+        self.broken.set()
+
+    async def _open(self, stack: AsyncExitStack) -> ClientSession:
+        if self.pool.transport == "sse":
+            client = sse_client(self.pool.url, timeout=self.pool.connect_timeout)
+        else:
+            client = streamablehttp_client(
+                self.pool.url, timeout=self.pool.connect_timeout
+            )
+        read, write, *_ = await stack.enter_async_context(client)
+        session = await stack.enter_async_context(ClientSession(read, write))
+        await asyncio.wait_for(session.initialize(), self.pool.connect_timeout)
+        return session
+
+    async def run(self) -> None:
+        """Keep the session connected until the pool is stopped."""
+        backoff = self.pool.initial_backoff
+        while not self.pool.stopping:
+            try:
+                async with AsyncExitStack() as stack:
+                    self.session = await self._open(stack)
+                    await self.pool._on_session_ready(self.session)
+                    backoff = self.pool.initial_backoff
+                    self.broken.clear()
+                    self.ready.set()
+                    print(f"🔌 MCP session {self.index} connected to {self.pool.url}")
+                    await self.broken.wait()
+            except Exception as e:
+                log_event(
+                    "mcp_session_failed",
+                    sample_rate=1.0,
+                    session=self.index,
+                    error=repr(e),
+                )
+            finally:
+                self.session = None
+                self.ready.clear()
+
+            if self.pool.stopping:
+                break
+
+            delay = backoff * (1 + random.random() * 0.25)
+            log_event(
+                "mcp_session_reconnecting",
+                sample_rate=1.0,
+                session=self.index,
+                seconds=round(delay, 1),
+            )
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, self.pool.max_backoff)
+
+
+class MCPConnectionPool:
+    """A fixed-size pool of persistent MCP sessions shared by every crew.
+
+    The sessions live on a dedicated event loop running in a background thread.
+    They are kept alive by periodic pings and reconnected with exponential
+    backoff when the server goes away. The tool schemas are listed once and
+    adapted to CrewAI tools that route their calls through the pool. Tool
+    results are served from the tool result cache when they are in it, and
+    slow calls are hedged with a duplicate on another session.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        transport: str = "streamable-http",
+        size: int = 2,
+        health_check_interval: float = 30.0,
+        connect_timeout: float = 30.0,
+        call_timeout: float = 60.0,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.url = url
+        self.transport = transport
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.call_timeout = call_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.stopping = False
+        self._sessions: list[_PooledSession] = []
+        self._tool_specs: list[Tool] | None = None
+        self._tools: list[BaseTool] | None = None
+        self._tools_ready: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._background: list[asyncio.Task] = []
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the background loop and open the sessions."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever, name="mcp-pool", daemon=True
+            )
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    async def _start(self) -> None:
+        self._tools_ready = asyncio.Event()
+        self._sessions = [_PooledSession(self, index) for index in range(self.size)]
+        self._background = [
+            asyncio.create_task(session.run()) for session in self._sessions
+        ]
+        self._background.append(asyncio.create_task(self._health_check()))
+
+    def stop(self) -> None:
+        """Close every session and stop the background loop."""
+        if self._thread is None:
+            return
+
+        self.stopping = True
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result(
+            timeout=self.connect_timeout
+        )
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=self.connect_timeout)
+        self._thread = None
+        # The pool can be started again
+        self.stopping = False
+
+    async def _stop(self) -> None:
+        for pooled in self._sessions:
+            pooled.broken.set()
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+
+    async def _on_session_ready(self, session: ClientSession) -> None:
+        """List the server tools once, the first time a session connects."""
+        if self._tool_specs is not None:
+            return
+
+        specs: list[Tool] = []
+        cursor = None
+        while True:
+            result = await session.list_tools(cursor)
+            specs.extend(result.tools)
+            cursor = result.nextCursor
+            if not cursor:
+                break
+
+        self._tool_specs = specs
+        self._tools_ready.set()
+
+    async def _health_check(self) -> None:
+        """Ping every connected session, which also keeps them alive."""
+        while not self.stopping:
+            await asyncio.sleep(self.health_check_interval)
+            for pooled in self._sessions:
+                if not pooled.ready.is_set() or pooled.session is None:
+                    continue
+                try:
+                    await asyncio.wait_for(
+                        pooled.session.send_ping(), self.connect_timeout
+                    )
+                except Exception as e:
+                    pooled.mark_broken(f"health check failed: {e!r}")
+
+    async def _acquire(self) -> _PooledSession:
+        """Pick the connected session with the fewest calls in flight."""
+        ready = [pooled for pooled in self._sessions if pooled.ready.is_set()]
+        if not ready:
+            waiters = [
+                asyncio.create_task(pooled.ready.wait()) for pooled in self._sessions
+            ]
+            try:
+                await asyncio.wait(
+                    waiters,
+                    timeout=self.connect_timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+            ready = [pooled for pooled in self._sessions if pooled.ready.is_set()]
+            if not ready:
+                raise MCPPoolUnavailableError(
+                    f"No MCP session to {self.url} available after {self.connect_timeout}s"
+                )
+
+        return min(ready, key=lambda pooled: pooled.in_flight)
+
+    async def _call_tool(self, name: str, arguments: dict | None) -> CallToolResult:
+        cache = get_tool_cache()
+        if cache is None:
+            return await self._call_tool_uncached(name, arguments)
+
+        # The retrieval module imports the pool
+        from small_size_league_expert.retrieval import mcp_tool_source
+
+        return await cache.acall(
+            f"mcp:{name}",
+            arguments or {},
+            lambda: self._call_tool_uncached(name, arguments),
+            source=mcp_tool_source(name),
+            encode=CallToolResult.model_dump_json,
+            decode=CallToolResult.model_validate_json,
+            keep=lambda result: not result.isError,
+        )
+
+    async def _call_tool_uncached(
+        self, name: str, arguments: dict | None
+    ) -> CallToolResult:
+        with tool_call(f"mcp:{name}"):
+            hedger = get_hedger()
+            if hedger is None:
+                return await self._call_tool_with_retry(name, arguments)
+            return await hedger.call(
+                f"mcp:{name}", lambda: self._call_tool_with_retry(name, arguments)
+            )
+
+    async def _call_tool_with_retry(
+        self, name: str, arguments: dict | None
+    ) -> CallToolResult:
+        # A call that fails on a broken connection is retried once on another
+        # session, so a server restart does not fail the question.
+        for attempt in range(2):
+            pooled = await self._acquire()
+            pooled.in_flight += 1
+            try:
+                return await pooled.session.call_tool(
+                    name,
+                    arguments,
+                    read_timeout_seconds=timedelta(
+                        seconds=max(time_left(self.call_timeout), 0.001)
+                    ),
+                )
+            except McpError:
+                # The server answered with an error or the call timed out, the
+                # session itself is fine
+                raise
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                pooled.mark_broken(f"call to '{name}' failed: {e!r}")
+                if attempt == 1:
+                    raise
+            finally:
+                pooled.in_flight -= 1
+
+    async def acall_tool(
+        self, name: str, arguments: dict | None = None
+    ) -> CallToolResult:
+        """Call an MCP tool from any event loop."""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(
+            self._call_tool(name, arguments), self._loop
+        )
+        return await asyncio.wrap_future(future)
+
+    def call_tool(self, name: str, arguments: dict | None = None) -> CallToolResult:
+        """Call an MCP tool from a synchronous context, such as a crew run.
+
+        Once the time budget of the question is spent, the agent calling the
+        tool is told to give its final answer instead.
+        """
+        self.start()
+        timeout = time_left(
+            self.connect_timeout + 2 * self.call_timeout, answer_reserve()
+        )
+        if timeout <= 0:
+            return CallToolResult(
+                content=[TextContent(type="text", text=BUDGET_SPENT_MESSAGE)],
+                isError=True,
+            )
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._call_tool(name, arguments), self._loop
+        )
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def _wait_for_tools(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._tools_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def get_tools(
+        self, *tool_names: str, timeout: float | None = None
+    ) -> list[BaseTool]:
+        """Get the MCP tools as CrewAI tools, optionally filtered by name.
+
+        Waits up to `timeout` seconds (the connect timeout by default) for the
+        first session to list the tools, and returns an empty list otherwise.
+        """
+        self.start()
+
+        if self._tools is None:
+            if self._tool_specs is None:
+                ready = asyncio.run_coroutine_threadsafe(
+                    self._wait_for_tools(
+                        self.connect_timeout if timeout is None else timeout
+                    ),
+                    self._loop,
+                ).result()
+                if not ready:
+                    print(f"⚠️ MCP tools from {self.url} are not available yet.")
+                    return []
+
+            adapter = CrewAIAdapter()
+            self._tools = [
+                adapter.adapt(partial(self.call_tool, spec.name), spec)
+                for spec in self._tool_specs
+            ]
+
+        if not tool_names:
+            return list(self._tools)
+        return [tool for tool in self._tools if tool.name in tool_names]
+
+    @property
+    def tool_specs(self) -> list[Tool]:
+        """The MCP tool definitions, empty until a session has listed them."""
+        return list(self._tool_specs or [])
+
+    @property
+    def connected(self) -> int:
+        """Number of sessions currently connected."""
+        return sum(1 for pooled in self._sessions if pooled.ready.is_set())
+
+
+_mcp_pool: MCPConnectionPool | None = None
+_mcp_pool_lock = threading.Lock()
+
+
+def get_mcp_pool() -> MCPConnectionPool:
+    """Get the process-wide MCP connection pool, creating it on first use."""
+    global _mcp_pool
+
+    with _mcp_pool_lock:
+        if _mcp_pool is None:
+            settings = get_settings()
+            _mcp_pool = MCPConnectionPool(
+                url=settings.MCP_ENDPOINT,
+                transport=settings.MCP_TRANSPORT_TYPE,
+                size=settings.MCP_POOL_SIZE,
+                health_check_interval=settings.MCP_HEALTH_CHECK_INTERVAL,
+                connect_timeout=settings.MCP_CONNECT_TIMEOUT,
+                call_timeout=settings.MCP_CALL_TIMEOUT,
+                max_backoff=settings.MCP_RECONNECT_MAX_BACKOFF,
+            )
+        return _mcp_pool
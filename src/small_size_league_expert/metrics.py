@@ -0,0 +1,418 @@
+"""Instrumentation of the crew runs.
+
+Every question records the wall time, tokens and retries of each task, and
+every tool call its latency. They feed counters and histograms exposed in the
+Prometheus text format on `METRICS_PORT`, and a sampled JSON log line.
+
+Worker processes do not serve the metrics themselves: they send what they
+recorded since the last job to the gateway (`MetricsRegistry.drain`), which
+merges it into its own registry (`MetricsRegistry.merge`).
+"""
+
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+from small_size_league_expert.settings import get_settings
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    kind: str
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: dict[tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [
+            f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def _merge(self, key: tuple[str, ...], value: float) -> None:
+        self.values[key] = self.values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{self._format_labels(key)} {value}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        # [count of each bucket, count above the last bucket, sum]
+        state = self.values.setdefault(key, [[0] * len(self.buckets), 0, 0.0])
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        else:
+            state[1] += 1
+        state[2] += value
+
+    def _merge(self, key: tuple[str, ...], value: list) -> None:
+        state = self.values.setdefault(key, [[0] * len(self.buckets), 0, 0.0])
+        state[0] = [a + b for a, b in zip(state[0], value[0])]
+        state[1] += value[1]
+        state[2] += value[2]
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, (counts, overflow, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = self._format_labels(key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            count = cumulative + overflow
+            labels = self._format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of a process, safe to update from any thread."""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self._register(Counter(name, documentation, tuple(labels)))
+
+    def histogram(
+        self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, tuple(labels), buckets))
+
+    def _register(self, metric: Metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def inc(self, counter: Counter, amount: float = 1, **labels: str) -> None:
+        with self._lock:
+            counter.inc(amount, **labels)
+
+    def observe(self, histogram: Histogram, value: float, **labels: str) -> None:
+        with self._lock:
+            histogram.observe(value, **labels)
+
+    def drain(self) -> dict[str, dict]:
+        """Take the values recorded so far, leaving the metrics empty."""
+        with self._lock:
+            values = {
+                name: metric.values
+                for name, metric in self._metrics.items()
+                if metric.values
+            }
+            for metric in self._metrics.values():
+                metric.values = {}
+        return values
+
+    def merge(self, values: dict[str, dict]) -> None:
+        """Add the values drained from the registry of another process."""
+        with self._lock:
+            for name, metric_values in values.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in metric_values.items():
+                    metric._merge(key, value)
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+QUESTION_SECONDS = REGISTRY.histogram(
+    "ssl_expert_question_seconds",
+    "Wall time of a crew run, by outcome.",
+    ("outcome",),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "ssl_expert_stage_seconds",
+    "Wall time of each task, run locally or by its agent.",
+    ("stage", "mode"),
+)
+STAGE_TOKENS = REGISTRY.histogram(
+    "ssl_expert_stage_tokens",
+    "LLM tokens spent by each task on a question.",
+    ("stage", "kind"),
+    TOKEN_BUCKETS,
+)
+STAGE_RETRIES = REGISTRY.counter(
+    "ssl_expert_stage_retries_total",
+    "Retries of the agent or the guardrail of each task.",
+    ("stage",),
+)
+STRUCTURED_OUTPUTS = REGISTRY.counter(
+    "ssl_expert_structured_outputs_total",
+    "Structured outputs of each stage, by outcome (parsed, repaired locally, converted with another LLM call, or failed).",
+    ("stage", "outcome"),
+)
+LLM_FAILURES = REGISTRY.counter(
+    "ssl_expert_llm_failures_total",
+    "Failed LLM calls, by task.",
+    ("stage",),
+)
+TOOL_CALLS = REGISTRY.counter(
+    "ssl_expert_tool_calls_total",
+    "Tool calls, by tool and outcome.",
+    ("tool", "outcome"),
+)
+TOOL_SECONDS = REGISTRY.histogram(
+    "ssl_expert_tool_call_seconds",
+    "Latency of the tool calls.",
+    ("tool",),
+)
+TOOL_CACHE_LOOKUPS = REGISTRY.counter(
+    "ssl_expert_tool_cache_lookups_total",
+    "Lookups of the tool result cache, by tool and outcome (memory, disk, coalesced or miss).",
+    ("tool", "outcome"),
+)
+TOOL_HEDGES = REGISTRY.counter(
+    "ssl_expert_tool_hedges_total",
+    "Duplicate tool calls sent after the p95 latency, by tool and outcome (sent, primary_won or hedge_won).",
+    ("tool", "outcome"),
+)
+DEADLINE_FALLBACKS = REGISTRY.counter(
+    "ssl_expert_deadline_fallbacks_total",
+    "Stages that handed over a degraded output because the time budget of the question was spent, by stage.",
+    ("stage",),
+)
+LLM_CACHE_LOOKUPS = REGISTRY.counter(
+    "ssl_expert_llm_cache_lookups_total",
+    "Lookups of the LLM completion cache, by model and outcome.",
+    ("model", "outcome"),
+)
+MICROBATCH_SIZE = REGISTRY.histogram(
+    "ssl_expert_microbatch_size",
+    "Requests sent together in a batched stage LLM call, by stage.",
+    ("stage",),
+    (1, 2, 4, 8, 16, 32),
+)
+STARTUP_SECONDS = REGISTRY.histogram(
+    "ssl_expert_startup_seconds",
+    "Time from the start of a gateway or worker process until it can answer, by phase.",
+    ("component", "phase"),
+)
+
+
+@dataclass
+class StageMetrics:
+    stage: str
+    mode: str
+    seconds: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+
+
+@dataclass
+class RunMetrics:
+    """What a single question cost, stage by stage."""
+
+    question: str
+    outcome: str = "ok"
+    seconds: float = 0.0
+    stages: list[StageMetrics] = field(default_factory=list)
+    tool_calls: dict[str, int] = field(default_factory=dict)
+    tool_seconds: dict[str, float] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def record_tool_call(self, tool: str, seconds: float) -> None:
+        self.tool_calls[tool] = self.tool_calls.get(tool, 0) + 1
+        self.tool_seconds[tool] = self.tool_seconds.get(tool, 0.0) + seconds
+
+    def observe(self) -> None:
+        """Add the run to the histograms and log it, if sampled."""
+        self.seconds = time.perf_counter() - self.started
+        REGISTRY.observe(QUESTION_SECONDS, self.seconds, outcome=self.outcome)
+        for stage in self.stages:
+            REGISTRY.observe(
+                STAGE_SECONDS, stage.seconds, stage=stage.stage, mode=stage.mode
+            )
+            if stage.mode == "agent" or stage.prompt_tokens:
+                for kind in ("prompt", "completion"):
+                    REGISTRY.observe(
+                        STAGE_TOKENS,
+                        getattr(stage, f"{kind}_tokens"),
+                        stage=stage.stage,
+                        kind=kind,
+                    )
+            if stage.retries:
+                REGISTRY.inc(STAGE_RETRIES, stage.retries, stage=stage.stage)
+
+        data = asdict(self)
+        data.pop("started")
+        log_event("crew_run", **data)
+
+
+# The run of the current question, inherited by the threads and event loop
+# tasks started on its behalf
+_current_run: ContextVar[RunMetrics | None] = ContextVar("current_run", default=None)
+
+
+@contextmanager
+def track_run(question: str) -> Iterator[RunMetrics]:
+    """Record the tool calls made while answering a question."""
+    _count_llm_failures()
+    run = RunMetrics(question=question)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+@contextmanager
+def tool_call(tool: str) -> Iterator[None]:
+    """Count and time a call to a tool, failed or not."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.inc(TOOL_CALLS, tool=tool, outcome=outcome)
+        REGISTRY.observe(TOOL_SECONDS, elapsed, tool=tool)
+        run = _current_run.get()
+        if run is not None:
+            run.record_tool_call(tool, elapsed)
+
+
+_counting_llm_failures = False
+_counting_llm_failures_lock = threading.Lock()
+
+
+def _count_llm_failures() -> None:
+    """Count the failed LLM calls of the crews of this process.
+
+    Registered on the first run only, so the gateway, which runs no crew, does
+    not have to import crewai.
+    """
+    global _counting_llm_failures
+
+    with _counting_llm_failures_lock:
+        if _counting_llm_failures:
+            return
+
+        from crewai.utilities.events import crewai_event_bus
+        from crewai.utilities.events.llm_events import LLMCallFailedEvent
+
+        @crewai_event_bus.on(LLMCallFailedEvent)
+        def _count_llm_failure(source, event: LLMCallFailedEvent) -> None:
+            REGISTRY.inc(LLM_FAILURES, stage=event.task_name or "")
+
+        _counting_llm_failures = True
+
+
+def log_event(event: str, sample_rate: float | None = None, **fields) -> None:
+    """Print an event as a JSON line, for a sample of the calls only."""
+    if sample_rate is None:
+        sample_rate = get_settings().LOG_SAMPLE_RATE
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        return
+
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "event": event,
+        **fields,
+    }
+    print(json.dumps(record, default=str, ensure_ascii=False))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Scrapes are not worth a line each
+        pass
+
+
+_server: ThreadingHTTPServer | None = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int | None = None) -> None:
+    """Serve the metrics on http://0.0.0.0:<port>/metrics from a background thread."""
+    global _server
+
+    port = get_settings().METRICS_PORT if port is None else port
+    with _server_lock:
+        if _server is not None or port <= 0:
+            return
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            print(f"⚠️ Could not serve the metrics on port {port}: {e}")
+            return
+
+    threading.Thread(
+        target=_server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    print(f"📈 Serving the metrics on http://0.0.0.0:{port}/metrics")
@@ -0,0 +1,151 @@
+"""Micro-batching of the stage LLM calls of concurrent crews.
+
+Crews answering questions at the same time each send the question analysis
+(and, in the "llm" ranking mode, the ranking) prompt on their own, repeating
+the same instructions. The batcher collects the compatible requests of a stage
+for a short window and sends them as a single multi-item LLM call, then hands
+each crew its own result. Requests are compatible when they go to the same
+stage and model. The token usage of a batched call is split back across its
+requests by prompt size, so each crew reports its own share.
+"""
+
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Hashable, Iterator, TypeVar
+
+from small_size_league_expert.metrics import MICROBATCH_SIZE, REGISTRY, log_event
+from small_size_league_expert.settings import get_settings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _Batch:
+    def __init__(self):
+        self.items: list[tuple[object, Future]] = []
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    """Groups the requests submitted within `window` seconds into one call.
+
+    The first request of a batch waits for the window to close, or for the
+    batch to reach `max_items`, then runs the batched call for everyone. The
+    others wait for their result. The batch is also sent at once when every
+    running crew of the process (`crew`) is in it, so a lone crew never
+    waits. When the batched call fails, every request of the batch gets None
+    and makes its own call.
+    """
+
+    def __init__(self, window: float = 0.05, max_items: int = 8):
+        self.window = window
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._batches: dict[Hashable, _Batch] = {}
+        self._crews = 0
+
+    @contextmanager
+    def crew(self) -> Iterator[None]:
+        """Count a crew of the process as running while in this context."""
+        with self._lock:
+            self._crews += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._crews -= 1
+
+    def submit(
+        self,
+        key: Hashable,
+        item: T,
+        run: Callable[[list[T]], list[R | None]],
+    ) -> R | None:
+        """The result of an item, computed by `run` with the items of its batch."""
+        future: Future = Future()
+        with self._lock:
+            batch = self._batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._batches[key] = _Batch()
+            batch.items.append((item, future))
+            # Every running crew is in the batch, no other request can join
+            if len(batch.items) >= min(self.max_items, max(self._crews, 1)):
+                del self._batches[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+            self._run(key, batch, run)
+        return future.result()
+
+    @staticmethod
+    def _run(key: Hashable, batch: _Batch, run: Callable) -> None:
+        items = [item for item, _ in batch.items]
+        stage = key[0] if isinstance(key, tuple) else str(key)
+        REGISTRY.observe(MICROBATCH_SIZE, len(items), stage=stage)
+        try:
+            results = list(run(items))
+        except Exception as e:
+            # Failures are always logged, they make every crew of the batch
+            # fall back to its own call
+            log_event(
+                "microbatch_failed",
+                sample_rate=1.0,
+                stage=stage,
+                requests=len(items),
+                error=repr(e),
+            )
+            results = []
+
+        if len(items) > 1:
+            log_event("microbatch", stage=stage, requests=len(items))
+        results += [None] * (len(items) - len(results))
+        for (_, future), result in zip(batch.items, results):
+            future.set_result(result)
+
+
+def split_shares(total: int, weights: list[int]) -> list[int]:
+    """Split `total` into whole shares proportional to `weights`.
+
+    The shares add up to `total`, the remainder goes to the largest
+    fractions. Requests without weight share evenly.
+    """
+    if not weights:
+        return []
+    if sum(weights) <= 0:
+        weights = [1] * len(weights)
+
+    exact = [total * weight / sum(weights) for weight in weights]
+    shares = [int(share) for share in exact]
+    by_fraction = sorted(
+        range(len(weights)), key=lambda i: exact[i] - shares[i], reverse=True
+    )
+    for index in by_fraction[: total - sum(shares)]:
+        shares[index] += 1
+    return shares
+
+
+_micro_batcher: MicroBatcher | None = None
+_micro_batcher_lock = threading.Lock()
+
+
+def get_micro_batcher() -> MicroBatcher | None:
+    """Get the process-wide micro-batcher, or None when it is disabled."""
+    global _micro_batcher
+
+    settings = get_settings()
+    if not settings.MICROBATCH_ENABLED:
+        return None
+
+    with _micro_batcher_lock:
+        if _micro_batcher is None:
+            _micro_batcher = MicroBatcher(
+                window=settings.MICROBATCH_WINDOW,
+                max_items=settings.MICROBATCH_MAX_ITEMS,
+            )
+        return _micro_batcher
@@ -84,11 +84,24 @@ class DiscordAnswer(RankResult):
         self, user_mention: str | None = None, original_question: str | None = None
     ) -> str:
         """Get the final answer in Markdown format."""
+        return self.format_message(
+            self.markdown_answer, user_mention, original_question or self.question
+        )
+
+    @staticmethod
+    def format_message(
+        markdown_answer: str,
+        user_mention: str | None = None,
+        original_question: str | None = None,
+    ) -> str:
+        """Format a Markdown answer, complete or still streaming, for Discord."""
 
         if user_mention:
-            final_answer = f'**{user_mention}**: *"{original_question or self.question}"*\n\n{self.markdown_answer}'
+            final_answer = (
+                f'**{user_mention}**: *"{original_question}"*\n\n{markdown_answer}'
+            )
         else:
-            final_answer = self.markdown_answer
+            final_answer = markdown_answer
 
         cropped_message = "... **(truncated due to size limit)**"
         message_size_limit = 2000 - len(cropped_message)
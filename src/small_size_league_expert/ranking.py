@@ -0,0 +1,282 @@
+import numpy as np
+from crewai.llms.base_llm import BaseLLM
+
+from small_size_league_expert.embeddings import Embedder, get_embedder, tokenize
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.models import Answer, Question, RankedAnswer, RankResult
+from small_size_league_expert.retrieval import (
+    MCP_SOURCE_HINTS,
+    SOURCE_RULES,
+    SOURCE_TDP,
+    SOURCE_WEBSITE,
+    SOURCE_WIKIPEDIA,
+)
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.structured import (
+    RankingReply,
+    count_output,
+    load_json,
+    with_schema,
+)
+
+RANKING_STAGE = "ranking_task"
+
+# How much each source is trusted, from the official rulebook down to Wikipedia
+SOURCE_AUTHORITY = {
+    SOURCE_RULES: 1.0,
+    SOURCE_WEBSITE: 0.85,
+    SOURCE_TDP: 0.7,
+    SOURCE_WIKIPEDIA: 0.5,
+}
+UNKNOWN_AUTHORITY = 0.6
+
+# Substrings of the references that tell which source a passage comes from
+REFERENCE_HINTS = {
+    SOURCE_WIKIPEDIA: ("wikipedia.org",),
+    SOURCE_RULES: ("ssl-rules", "sslrules", "rulebook"),
+    SOURCE_TDP: ("tdp", "team-description", "team_description"),
+    SOURCE_WEBSITE: ("ssl.robocup.org", "robocup-ssl.github.io"),
+}
+
+RANKING_PROMPT = """You rank the passages retrieved to answer questions about the RoboCup Small Size League (SSL).
+
+Prefer the passages that directly answer the question or one of its sub-questions, from the most authoritative source: the official rules, then the SSL website, team description papers and Wikipedia. Leave out the passages unrelated to the question and the ones repeating a better passage.
+
+{questions}
+
+Reply with only a JSON object whose "rankings" list holds, for each question, its number and the numbers of its best passages, best first, at most {max_results} each, e.g. {{"rankings": [{{"question": 1, "passages": [3, 1]}}, {{"question": 2, "passages": [2]}}]}}
+"""
+
+
+def source_of(references: list[str]) -> str | None:
+    """Guess the source of a passage from its references."""
+    for reference in references:
+        lowered = reference.lower()
+        if lowered.startswith("corpus://"):
+            return lowered.removeprefix("corpus://").split("/")[0]
+        if lowered.startswith("mcp://"):
+            tool = lowered.removeprefix("mcp://")
+            for source, hints in MCP_SOURCE_HINTS.items():
+                if any(hint in tool for hint in hints):
+                    return source
+            continue
+        for source, hints in REFERENCE_HINTS.items():
+            if any(hint in lowered for hint in hints):
+                return source
+    return None
+
+
+def bm25_scores(
+    queries: list[list[str]],
+    documents: list[list[str]],
+    k1: float = 1.5,
+    b: float = 0.75,
+) -> np.ndarray:
+    """Score every document against every query with BM25.
+
+    Returns a (queries, documents) matrix. Only the query terms are counted,
+    so the work is proportional to the size of the query vocabulary.
+    """
+    vocabulary = {term: i for i, term in enumerate(dict.fromkeys(sum(queries, [])))}
+    if not vocabulary or not documents:
+        return np.zeros((len(queries), len(documents)), dtype=np.float32)
+
+    frequencies = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                frequencies[row, column] += 1
+
+    lengths = np.array([len(tokens) for tokens in documents], dtype=np.float32)
+    average_length = max(float(lengths.mean()), 1.0)
+
+    containing = (frequencies > 0).sum(axis=0)
+    idf = np.log1p((len(documents) - containing + 0.5) / (containing + 0.5))
+
+    saturation = frequencies + k1 * (1 - b + b * lengths[:, None] / average_length)
+    weights = idf * frequencies * (k1 + 1) / saturation
+
+    query_terms = np.zeros((len(queries), len(vocabulary)), dtype=np.float32)
+    for row, tokens in enumerate(queries):
+        query_terms[row, [vocabulary[token] for token in set(tokens)]] = 1.0
+
+    return query_terms @ weights.T
+
+
+class LocalRanker:
+    """Ranks the retrieved passages without an LLM.
+
+    Each passage gets a relevance mixing its BM25 score against the question
+    and sub-questions with the cosine similarity of their embeddings. The
+    relevance is weighted by the authority of the source, and passages too
+    similar to a better ranked one are merged into it.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        max_results: int = 8,
+        lexical_weight: float = 0.5,
+        duplicate_threshold: float = 0.9,
+        min_relevance: float = 0.05,
+    ):
+        self.embedder = embedder
+        self.max_results = max_results
+        self.lexical_weight = lexical_weight
+        self.duplicate_threshold = duplicate_threshold
+        self.min_relevance = min_relevance
+
+    def scores(
+        self, question: Question, answers: list[Answer]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """The final score of every passage, along with the passage embeddings."""
+        queries = list(dict.fromkeys([question.question, *question.sub_questions]))
+        if question.keywords:
+            queries.append(" ".join(question.keywords))
+
+        lexical = bm25_scores(
+            [tokenize(query) for query in queries],
+            [tokenize(answer.answer) for answer in answers],
+        )
+        best = lexical.max(axis=1, keepdims=True)
+        best[best == 0] = 1.0
+        lexical = (lexical / best).max(axis=0)
+
+        query_vectors = self.embedder.embed(queries)
+        passage_vectors = self.embedder.embed([a.answer for a in answers])
+        semantic = np.clip(passage_vectors @ query_vectors.T, 0, 1).max(axis=1)
+
+        relevance = self.lexical_weight * lexical + (1 - self.lexical_weight) * semantic
+        authority = np.array(
+            [
+                SOURCE_AUTHORITY.get(source_of(a.references), UNKNOWN_AUTHORITY)
+                for a in answers
+            ],
+            dtype=np.float32,
+        )
+        scores = np.where(relevance >= self.min_relevance, relevance * authority, 0.0)
+        return scores, passage_vectors
+
+    def rank(self, question: Question, answers: list[Answer]) -> RankResult:
+        ranked: list[RankedAnswer] = []
+        if answers:
+            scores, vectors = self.scores(question, answers)
+            similarities = vectors @ vectors.T
+
+            # Near-duplicates are dropped, but their references are kept on the
+            # passage they duplicate
+            kept: dict[int, list[str]] = {}
+            for index in np.argsort(-scores, kind="stable"):
+                if scores[index] <= 0:
+                    break
+                if kept:
+                    closest = max(kept, key=lambda k: similarities[index, k])
+                    if similarities[index, closest] >= self.duplicate_threshold:
+                        references = kept[closest]
+                        references.extend(
+                            r for r in answers[index].references if r not in references
+                        )
+                        continue
+                if len(kept) < self.max_results:
+                    kept[int(index)] = list(answers[index].references)
+
+            ranked = [
+                RankedAnswer(
+                    answer=answers[index].answer, references=references, rank=position
+                )
+                for position, (index, references) in enumerate(kept.items(), start=1)
+            ]
+
+        log_event("local_ranking", passages=len(answers), ranked=len(ranked))
+        return RankResult(**question.model_dump(), ranked_answers=ranked)
+
+
+def get_local_ranker() -> LocalRanker:
+    """Build the local ranker configured by the settings."""
+    settings = get_settings()
+    return LocalRanker(
+        embedder=get_embedder(),
+        max_results=settings.RANKING_MAX_RESULTS,
+        lexical_weight=settings.RANKING_LEXICAL_WEIGHT,
+        duplicate_threshold=settings.RANKING_DUPLICATE_THRESHOLD,
+    )
+
+
+def rank_with_llm(
+    llm: BaseLLM,
+    requests: list[tuple[Question, list[Answer]]],
+    max_results: int = 8,
+    callbacks: list | None = None,
+) -> list[RankResult | None]:
+    """Rank the passages of one or more questions with a single compact LLM call.
+
+    The LLM only picks the numbers of the best passages, which are copied
+    into the result. The result of a question is None when the reply has
+    nothing usable for it.
+    """
+    blocks = []
+    for number, (question, answers) in enumerate(requests, start=1):
+        passages = "\n".join(
+            f"[{index}] {answer.answer}" for index, answer in enumerate(answers, 1)
+        )
+        blocks.append(
+            f"## Question {number}: {question.question}\n"
+            f"Sub-questions: {'; '.join(question.sub_questions)}\n"
+            f"Passages:\n{passages}"
+        )
+    prompt = RANKING_PROMPT.format(
+        questions="\n\n".join(blocks), max_results=max_results
+    )
+
+    reply = with_schema(llm, RankingReply).call(prompt, callbacks=callbacks)
+    data, repaired = load_json(str(reply))
+    picks = _picks_of(data)
+
+    results: list[RankResult | None] = []
+    for number, (question, answers) in enumerate(requests, start=1):
+        chosen = picks.get(number)
+        if not isinstance(chosen, list):
+            count_output(RANKING_STAGE, "failed")
+            results.append(None)
+            continue
+
+        indexes = [
+            int(index) - 1
+            for index in chosen
+            if str(index).isdigit() and 0 < int(index) <= len(answers)
+        ]
+        ranked = [
+            RankedAnswer(
+                answer=answers[index].answer,
+                references=answers[index].references,
+                rank=rank,
+            )
+            for rank, index in enumerate(
+                list(dict.fromkeys(indexes))[:max_results], start=1
+            )
+        ]
+        count_output(
+            RANKING_STAGE,
+            "failed" if not ranked else "repaired" if repaired else "parsed",
+        )
+        results.append(
+            RankResult(**question.model_dump(), ranked_answers=ranked)
+            if ranked
+            else None
+        )
+    return results
+
+
+def _picks_of(data) -> dict[int, list]:
+    """The passages picked for each question number, from a ranking reply or
+    a plain mapping of the question numbers to their passages."""
+    if isinstance(data, dict) and isinstance(data.get("rankings"), list):
+        return {
+            int(ranking["question"]): ranking.get("passages")
+            for ranking in data["rankings"]
+            if isinstance(ranking, dict) and str(ranking.get("question")).isdigit()
+        }
+    if isinstance(data, dict):
+        return {int(key): value for key, value in data.items() if str(key).isdigit()}
+    return {}
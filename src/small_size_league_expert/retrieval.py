@@ -0,0 +1,539 @@
+import asyncio
+import json
+import re
+import time
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+
+from mcp.types import CallToolResult, TextContent, Tool
+
+from small_size_league_expert.background import get_background_loop, run_in_background
+from small_size_league_expert.corpus import CorpusIndex, get_corpus_index
+from small_size_league_expert.deadline import answer_reserve, time_left
+from small_size_league_expert.embeddings import tokenize
+from small_size_league_expert.mcp_pool import MCPConnectionPool
+from small_size_league_expert.metrics import log_event, tool_call
+from small_size_league_expert.models import Answer, Question, RetrieverResult
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.tools import WikipediaSearchTool
+
+SOURCE_RULES = "rules"
+SOURCE_WEBSITE = "website"
+SOURCE_TDP = "tdp"
+SOURCE_WIKIPEDIA = "wikipedia"
+
+# Substrings of the MCP tool names that tell which source a tool searches
+MCP_SOURCE_HINTS = {
+    SOURCE_RULES: ("rule",),
+    SOURCE_TDP: ("tdp", "paper", "team_description"),
+    SOURCE_WEBSITE: ("website", "site", "web"),
+}
+
+_URL_PATTERN = re.compile(r"https?://[^\s)\]>\"']+")
+_TEXT_KEYS = ("content", "text", "answer", "snippet", "chunk", "body")
+_REFERENCE_KEYS = ("url", "source", "link", "reference", "href")
+
+_search_limiters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_search_limiter(max_concurrency: int) -> asyncio.Semaphore:
+    """The limit of concurrent searches shared by every fan-out of the running
+    loop, so concurrent questions do not multiply the load on the sources."""
+    loop = asyncio.get_running_loop()
+    limiter = _search_limiters.get(loop)
+    if limiter is None:
+        limiter = _search_limiters[loop] = asyncio.Semaphore(max_concurrency)
+    return limiter
+
+
+class RetrievalSource(ABC):
+    """A knowledge source searched by the retrieval fan-out."""
+
+    name: str
+
+    def queries(self, question: Question) -> list[str]:
+        """The queries to send to this source for a question."""
+        return question.sub_questions or [question.question]
+
+    @abstractmethod
+    async def search(self, query: str) -> list[Answer]:
+        """The passages found for a query."""
+
+    def release(self) -> None:
+        """Drop what was kept for the queries of a question once it is retrieved."""
+
+
+class MCPSearchSource(RetrievalSource):
+    """Searches one MCP tool through the shared connection pool."""
+
+    def __init__(self, name: str, pool: MCPConnectionPool, tool: Tool):
+        self.name = name
+        self.pool = pool
+        self.tool = tool
+        self.argument = _query_argument(tool)
+
+    async def search(self, query: str) -> list[Answer]:
+        result = await self.pool.acall_tool(self.tool.name, {self.argument: query})
+        return answers_from_tool_result(result, f"mcp://{self.tool.name}")
+
+
+class CorpusSource(RetrievalSource):
+    """Searches one source of the offline corpus index."""
+
+    def __init__(self, name: str, index: CorpusIndex, top_k: int = 5):
+        self.name = f"corpus:{name}"
+        self.source = name
+        self.index = index
+        self.top_k = top_k
+
+    async def search(self, query: str) -> list[Answer]:
+        with tool_call("corpus"):
+            chunks = await asyncio.to_thread(
+                self.index.search, query, self.top_k, [self.source]
+            )
+        return [chunk.to_answer() for chunk in chunks]
+
+
+class WikipediaSource(RetrievalSource):
+    """Looks up the Wikipedia articles named after the question keywords.
+
+    The Wikipedia API looks articles up by title, so the keywords make better
+    queries than the full sub-questions. All of them are fetched in parallel,
+    keeping only the sections that match the question.
+    """
+
+    name = SOURCE_WIKIPEDIA
+
+    def __init__(self, max_keywords: int = 5):
+        self.max_keywords = max_keywords
+        self.tool = WikipediaSearchTool()
+        self._terms: dict[str, list[str]] = {}
+
+    def queries(self, question: Question) -> list[str]:
+        titles = question.keywords[: self.max_keywords]
+        if not titles:
+            return []
+
+        query = "|".join(titles)
+        self._terms[query] = [question.question, *question.sub_questions, *titles]
+        return [query]
+
+    async def search(self, query: str) -> list[Answer]:
+        articles = await self.tool.afetch(
+            query.split("|"), "en", self._terms.pop(query, None)
+        )
+        return [
+            Answer(answer=article.to_text(), references=[article.url])
+            for article in articles
+            if article.sections
+        ]
+
+    def release(self) -> None:
+        # Queries covered otherwise, or skipped when out of time, never searched
+        self._terms.clear()
+
+
+def _query_argument(tool: Tool) -> str:
+    """Pick the argument of an MCP tool that receives the search text."""
+    properties = tool.inputSchema.get("properties", {})
+    if "query" in properties:
+        return "query"
+
+    for name in tool.inputSchema.get("required", []):
+        if properties.get(name, {}).get("type") == "string":
+            return name
+    for name, schema in properties.items():
+        if schema.get("type") == "string":
+            return name
+    return "query"
+
+
+def answers_from_tool_result(
+    result: CallToolResult, fallback_reference: str
+) -> list[Answer]:
+    """Turn an MCP tool result into retrieved passages.
+
+    JSON results holding a list of documents give one passage per document.
+    Any other text becomes a single passage referenced by the URLs it contains.
+    """
+    if result.isError:
+        return []
+
+    texts = [item.text for item in result.content if isinstance(item, TextContent)]
+    answers: list[Answer] = []
+    for text in texts:
+        try:
+            documents = json.loads(text)
+        except ValueError:
+            documents = None
+
+        if isinstance(documents, dict):
+            documents = documents.get("results", [documents])
+
+        if isinstance(documents, list) and all(isinstance(d, dict) for d in documents):
+            for document in documents:
+                content = next(
+                    (document[k] for k in _TEXT_KEYS if document.get(k)), None
+                )
+                if not content:
+                    continue
+                references = [
+                    str(document[k]) for k in _REFERENCE_KEYS if document.get(k)
+                ]
+                answers.append(
+                    Answer(
+                        answer=str(content),
+                        references=references or [fallback_reference],
+                    )
+                )
+        elif text.strip():
+            answers.append(answer_from_text(text, fallback_reference))
+
+    return answers
+
+
+def answer_from_text(text: str, fallback_reference: str) -> Answer:
+    """A passage referenced by the URLs its text contains."""
+    references = list(dict.fromkeys(_URL_PATTERN.findall(text)))
+    return Answer(answer=text, references=references or [fallback_reference])
+
+
+def query_overlap(query: str, passage: str) -> float:
+    """Share of the content words of a query found in a passage."""
+    terms = set(tokenize(query))
+    if not terms:
+        return 0.0
+    return len(terms & set(tokenize(passage))) / len(terms)
+
+
+def merge_answers(answers: list[Answer]) -> list[Answer]:
+    """Merge passages with the same text, keeping all of their references."""
+    merged: dict[str, Answer] = {}
+    for answer in answers:
+        key = " ".join(answer.answer.lower().split())
+        if key in merged:
+            references = merged[key].references
+            references.extend(r for r in answer.references if r not in references)
+        else:
+            merged[key] = Answer(
+                answer=answer.answer, references=list(dict.fromkeys(answer.references))
+            )
+    return list(merged.values())
+
+
+class SpeculativeRetrieval:
+    """A fan-out started before the question analysis is over.
+
+    Its question comes from the local analysis of the raw question: the
+    question itself as the only sub-question, and the local keywords. Each
+    (source, query) search is its own future, so the analyzed question can
+    use each one as soon as it is done.
+    """
+
+    def __init__(self, fanout: "RetrievalFanout", question: Question):
+        self.fanout = fanout
+        self.question = question
+        loop = get_background_loop()
+        self.searches: dict[tuple[str, str], Future] = {
+            (source.name, query): asyncio.run_coroutine_threadsafe(
+                fanout._search(source, query), loop
+            )
+            for source, query in fanout._pairs(question)
+        }
+
+    def cancel(self) -> None:
+        for future in self.searches.values():
+            future.cancel()
+
+
+class RetrievalFanout:
+    """Queries every source for every sub-question concurrently.
+
+    Each (query, source) search runs under a concurrency limit shared by every
+    fan-out of the process (`get_search_limiter`) and its own timeout, which
+    ends before the answer reserve of the question deadline.
+    Failed or slow searches are skipped, and the passages of the others are
+    merged into a single `RetrieverResult`.
+
+    The fan-out can also be started speculatively from the raw question
+    (`speculate`). The analyzed question then waits for the speculative
+    searches of its own queries, searches the other queries right away, and
+    keeps the passages of the speculative searches already done that match
+    them. The passages of a previous question (`reuse`) cover queries too.
+    """
+
+    def __init__(
+        self,
+        sources: list[RetrievalSource],
+        max_concurrency: int = 8,
+        source_timeout: float = 20.0,
+        min_overlap: float = 0.5,
+    ):
+        self.sources = sources
+        self.max_concurrency = max_concurrency
+        self.source_timeout = source_timeout
+        self.min_overlap = min_overlap
+
+    def _pairs(self, question: Question) -> list[tuple[RetrievalSource, str]]:
+        """The (source, query) searches of a question."""
+        return [
+            (source, query)
+            for source in self.sources
+            for query in dict.fromkeys(source.queries(question))
+        ]
+
+    async def _search(self, source: RetrievalSource, query: str) -> list[Answer]:
+        async with get_search_limiter(self.max_concurrency):
+            timeout = time_left(self.source_timeout, answer_reserve())
+            if timeout <= 0:
+                # Out of time, the passages found so far will do
+                return []
+
+            started = time.perf_counter()
+            try:
+                answers = await asyncio.wait_for(source.search(query), timeout)
+            except asyncio.TimeoutError:
+                log_event(
+                    "retrieval_timeout",
+                    source=source.name,
+                    query=query,
+                    seconds=round(timeout, 1),
+                )
+                return []
+            except Exception as e:
+                log_event(
+                    "retrieval_failed",
+                    sample_rate=1.0,
+                    source=source.name,
+                    query=query,
+                    error=repr(e),
+                )
+                return []
+
+            log_event(
+                "retrieval_search",
+                source=source.name,
+                query=query,
+                passages=len(answers),
+                seconds=round(time.perf_counter() - started, 3),
+            )
+            return answers
+
+    async def _reconcile(
+        self, source: RetrievalSource, query: str, speculative: Future | None
+    ) -> tuple[list[Answer], bool]:
+        """The passages of a search, from the speculative search of the same
+        query when it found any, and whether they were searched again."""
+        if speculative is not None:
+            try:
+                answers = await asyncio.wrap_future(speculative)
+            except (Exception, asyncio.CancelledError) as e:
+                log_event(
+                    "speculative_retrieval_failed",
+                    sample_rate=1.0,
+                    source=source.name,
+                    query=query,
+                    error=repr(e),
+                )
+                answers = []
+            if answers:
+                return answers, False
+        return await self._search(source, query), True
+
+    def _harvest(
+        self, question: Question, searches: dict[tuple[str, str], Future]
+    ) -> list[Answer]:
+        """The passages of the speculative searches already done that match
+        the queries of the question. The searches still running are cancelled."""
+        kept: list[Answer] = []
+        for source in self.sources:
+            queries = list(dict.fromkeys(source.queries(question)))
+            for (name, _), future in searches.items():
+                if name != source.name:
+                    continue
+                if not future.done():
+                    future.cancel()
+                    continue
+                if future.cancelled() or future.exception() is not None:
+                    continue
+                kept += [
+                    answer
+                    for answer in future.result()
+                    if any(
+                        query_overlap(query, answer.answer) >= self.min_overlap
+                        for query in queries
+                    )
+                ]
+        return kept
+
+    def _reuse(
+        self, question: Question, passages: list[Answer], required: list[str]
+    ) -> tuple[list[Answer], set[tuple[str, str]]]:
+        """The passages of a previous question matching the queries of this
+        one, and the (source, query) searches they cover.
+
+        A passage covers a query of its own source when it matches the query
+        and mentions every `required` term, the ones the previous question
+        did not ask about.
+        """
+        # Imported here, the ranking module imports this one
+        from small_size_league_expert.ranking import source_of
+
+        required = [term.lower() for term in required]
+        candidates = [
+            (passage, source_of(passage.references))
+            for passage in passages
+            if all(term in passage.answer.lower() for term in required)
+        ]
+
+        kept: list[Answer] = []
+        covered: set[tuple[str, str]] = set()
+        for source in self.sources:
+            name = source.name.removeprefix("corpus:")
+            for query in dict.fromkeys(source.queries(question)):
+                matching = [
+                    passage
+                    for passage, passage_source in candidates
+                    if passage_source in (None, name)
+                    and query_overlap(query, passage.answer) >= self.min_overlap
+                ]
+                if matching:
+                    covered.add((source.name, query))
+                    kept += matching
+        return kept, covered
+
+    async def aretrieve(
+        self,
+        question: Question,
+        speculation: SpeculativeRetrieval | None = None,
+        reuse: list[Answer] | None = None,
+        required: list[str] | None = None,
+    ) -> RetrieverResult:
+        try:
+            return await self._aretrieve(question, speculation, reuse, required)
+        finally:
+            for source in self.sources:
+                source.release()
+
+    async def _aretrieve(
+        self,
+        question: Question,
+        speculation: SpeculativeRetrieval | None = None,
+        reuse: list[Answer] | None = None,
+        required: list[str] | None = None,
+    ) -> RetrieverResult:
+        kept: list[Answer] = []
+        covered: set[tuple[str, str]] = set()
+        if reuse:
+            kept, covered = self._reuse(question, reuse, required or [])
+        reused = len(kept)
+
+        searches = dict(speculation.searches) if speculation is not None else {}
+        pairs = [
+            (source, query)
+            for source, query in self._pairs(question)
+            if (source.name, query) not in covered
+        ]
+        results = await asyncio.gather(
+            *(
+                self._reconcile(source, query, searches.pop((source.name, query), None))
+                for source, query in pairs
+            )
+        )
+        searched = sum(again for _, again in results)
+        if speculation is not None:
+            harvested = self._harvest(question, searches)
+            log_event(
+                "speculation_reconciled",
+                kept=len(pairs) - searched,
+                harvested=len(harvested),
+                searched=searched,
+            )
+            kept += harvested
+        if reuse:
+            log_event("session_reuse", reused=reused, searched=searched)
+        return RetrieverResult(
+            results=merge_answers(
+                kept + [answer for answers, _ in results for answer in answers]
+            )
+        )
+
+    def retrieve(
+        self,
+        question: Question,
+        speculation: SpeculativeRetrieval | None = None,
+        reuse: list[Answer] | None = None,
+        required: list[str] | None = None,
+    ) -> RetrieverResult:
+        """Run the fan-out from synchronous code, such as a crew task."""
+        return run_in_background(self.aretrieve(question, speculation, reuse, required))
+
+    def speculate(self, question: Question) -> SpeculativeRetrieval:
+        """Start searching for a preliminary question in the background."""
+        return SpeculativeRetrieval(self, question)
+
+
+def mcp_tool_source(tool_name: str) -> str | None:
+    """The source an MCP tool searches, from the settings or its name."""
+    for source, name in get_settings().RETRIEVAL_MCP_TOOLS.items():
+        if name == tool_name:
+            return source
+    return next(
+        (
+            source
+            for source, hints in MCP_SOURCE_HINTS.items()
+            if any(hint in tool_name.lower() for hint in hints)
+        ),
+        None,
+    )
+
+
+def mcp_sources(pool: MCPConnectionPool) -> list[RetrievalSource]:
+    """Map the MCP tools to the rules, website and TDP sources.
+
+    `Settings.RETRIEVAL_MCP_TOOLS` can name the tool of each source explicitly,
+    otherwise the tools are matched by name.
+    """
+    overrides = get_settings().RETRIEVAL_MCP_TOOLS
+    specs = {spec.name: spec for spec in pool.tool_specs}
+
+    sources: list[RetrievalSource] = []
+    for source_name, hints in MCP_SOURCE_HINTS.items():
+        tool_name = overrides.get(source_name) or next(
+            (
+                name
+                for name in specs
+                if any(hint in name.lower() for hint in hints)
+                and not any(name == s.tool.name for s in sources)
+            ),
+            None,
+        )
+        if tool_name in specs:
+            sources.append(MCPSearchSource(source_name, pool, specs[tool_name]))
+    return sources
+
+
+def corpus_sources(index: CorpusIndex) -> list[RetrievalSource]:
+    """One source for each kind of document in the offline corpus index."""
+    top_k = get_settings().CORPUS_TOP_K
+    return [CorpusSource(name, index, top_k) for name in sorted(index.sources())]
+
+
+def build_retrieval_fanout(pool: MCPConnectionPool) -> RetrievalFanout | None:
+    """Build the fan-out over the MCP sources, the offline corpus and Wikipedia.
+
+    Returns None when neither the MCP sources nor the corpus are available, so
+    the retriever agent can still try on its own.
+    """
+    sources = mcp_sources(pool) + corpus_sources(get_corpus_index())
+    if not sources:
+        return None
+
+    settings = get_settings()
+    return RetrievalFanout(
+        sources=[*sources, WikipediaSource()],
+        max_concurrency=settings.RETRIEVAL_MAX_CONCURRENCY,
+        source_timeout=settings.RETRIEVAL_SOURCE_TIMEOUT,
+        min_overlap=settings.RETRIEVAL_SPECULATIVE_MIN_OVERLAP,
+    )
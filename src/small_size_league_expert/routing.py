@@ -0,0 +1,152 @@
+"""Routing of the LLM calls of each agent to a fast or a large model.
+
+Every agent gets a model tier from `Settings.AGENT_MODELS`: the fast tier
+(`FAST_MODEL`) for the cheap stages, the large tier (`MODEL`) for the others,
+or "auto", which picks the large tier only for complex questions. When a model
+is rate limited, its calls go to the model of the other tier until its
+cooldown is over.
+"""
+
+import threading
+import time
+
+from crewai import LLM
+
+from small_size_league_expert.analysis import is_complex_question
+from small_size_league_expert.llm_cache import CachedCompletions
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.models import Question
+from small_size_league_expert.settings import Settings, get_settings
+
+FAST_TIER = "fast"
+LARGE_TIER = "large"
+AUTO_TIER = "auto"
+
+# Models that answered with a rate limit error, and until when to avoid them
+_limited_until: dict[str, float] = {}
+_limited_lock = threading.Lock()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an LLM call failed because the provider rate limited it.
+
+    Streaming calls re-raise every error as a plain `Exception`, so the
+    message is checked as well as the type.
+    """
+    import litellm
+
+    if isinstance(error, litellm.exceptions.RateLimitError):
+        return True
+    message = str(error).lower()
+    return "ratelimiterror" in message or "rate limit" in message
+
+
+def mark_rate_limited(model: str, seconds: float) -> None:
+    with _limited_lock:
+        _limited_until[model] = time.monotonic() + seconds
+
+
+def is_rate_limited(model: str) -> bool:
+    with _limited_lock:
+        return _limited_until.get(model, 0.0) > time.monotonic()
+
+
+class FallbackLLM(CachedCompletions, LLM):
+    """An LLM that hands its calls to another model while it is rate limited.
+
+    The completions of both models are served from the completion cache when
+    it has them.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        fallback: "FallbackLLM | None" = None,
+        cooldown: float = 30.0,
+        **kwargs,
+    ):
+        super().__init__(model=model, **kwargs)
+        self.fallback = fallback
+        self.cooldown = cooldown
+
+    def call(
+        self,
+        messages,
+        tools=None,
+        callbacks=None,
+        available_functions=None,
+        from_task=None,
+        from_agent=None,
+    ):
+        arguments = dict(
+            tools=tools,
+            callbacks=callbacks,
+            available_functions=available_functions,
+            from_task=from_task,
+            from_agent=from_agent,
+        )
+        if (
+            self.fallback is not None
+            and is_rate_limited(self.model)
+            and not is_rate_limited(self.fallback.model)
+        ):
+            return self.fallback.call(messages, **arguments)
+
+        try:
+            return super().call(messages, **arguments)
+        except Exception as e:
+            if self.fallback is None or not is_rate_limit_error(e):
+                raise
+            mark_rate_limited(self.model, self.cooldown)
+            log_event(
+                "model_rate_limited",
+                sample_rate=1.0,
+                model=self.model,
+                fallback=self.fallback.model,
+                seconds=self.cooldown,
+            )
+            return self.fallback.call(messages, **arguments)
+
+
+def model_of(tier: str, settings: Settings) -> str:
+    """The model of a tier, or the tier itself when it names a model."""
+    if tier == FAST_TIER:
+        return settings.FAST_MODEL or settings.MODEL
+    if tier in (LARGE_TIER, AUTO_TIER):
+        return settings.MODEL
+    return tier
+
+
+def build_llm(tier: str, stream: bool = False, settings: Settings | None = None) -> LLM:
+    """An LLM of the given tier, falling back to the other tier when rate limited."""
+    settings = settings or get_settings()
+    model = model_of(tier, settings)
+    other = settings.MODEL if model != settings.MODEL else settings.FAST_MODEL
+
+    fallback = None
+    if other and other != model:
+        # Using this to not hallucinate inside the SSL content
+        fallback = FallbackLLM(model=other, temperature=0, stream=stream)
+    return FallbackLLM(
+        model=model,
+        fallback=fallback,
+        cooldown=settings.MODEL_RATE_LIMIT_COOLDOWN,
+        temperature=0,
+        stream=stream,
+    )
+
+
+def agent_tier(agent_name: str, settings: Settings) -> str:
+    """The model tier configured for an agent, the large one by default."""
+    return settings.AGENT_MODELS.get(agent_name, LARGE_TIER)
+
+
+def tier_for_question(tier: str, question: Question | None, settings: Settings) -> str:
+    """Resolve the "auto" tier: the large model for complex questions only."""
+    if tier != AUTO_TIER:
+        return tier
+    if question is None or is_complex_question(
+        question, settings.ANALYSIS_SHORT_QUESTION_WORDS
+    ):
+        return LARGE_TIER
+    return FAST_TIER
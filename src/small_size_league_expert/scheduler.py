@@ -0,0 +1,322 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.sessions import is_follow_up
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.streaming import AnswerStream
+
+
+class AdmissionError(Exception):
+    """A question was not admitted by the scheduler."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(AdmissionError):
+    """The user or the guild asked too many questions recently."""
+
+
+class QueueFullError(AdmissionError):
+    """Too many questions are already waiting."""
+
+
+class TokenBucket:
+    """Allows `capacity` requests at once, refilled at `rate` requests per second."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def retry_after(self) -> float:
+        """Seconds until a request is allowed, 0 when it is allowed right now."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+def normalize_question(question: str) -> str:
+    """The single-flight key of a question: case, spacing and final punctuation removed."""
+    return re.sub(r"\s+", " ", question.lower()).strip(" ?!.")
+
+
+class Flight:
+    """One crew run, shared by every caller that asked the same question."""
+
+    def __init__(
+        self,
+        key: str,
+        owner: Hashable,
+        runner: Callable[[AnswerStream], Awaitable[Any]],
+    ):
+        self.key = key
+        self.owner = owner
+        self.runner = runner
+        self.stream = AnswerStream()
+        self.callers = 1
+        self.position = 0
+        self.started = asyncio.Event()
+        self._result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._position_changed = asyncio.Event()
+
+    def _set_position(self, position: int) -> None:
+        if position != self.position:
+            self.position = position
+            changed, self._position_changed = self._position_changed, asyncio.Event()
+            changed.set()
+
+    async def positions(self):
+        """Yield the queue position of the flight until it starts running."""
+        while not self.started.is_set():
+            yield self.position
+            changed = asyncio.create_task(self._position_changed.wait())
+            started = asyncio.create_task(self.started.wait())
+            await asyncio.wait({changed, started}, return_when=asyncio.FIRST_COMPLETED)
+            changed.cancel()
+            started.cancel()
+
+    async def result(self) -> Any:
+        """Wait for the result of the run, shared by all of its callers."""
+        return await asyncio.shield(self._result)
+
+
+class AskScheduler:
+    """Admission control and fair scheduling of crew runs.
+
+    - At most `max_concurrency` runs execute at once, the others wait in a
+      queue of at most `max_queue` runs.
+    - Each user and each guild has a token bucket limiting how often they can
+      ask.
+    - Identical in-flight questions share a single run and its stream, except
+      follow-ups, which only mean the same within their session.
+    - Waiting runs are served round-robin across users, so a user asking many
+      questions does not delay everybody else.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        max_queue: int | None = None,
+        user_rate: tuple[float, float] | None = None,
+        guild_rate: tuple[float, float] | None = None,
+    ):
+        settings = get_settings()
+        self.max_concurrency = (
+            max_concurrency
+            or settings.SCHEDULER_MAX_CONCURRENCY
+            or settings.CREW_POOL_SIZE * max(settings.WORKER_PROCESSES, 1)
+        )
+        self.max_queue = (
+            max_queue if max_queue is not None else settings.SCHEDULER_MAX_QUEUE
+        )
+        # (burst capacity, requests per second)
+        self.user_rate = user_rate or (
+            settings.USER_RATE_LIMIT_BURST,
+            settings.USER_RATE_LIMIT_PER_MINUTE / 60,
+        )
+        self.guild_rate = guild_rate or (
+            settings.GUILD_RATE_LIMIT_BURST,
+            settings.GUILD_RATE_LIMIT_PER_MINUTE / 60,
+        )
+
+        self._user_buckets: dict[Hashable, TokenBucket] = {}
+        self._guild_buckets: dict[Hashable, TokenBucket] = {}
+        self._flights: dict[str, Flight] = {}
+        # Waiting flights of each user, in the order the users will be served
+        self._waiting: OrderedDict[Hashable, deque[Flight]] = OrderedDict()
+        self._running = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return sum(len(flights) for flights in self._waiting.values())
+
+    def _bucket(
+        self, buckets: dict, key: Hashable, rate: tuple[float, float]
+    ) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(*rate)
+        return bucket
+
+    def _buckets_of(
+        self, user_id: Hashable, guild_id: Hashable | None
+    ) -> list[TokenBucket]:
+        # Buckets back to full capacity hold no state worth keeping
+        for buckets in (self._user_buckets, self._guild_buckets):
+            for key in [k for k, bucket in buckets.items() if bucket.full]:
+                del buckets[key]
+
+        buckets = [self._bucket(self._user_buckets, user_id, self.user_rate)]
+        if guild_id is not None:
+            buckets.append(self._bucket(self._guild_buckets, guild_id, self.guild_rate))
+        return buckets
+
+    def _admit(self, user_id: Hashable, guild_id: Hashable | None) -> list[TokenBucket]:
+        """The buckets to charge for a request, raises when they are empty."""
+        buckets = self._buckets_of(user_id, guild_id)
+        retry_after = max(bucket.retry_after() for bucket in buckets)
+        if retry_after > 0:
+            raise RateLimitedError(
+                "Too many questions, please wait a moment.", retry_after
+            )
+        return buckets
+
+    @staticmethod
+    def _key(question: str, session: str | None) -> str:
+        key = normalize_question(question)
+        if session and is_follow_up(question, get_settings().SESSION_FOLLOW_UP_WORDS):
+            key = f"{session} {key}"
+        return key
+
+    def _free_slots(self) -> int:
+        """How many new runs can start or wait right now."""
+        return max(self.max_concurrency - self._running, 0) + max(
+            self.max_queue - self.queued, 0
+        )
+
+    def _schedule(
+        self,
+        key: str,
+        question: str,
+        runner: Callable[[AnswerStream], Awaitable[Any]],
+        user_id: Hashable,
+    ) -> Flight:
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.callers += 1
+            log_event("flight_joined", question=question, callers=flight.callers)
+            return flight
+
+        flight = Flight(key, user_id, runner)
+        self._flights[key] = flight
+        self._waiting.setdefault(user_id, deque()).append(flight)
+        self._dispatch()
+        return flight
+
+    def submit(
+        self,
+        question: str,
+        runner: Callable[[AnswerStream], Awaitable[Any]],
+        user_id: Hashable,
+        guild_id: Hashable | None = None,
+        session: str | None = None,
+    ) -> Flight:
+        """Admit a question and schedule its run.
+
+        `runner` receives the stream of the run and returns its result. When
+        the same question is already in flight, its flight is returned instead
+        and `runner` is never called. Raises `AdmissionError` when the question
+        is not admitted. `session` is the conversation of the question, see
+        `sessions`.
+        """
+        buckets = self._admit(user_id, guild_id)
+
+        key = self._key(question, session)
+        if key not in self._flights and not self._free_slots():
+            raise QueueFullError(
+                "Too many questions are waiting, please try again later."
+            )
+
+        for bucket in buckets:
+            bucket.consume()
+        return self._schedule(key, question, runner, user_id)
+
+    def submit_batch(
+        self,
+        questions: list[tuple[str, Callable[[AnswerStream], Awaitable[Any]]]],
+        user_id: Hashable,
+        guild_id: Hashable | None = None,
+        session: str | None = None,
+    ) -> list[Flight]:
+        """Admit many (question, runner) pairs as one unit and schedule their runs.
+
+        The batch is charged a single request of the rate limits, and admitted
+        only when the queue has room for all of its new runs, so its questions
+        are either all scheduled or all refused. Their runs are then served
+        round-robin with the ones of the other users, like single questions.
+        """
+        buckets = self._admit(user_id, guild_id)
+
+        keys = [self._key(question, session) for question, _ in questions]
+        new_runs = len({key for key in keys if key not in self._flights})
+        if new_runs > self._free_slots():
+            raise QueueFullError(
+                "Too many questions are waiting for this batch, please try again later."
+            )
+
+        for bucket in buckets:
+            bucket.consume()
+        return [
+            self._schedule(key, question, runner, user_id)
+            for key, (question, runner) in zip(keys, questions)
+        ]
+
+    def _serving_order(self) -> list[Flight]:
+        """The waiting flights in the order they will start, one user at a time."""
+        queues = [list(flights) for flights in self._waiting.values()]
+        order = []
+        for round_index in range(max(map(len, queues), default=0)):
+            order += [
+                queue[round_index] for queue in queues if round_index < len(queue)
+            ]
+        return order
+
+    def _dispatch(self) -> None:
+        """Start waiting flights while there are free slots."""
+        while self._running < self.max_concurrency and self._waiting:
+            user_id, flights = next(iter(self._waiting.items()))
+            flight = flights.popleft()
+            # The user goes to the back of the line, behind everybody else
+            del self._waiting[user_id]
+            if flights:
+                self._waiting[user_id] = flights
+
+            self._running += 1
+            flight._set_position(0)
+            flight.started.set()
+            task = asyncio.create_task(self._run(flight))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        for position, flight in enumerate(self._serving_order(), start=1):
+            flight._set_position(position)
+
+    async def _run(self, flight: Flight) -> None:
+        try:
+            flight._result.set_result(await flight.runner(flight.stream))
+        except Exception as e:
+            flight._result.set_exception(e)
+        finally:
+            flight.stream.close()
+            self._flights.pop(flight.key, None)
+            self._running -= 1
+            self._dispatch()
@@ -0,0 +1,207 @@
+"""Conversation sessions of a Discord channel or thread.
+
+Users often follow a question up in the same channel ("and for Division B?").
+The session of the channel keeps the analyzed question and the passages
+retrieved for its last question, under `CACHE_DIR` so every worker process
+of the host sees it. A follow-up is rewritten with the question it follows,
+reuses the stored passages that cover its queries and only searches the
+others. Sessions expire after a TTL, and the least recently used ones are
+dropped once there are too many.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from small_size_league_expert.embeddings import STOPWORDS
+from small_size_league_expert.models import Answer, Question, RetrieverResult
+from small_size_league_expert.settings import get_settings
+
+# Key of the session id in the crew inputs
+SESSION_INPUT = "session_id"
+
+# Openers of elliptical questions that only make sense after the previous one
+FOLLOW_UP_OPENERS = (
+    "and",
+    "what about",
+    "how about",
+    "also",
+    "same for",
+    "but",
+    # Portuguese
+    "e",
+    "mas",
+    "e quanto",
+    # Spanish
+    "y",
+    "pero",
+)
+
+# Pronouns pointing back at the subject of the previous question
+FOLLOW_UP_PRONOUNS = {
+    "it",
+    "its",
+    "they",
+    "them",
+    "those",
+    "isso",
+    "ele",
+    "ela",
+    "eles",
+    "eso",
+    "ello",
+}
+
+# Words that never name the subject of a question, in the languages above
+FUNCTION_WORDS = (
+    STOPWORDS
+    | FOLLOW_UP_PRONOUNS
+    | {"same", "many", "much", "have", "has", "had", "if", "else", "one", "ones"}
+    | {"o", "os", "as", "de", "do", "da", "dos", "das", "no", "na", "em", "para"}
+    | {"por", "que", "qual", "quais", "quanto", "quantos", "quantas", "como"}
+    | {"quando", "onde", "é", "são", "um", "uma", "e", "mas", "se", "sobre"}
+    | {"el", "la", "los", "las", "del", "en", "qué", "cuál", "cuánto", "cuántos"}
+    | {"cómo", "cuándo", "dónde", "es", "son", "un", "una", "y", "pero"}
+)
+
+# Most content words of an elliptical follow-up, after its opener
+MAX_ELLIPTICAL_WORDS = 3
+
+
+def is_follow_up(text: str, max_words: int = 10) -> bool:
+    """Whether a short question leans on the previous one of its session.
+
+    Only elliptical questions do: an opener followed by a few content words
+    ("and for Division B?", "what about the ball?"), or a pronoun standing
+    for the whole subject ("how big is it?"). A question with a subject of
+    its own, such as "is it legal to use a dribbler?", stands alone.
+    """
+    words = re.findall(r"[\w'-]+", text.lower())
+    if not words or len(words) > max_words:
+        return False
+
+    content = [word for word in words if word not in FUNCTION_WORDS]
+    lowered = " ".join(words)
+    if f"{lowered} ".startswith(tuple(f"{opener} " for opener in FOLLOW_UP_OPENERS)):
+        return len(content) <= MAX_ELLIPTICAL_WORDS
+    return len(content) <= 1 and any(word in FOLLOW_UP_PRONOUNS for word in words)
+
+
+@dataclass
+class SessionContext:
+    """The last question of a session and the passages retrieved for it."""
+
+    question: Question
+    passages: list[Answer]
+    updated_at: float
+
+
+class SessionStore:
+    """The context of the last question of each session, with a TTL."""
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float = 900.0,
+        max_sessions: int = 1000,
+        max_passages: int = 40,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_passages = max_passages
+
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                passages TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+
+    def load(self, session_id: str) -> SessionContext | None:
+        """The context of a session, None when it has none or it expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT question, passages, updated_at FROM sessions "
+                "WHERE session_id = ? AND updated_at > ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        if row is None:
+            return None
+
+        question, passages, updated_at = row
+        return SessionContext(
+            question=Question.model_validate_json(question),
+            passages=RetrieverResult.model_validate_json(passages).results,
+            updated_at=updated_at,
+        )
+
+    def save(self, session_id: str, question: Question, passages: list[Answer]) -> None:
+        """Replace the context of a session with its last question."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions "
+                "(session_id, question, passages, updated_at) VALUES (?, ?, ?, ?)",
+                (
+                    session_id,
+                    question.model_dump_json(),
+                    RetrieverResult(
+                        results=passages[: self.max_passages]
+                    ).model_dump_json(),
+                    now,
+                ),
+            )
+            self._db.execute(
+                "DELETE FROM sessions WHERE updated_at <= ?", (now - self.ttl_seconds,)
+            )
+            self._db.execute(
+                """
+                DELETE FROM sessions WHERE session_id NOT IN (
+                    SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT ?
+                )
+                """,
+                (self.max_sessions,),
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Forget every session."""
+        with self._lock:
+            self._db.execute("DELETE FROM sessions")
+            self._db.commit()
+
+
+_session_store: SessionStore | None = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore | None:
+    """Get the process-wide session store, or None when sessions are disabled."""
+    global _session_store
+
+    settings = get_settings()
+    if not settings.SESSION_ENABLED:
+        return None
+
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = SessionStore(
+                path=os.path.join(settings.CACHE_DIR, "sessions.sqlite3"),
+                ttl_seconds=settings.SESSION_TTL_SECONDS,
+                max_sessions=settings.SESSION_MAX_SESSIONS,
+                max_passages=settings.SESSION_MAX_PASSAGES,
+            )
+        return _session_store
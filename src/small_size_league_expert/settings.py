@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,5 +12,187 @@ class Settings(BaseSettings):
     MCP_ENDPOINT: str = "http://localhost:8888/mcp"
     MCP_TRANSPORT_TYPE: str = "streamable-http"
 
+    # Persistent MCP sessions shared by every crew
+    MCP_POOL_SIZE: int = 2
+    MCP_HEALTH_CHECK_INTERVAL: float = 30.0
+    MCP_CONNECT_TIMEOUT: float = 30.0
+    MCP_CALL_TIMEOUT: float = 60.0
+    MCP_RECONNECT_MAX_BACKOFF: float = 60.0
+
     #  LLM model to use
     MODEL: str = "groq/llama-3.3-70b-versatile"
+
+    # Fast model tier, and the model tier of each agent: "fast", "large" (MODEL),
+    # "auto" (the large model for complex questions only) or a model name. A
+    # rate limited model hands its calls to the other tier for the cooldown.
+    FAST_MODEL: str = "groq/llama-3.1-8b-instant"
+    AGENT_MODELS: dict[str, str] = {
+        "question_handler": "fast",
+        "retriever": "large",
+        "ranker": "fast",
+        "answer_generator": "auto",
+    }
+    MODEL_RATE_LIMIT_COOLDOWN: float = 30.0
+
+    # Cache of the completions of the temperature-0 LLM calls, under CACHE_DIR,
+    # evicting the least recently used ones over the size limit. Off by default,
+    # live traffic should always call the model; meant for benchmarks and replays.
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_MAX_MB: float = 256.0
+
+    # Question analysis: "local" detects the language and keywords without the
+    # LLM and skips it entirely for short factual English questions, "agent"
+    # always runs the question handler agent
+    ANALYSIS_MODE: str = "local"
+    ANALYSIS_SHORT_QUESTION_WORDS: int = 12
+
+    # Retrieval stage: "fanout" searches every source for every sub-question
+    # concurrently, "agent" lets the retriever agent pick the tools one by one
+    RETRIEVAL_MODE: str = "fanout"
+    # Searches running at once, across every question of the process
+    RETRIEVAL_MAX_CONCURRENCY: int = 8
+    RETRIEVAL_SOURCE_TIMEOUT: float = 20.0
+    # Start the fan-out from the raw question while it is analyzed, then keep the
+    # passages sharing at least this share of words with the analyzed queries
+    RETRIEVAL_SPECULATIVE: bool = True
+    RETRIEVAL_SPECULATIVE_MIN_OVERLAP: float = 0.5
+    # Optional MCP tool name of each source, e.g. {"rules": "search_rules"}
+    RETRIEVAL_MCP_TOOLS: dict[str, str] = {}
+
+    # Ranking stage: "local" scores the passages with BM25, embeddings and the
+    # authority of their source, "llm" lets the LLM do it: with a compact call
+    # batched across crews when micro-batching is on, or the ranker agent
+    RANKING_MODE: str = "local"
+    RANKING_MAX_RESULTS: int = 8
+    RANKING_LEXICAL_WEIGHT: float = 0.5
+    RANKING_DUPLICATE_THRESHOLD: float = 0.9
+
+    # Structured output: the compact analysis and ranking calls send the JSON
+    # schema of their reply to the providers that support it. Replies that do
+    # not parse are repaired locally before any conversion call.
+    STRUCTURED_OUTPUT: bool = True
+
+    # Micro-batching of the question analysis and "llm" ranking calls of
+    # concurrent crews: how long a call waits for others, and how many it takes
+    MICROBATCH_ENABLED: bool = True
+    MICROBATCH_WINDOW: float = 0.05
+    MICROBATCH_MAX_ITEMS: int = 8
+
+    # Sessions of a Discord channel or thread: the passages retrieved for its last
+    # question are kept for a follow-up, which only searches what they miss. A
+    # question is a follow-up when it has at most SESSION_FOLLOW_UP_WORDS words
+    # and is elliptical: an opener and a few words ("and for Division B?") or a
+    # pronoun for the whole subject ("how big is it?")
+    SESSION_ENABLED: bool = True
+    SESSION_TTL_SECONDS: float = 900.0
+    SESSION_MAX_SESSIONS: int = 1000
+    SESSION_MAX_PASSAGES: int = 40
+    SESSION_FOLLOW_UP_WORDS: int = 10
+
+    # Compaction of the retrieved passages before an LLM reads them: containment
+    # of word shingles above which passages are merged, sentences kept per
+    # passage, and token budget of the passages given to the ranking and
+    # answer generation stages
+    COMPACTION_ENABLED: bool = True
+    COMPACTION_DUPLICATE_THRESHOLD: float = 0.7
+    COMPACTION_MAX_SENTENCES: int = 8
+    COMPACTION_RANKING_TOKENS: int = 3000
+    COMPACTION_ANSWER_TOKENS: int = 2000
+
+    # Offline corpus index: chunk size in words and passages per search
+    CORPUS_CHUNK_WORDS: int = 180
+    CORPUS_CHUNK_OVERLAP: int = 30
+    CORPUS_TOP_K: int = 5
+
+    # Knowledge files of the answer generator, under knowledge/, and how many of
+    # their passages are added to its prompt
+    KNOWLEDGE_FILES: list[str] = ["content_description.txt"]
+    KNOWLEDGE_TOP_K: int = 3
+    KNOWLEDGE_MIN_SCORE: float = 0.0
+    # Embedder of the knowledge files when EMBEDDING_MODEL is empty: "crewai" (its
+    # default, OpenAI text-embedding-3-small) or "hashing" (local, no API call,
+    # but it matches shared words only)
+    KNOWLEDGE_EMBEDDER: str = "crewai"
+
+    # Cache of the MCP and Wikipedia results, in memory and under CACHE_DIR, kept
+    # for the TTL of the source the tool searches
+    TOOL_CACHE_ENABLED: bool = True
+    TOOL_CACHE_TTL_SECONDS: dict[str, float] = {
+        "rules": 7 * 24 * 3600,
+        "tdp": 7 * 24 * 3600,
+        "website": 3600,
+        "wikipedia": 24 * 3600,
+    }
+    TOOL_CACHE_DEFAULT_TTL: float = 3600.0
+    TOOL_CACHE_MEMORY_ENTRIES: int = 1024
+
+    # Duplicate the tool calls slower than this percentile of the recent calls of
+    # their tool, once the tool has enough of them
+    HEDGING_ENABLED: bool = True
+    HEDGING_PERCENTILE: float = 0.95
+    HEDGING_MIN_SAMPLES: int = 20
+    HEDGING_MIN_DELAY: float = 0.05
+
+    # Wikipedia lookups: request timeout and size budget of the returned sections
+    WIKIPEDIA_TIMEOUT: float = 10.0
+    WIKIPEDIA_MAX_CHARS: int = 6000
+
+    # Time budget of a question from the moment it is accepted (0 disables it),
+    # and the seconds of it kept for the answer generation: once only those
+    # remain, retrieval and ranking hand over what they already have
+    DEADLINE_SECONDS: float = 120.0
+    DEADLINE_ANSWER_RESERVE: float = 30.0
+
+    # Stream the final answer to the caller while it is generated
+    ANSWER_STREAMING: bool = True
+
+    # Number of pre-built crews kept warm for concurrent questions
+    CREW_POOL_SIZE: int = 2
+
+    # Worker processes running the crews, each with CREW_POOL_SIZE crews (0 runs
+    # the crews in the gateway process). Setting the queue address also serves
+    # the job queue over TCP to workers on other hosts, on 127.0.0.1 without a
+    # host. It sends pickled objects, so it needs a secret authkey: anyone with
+    # the key can run code in the gateway and the workers.
+    WORKER_PROCESSES: int = 2
+    WORKER_QUEUE_ADDRESS: str = ""
+    WORKER_QUEUE_AUTHKEY: str = ""
+    WORKER_STREAM_INTERVAL: float = 0.25
+    WORKER_JOB_TIMEOUT: float = 600.0
+
+    # Scheduling of questions: concurrent runs (0 uses all the local crews), waiting
+    # runs, and how often each user and each guild can ask
+    SCHEDULER_MAX_CONCURRENCY: int = 0
+    SCHEDULER_MAX_QUEUE: int = 20
+    USER_RATE_LIMIT_PER_MINUTE: float = 3.0
+    USER_RATE_LIMIT_BURST: int = 3
+    GUILD_RATE_LIMIT_PER_MINUTE: float = 30.0
+    GUILD_RATE_LIMIT_BURST: int = 10
+
+    # Observability: port of the Prometheus metrics endpoint on the gateway (0
+    # disables it), share of the per-question events logged as JSON lines,
+    # and the step-by-step output of the agents
+    METRICS_PORT: int = 9464
+    LOG_SAMPLE_RATE: float = 0.1
+    CREW_VERBOSE: bool = False
+
+    # Directory for the on-disk caches and indexes
+    CACHE_DIR: str = ".cache"
+
+    # Embedding model used for semantic lookups and the knowledge files, e.g.
+    # "openai/text-embedding-3-small". When empty, a local hashing embedder is
+    # used for the lookups, which matches shared words only.
+    EMBEDDING_MODEL: str = ""
+
+    # Semantic cache of final answers, keyed on the normalized English question.
+    # Only used with an EMBEDDING_MODEL, the hashing embedder is not semantic.
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_THRESHOLD: float = 0.92
+    ANSWER_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """The settings of the process, read from the environment once."""
+    return Settings()
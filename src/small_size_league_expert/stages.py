@@ -0,0 +1,129 @@
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from crewai import Task
+from crewai.agents.agent_builder.base_agent import BaseAgent
+from crewai.tasks.output_format import OutputFormat
+from crewai.tasks.task_output import TaskOutput
+from crewai.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from small_size_league_expert.metrics import log_event
+from small_size_league_expert.structured import count_output, parse_output
+
+
+class StageTask(Task):
+    """A task whose output can be produced locally instead of by its agent.
+
+    Before the agent is called, the task asks its `local_runner` for an output.
+    When the runner returns a model, the LLM call is skipped and that model
+    becomes the task output, so the next tasks receive it as regular context.
+    The `post_processor` then rewrites the output, local or not, before the
+    next tasks read it. When the agent fails, the `fallback` can still hand
+    over a degraded output, such as what was found before the time budget of
+    the question ran out.
+
+    The output of the agent is repaired locally when it does not parse, with
+    the fields the previous stages already know (`known_fields`), before
+    CrewAI converts it with another LLM call.
+    """
+
+    local_runner: Optional[Callable[[], Optional[BaseModel]]] = Field(
+        default=None,
+        exclude=True,
+        description="Produces the task output locally, or None to run the agent.",
+    )
+    post_processor: Optional[Callable[[BaseModel], BaseModel]] = Field(
+        default=None,
+        exclude=True,
+        description="Rewrites the structured output before the next tasks read it.",
+    )
+    fallback: Optional[Callable[[], Optional[BaseModel]]] = Field(
+        default=None,
+        exclude=True,
+        description="Produces a degraded output when the agent fails, or None to fail.",
+    )
+    known_fields: Optional[Callable[[], Dict[str, Any]]] = Field(
+        default=None,
+        exclude=True,
+        description="Fields already known from the previous stages, used when the output lacks them.",
+    )
+    ran_locally: bool = Field(
+        default=False,
+        exclude=True,
+        description="Whether the last output came from the local runner.",
+    )
+
+    def execute_sync(
+        self,
+        agent: Optional[BaseAgent] = None,
+        context: Optional[str] = None,
+        tools: Optional[List[BaseTool]] = None,
+    ) -> TaskOutput:
+        """Execute the task locally when possible, otherwise with its agent."""
+        # The time spent in the local runner counts as time spent in the task
+        started = datetime.datetime.now()
+        local_output = self.local_runner() if self.local_runner else None
+        self.ran_locally = local_output is not None
+        if local_output is None:
+            try:
+                output = super().execute_sync(agent=agent, context=context, tools=tools)
+            except Exception:
+                local_output = self.fallback() if self.fallback else None
+                if local_output is None:
+                    raise
+                self.ran_locally = True
+
+        if local_output is None:
+            self.start_time = started
+            if self.post_processor and output.pydantic is not None:
+                output.pydantic = self.post_processor(output.pydantic)
+                output.raw = output.pydantic.model_dump_json()
+            return output
+
+        if self.post_processor:
+            local_output = self.post_processor(local_output)
+        return self._set_local_output(local_output, agent or self.agent, started)
+
+    def _export_output(
+        self, result: str
+    ) -> Tuple[Optional[BaseModel], Optional[Dict[str, Any]]]:
+        """Parse the output of the agent, repairing it locally when possible."""
+        if self.output_pydantic is None:
+            return super()._export_output(result)
+
+        known = self.known_fields() if self.known_fields else None
+        output, repaired = parse_output(result, self.output_pydantic, known)
+        if output is not None:
+            count_output(self.name, "repaired" if repaired else "parsed")
+            return output, None
+
+        log_event("stage_output_unrepaired", sample_rate=1.0, stage=self.name)
+        pydantic_output, json_output = super()._export_output(result)
+        count_output(
+            self.name, "converted" if pydantic_output is not None else "failed"
+        )
+        return pydantic_output, json_output
+
+    def _set_local_output(
+        self,
+        local_output: BaseModel,
+        agent: Optional[BaseAgent],
+        started: datetime.datetime,
+    ) -> TaskOutput:
+        self.start_time = started
+        self.output = TaskOutput(
+            name=self.name,
+            description=self.description,
+            expected_output=self.expected_output,
+            raw=local_output.model_dump_json(),
+            pydantic=local_output,
+            agent=agent.role if agent else "",
+            output_format=OutputFormat.PYDANTIC,
+        )
+        self.end_time = datetime.datetime.now()
+
+        if self.callback:
+            self.callback(self.output)
+
+        return self.output
@@ -0,0 +1,43 @@
+"""Time spent starting the gateway and the workers, phase by phase.
+
+The clock starts when this module is first imported, which the entry points
+do before anything else. Each `startup_step` ends a phase, and
+`startup_report` prints and records them once the process can answer.
+"""
+
+import time
+
+_started = time.perf_counter()
+_last_step = _started
+_steps: list[tuple[str, float]] = []
+_reported = False
+
+
+def startup_step(phase: str) -> None:
+    """End a phase of the startup, which began when the previous one ended."""
+    global _last_step
+
+    now = time.perf_counter()
+    _steps.append((phase, now - _last_step))
+    _last_step = now
+
+
+def startup_report(component: str) -> dict[str, float]:
+    """Print how long the startup took and add it to the metrics, once."""
+    global _reported
+
+    from small_size_league_expert.metrics import REGISTRY, STARTUP_SECONDS
+
+    total = time.perf_counter() - _started
+    phases = dict(_steps)
+    if _reported:
+        return phases
+    _reported = True
+
+    REGISTRY.observe(STARTUP_SECONDS, total, component=component, phase="total")
+    for phase, seconds in phases.items():
+        REGISTRY.observe(STARTUP_SECONDS, seconds, component=component, phase=phase)
+
+    details = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in phases.items())
+    print(f"🚀 {component.capitalize()} ready in {total:.2f}s ({details})")
+    return phases
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator
+
+# Streams receiving the chunks of each streaming LLM, keyed by the LLM id
+_streams: dict[int, "AnswerStream"] = {}
+_streams_lock = threading.Lock()
+_forwarding = False
+
+
+def _forward_chunks() -> None:
+    """Forward the streamed chunks to the attached streams, from now on,
+    instead of printing them.
+
+    Registered on the first attach only, so the gateway, which only consumes
+    streams, does not have to import crewai. Call with `_streams_lock` held.
+    """
+    global _forwarding
+
+    if _forwarding:
+        return
+
+    from crewai.utilities.events import EventListener, crewai_event_bus
+    from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+
+    # The console listener of crewai prints every chunk, interleaving the
+    # answers of concurrent crews, and keeps them in a buffer never cleared
+    handlers = crewai_event_bus._handlers.get(LLMStreamChunkEvent, [])
+    handlers[:] = [
+        handler
+        for handler in handlers
+        if handler.__module__ != EventListener.__module__
+    ]
+
+    @crewai_event_bus.on(LLMStreamChunkEvent)
+    def _forward_chunk(source, event: LLMStreamChunkEvent) -> None:
+        if event.tool_call:
+            return
+        with _streams_lock:
+            stream = _streams.get(id(source))
+        if stream is not None:
+            stream.push(event.chunk)
+
+    _forwarding = True
+
+
+class AnswerStream:
+    """Carries the tokens of the final answer from a crew to an async consumer.
+
+    The crew runs in a worker thread and pushes the chunks of its streaming LLM.
+    Consumers iterate over `updates`, which yields the text received so far
+    at most once per interval, until the stream is closed. Several consumers
+    can follow the same stream.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.text = ""
+        self._version = 0
+        self._changed = asyncio.Event()
+        self._closed = False
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _append(self, chunk: str) -> None:
+        self.text += chunk
+        self._version += 1
+        self._notify()
+
+    def _close(self) -> None:
+        self._closed = True
+        self._notify()
+
+    def push(self, chunk: str) -> None:
+        """Add a chunk of the answer, from any thread."""
+        if chunk:
+            self.loop.call_soon_threadsafe(self._append, chunk)
+
+    def close(self) -> None:
+        """End the stream, from any thread."""
+        self.loop.call_soon_threadsafe(self._close)
+
+    @contextmanager
+    def attach(self, llm) -> Iterator["AnswerStream"]:
+        """Receive the chunks streamed by an LLM while in this context.
+
+        The chunks of its fallback LLM, which answers while it is rate
+        limited, are received too.
+        """
+        llms = [llm]
+        if getattr(llm, "fallback", None) is not None:
+            llms.append(llm.fallback)
+        with _streams_lock:
+            _forward_chunks()
+            for attached in llms:
+                _streams[id(attached)] = self
+        try:
+            yield self
+        finally:
+            with _streams_lock:
+                for attached in llms:
+                    _streams.pop(id(attached), None)
+
+    async def updates(self, interval: float = 1.0) -> AsyncIterator[str]:
+        """Yield the text received so far, throttled to one update per interval."""
+        seen = 0
+        while True:
+            if self._version == seen and not self._closed:
+                await self._changed.wait()
+            if self._version != seen:
+                seen = self._version
+                yield self.text
+            elif self._closed:
+                return
+            if not self._closed:
+                await asyncio.sleep(interval)
@@ -0,0 +1,269 @@
+"""Structured output of the stage LLM calls.
+
+The compact stage calls (question analysis and ranking) send the JSON schema
+of their reply to the providers that support a schema response format, so
+the reply always parses. The other providers get the same prompt.
+
+Replies that do not parse as they are, from any provider or agent, are
+repaired locally when they almost do: JSON in code fences or surrounded by
+text, trailing commas, Python literals, output cut by the token limit, a
+single field where a list was expected, lists over their maximum length, and
+fields an earlier stage already knows. Only what can not be repaired costs
+another LLM call, the conversion call of CrewAI.
+"""
+
+import ast
+import copy
+import json
+import re
+from functools import lru_cache
+from inspect import isclass
+from typing import Any, List, TypeVar, get_args, get_origin
+
+from crewai import LLM
+from crewai.llms.base_llm import BaseLLM
+from pydantic import BaseModel, Field, ValidationError
+
+from small_size_league_expert.metrics import REGISTRY, STRUCTURED_OUTPUTS
+from small_size_league_expert.settings import get_settings
+
+M = TypeVar("M", bound=BaseModel)
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+class AnalysisReply(BaseModel):
+    """The reply of the compact question analysis."""
+
+    question: str = Field(..., description="The question in English")
+    language_code: str | None = Field(
+        default=None, description="The language code of the question"
+    )
+    sub_questions: List[str] = Field(
+        ..., description="Up to 3 focused sub-questions in English"
+    )
+
+
+class NumberedAnalysisReply(AnalysisReply):
+    """The analysis of one question of a batch."""
+
+    id: int = Field(..., description="The number of the question")
+
+
+class BatchAnalysisReply(BaseModel):
+    """The reply of the compact analysis of several questions."""
+
+    items: List[NumberedAnalysisReply] = Field(
+        ..., description="One analysis per question, in the same order"
+    )
+
+
+class QuestionRanking(BaseModel):
+    """The best passages of one question."""
+
+    question: int = Field(..., description="The number of the question")
+    passages: List[int] = Field(
+        ..., description="The numbers of the best passages, best first"
+    )
+
+
+class RankingReply(BaseModel):
+    """The reply of the compact ranking."""
+
+    rankings: List[QuestionRanking] = Field(
+        ..., description="The best passages of each question"
+    )
+
+
+def count_output(stage: str, outcome: str) -> None:
+    """Count a structured output: parsed, repaired, converted or failed."""
+    REGISTRY.inc(STRUCTURED_OUTPUTS, stage=stage, outcome=outcome)
+
+
+@lru_cache(maxsize=64)
+def _supports_schema(model: str, provider: str | None) -> bool:
+    import litellm
+
+    try:
+        return bool(
+            litellm.supports_response_schema(model=model, custom_llm_provider=provider)
+        )
+    except Exception:
+        return False
+
+
+def with_schema(llm: BaseLLM, schema: type[BaseModel]) -> BaseLLM:
+    """A copy of a stage LLM whose replies follow `schema`.
+
+    The schema is only sent to the models whose provider supports it, the
+    fallback model of the LLM gets it too. The LLM itself is returned when
+    structured output is off.
+    """
+    if not isinstance(llm, LLM) or not get_settings().STRUCTURED_OUTPUT:
+        return llm
+
+    constrained = copy.copy(llm)
+    provider = llm._get_custom_llm_provider()
+    constrained.response_format = (
+        schema if _supports_schema(llm.model, provider) else None
+    )
+    fallback = getattr(llm, "fallback", None)
+    if fallback is not None:
+        constrained.fallback = with_schema(fallback, schema)
+    return constrained
+
+
+def _balanced(text: str) -> tuple[str, list[int]]:
+    """The first JSON value of a text, closed if it was cut, and the
+    positions of its commas outside strings."""
+    closers = {"{": "}", "[": "]"}
+    stack: list[str] = []
+    commas: list[int] = []
+    in_string = escaped = False
+    for position, character in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif character == "\\":
+                escaped = True
+            elif character == '"':
+                in_string = False
+        elif character == '"':
+            in_string = True
+        elif character in closers:
+            stack.append(closers[character])
+        elif character in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[: position + 1], commas
+        elif character == ",":
+            commas.append(position)
+
+    # Cut by the token limit
+    return text + ('"' if in_string else "") + "".join(reversed(stack)), commas
+
+
+def _loads(text: str) -> Any:
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text), strict=False)
+    except ValueError:
+        pass
+    # Python literals, such as single quotes or True and None
+    value = ast.literal_eval(text)
+    if not isinstance(value, (dict, list)):
+        raise ValueError("Not a JSON object or array")
+    return value
+
+
+def load_json(text: str, max_cuts: int = 20) -> tuple[Any, bool]:
+    """The JSON object or array of an LLM reply, and whether it had to be
+    repaired. Returns (None, False) when nothing can be read."""
+    text = str(text).strip()
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+
+    fenced = _FENCE.search(text)
+    body = fenced.group(1) if fenced else text
+    starts = [index for index in (body.find("{"), body.find("[")) if index >= 0]
+    if not starts:
+        return None, False
+
+    candidate = body[min(starts) :]
+    for _ in range(max_cuts):
+        balanced, commas = _balanced(candidate)
+        try:
+            return _loads(balanced), True
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            pass
+        if not commas:
+            break
+        # Drop the last, incomplete item and try again
+        candidate = candidate[: commas[-1]]
+    return None, False
+
+
+def _list_item(annotation: Any) -> Any:
+    return get_args(annotation)[0] if get_origin(annotation) is list else None
+
+
+def _coerce(data: Any, model: type[BaseModel], known: dict | None) -> Any:
+    """Reshape data that almost fits a model, using the fields already known."""
+    fields = model.model_fields
+    if isinstance(data, list):
+        lists = [name for name, f in fields.items() if _list_item(f.annotation)]
+        if len(lists) == 1:
+            data = {lists[0]: data}
+    if not isinstance(data, dict):
+        return data
+
+    # A model wrapped in a single key, such as {"RankResult": {...}}
+    if len(data) == 1 and not data.keys() & fields.keys():
+        inner = next(iter(data.values()))
+        if isinstance(inner, dict):
+            data = inner
+
+    data = {
+        **(known or {}),
+        **{key: value for key, value in data.items() if value is not None},
+    }
+    for name, field in fields.items():
+        if name not in data:
+            continue
+        value, item = data[name], _list_item(field.annotation)
+        if item is not None:
+            if isinstance(value, (str, dict)):
+                value = [value]
+            if (
+                isinstance(value, list)
+                and isclass(item)
+                and issubclass(item, BaseModel)
+            ):
+                # Items of a ranked list without their rank get their position
+                value = [
+                    _coerce(
+                        element,
+                        item,
+                        {"rank": position} if "rank" in item.model_fields else None,
+                    )
+                    for position, element in enumerate(value, start=1)
+                ]
+            max_length = next(
+                (m.max_length for m in field.metadata if hasattr(m, "max_length")),
+                None,
+            )
+            if isinstance(value, list) and max_length is not None:
+                value = value[:max_length]
+        elif field.annotation is str and isinstance(value, (int, float)):
+            value = str(value)
+        data[name] = value
+    return data
+
+
+def parse_output(
+    text: str, model: type[M], known: dict | None = None
+) -> tuple[M | None, bool]:
+    """Parse an LLM reply into a model, repairing it locally when needed.
+
+    `known` holds the fields an earlier stage already knows, used when the
+    reply lacks them. Returns the model, or None, and whether it was repaired.
+    """
+    try:
+        return model.model_validate_json(str(text).strip()), False
+    except ValueError:
+        pass
+
+    data, _ = load_json(text)
+    if data is None:
+        return None, False
+    try:
+        return model.model_validate(_coerce(data, model, known)), True
+    except ValidationError:
+        return None, False
@@ -0,0 +1,315 @@
+"""Cache of the results of the MCP and Wikipedia tool calls.
+
+The same search is often made by several questions within minutes, each one
+going over the network. Results are keyed by the tool name and its normalized
+arguments, and kept for the TTL of the source the tool searches: long for the
+rules and the TDPs, which rarely change, short for the website. A memory tier
+serves the hot entries of the process, a SQLite tier under `CACHE_DIR` shares
+them with the other processes and restarts, and concurrent calls with the
+same key wait for the first one instead of repeating it. Any crewai tool can
+be served from it with `cache_tool`.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Awaitable, Callable, TypeVar
+
+from small_size_league_expert.metrics import REGISTRY, TOOL_CACHE_LOOKUPS
+from small_size_league_expert.settings import get_settings
+
+_MISSING = object()
+
+T = TypeVar("T")
+
+
+class _AbandonedCallError(Exception):
+    """The call other callers were waiting for was cancelled."""
+
+
+def normalize_arguments(value: Any) -> Any:
+    """Arguments that mean the same call compare equal: sorted keys, no None
+    values and collapsed whitespace."""
+    if isinstance(value, dict):
+        return {
+            str(key): normalize_arguments(item)
+            for key, item in sorted(value.items())
+            if item is not None
+        }
+    if isinstance(value, (list, tuple)):
+        return [normalize_arguments(item) for item in value]
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+class ToolResultCache:
+    """Results of tool calls, in memory and on disk, with a TTL per source."""
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: dict[str, float] | None = None,
+        default_ttl: float = 3600.0,
+        memory_entries: int = 1024,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds or {}
+        self.default_ttl = default_ttl
+        self.memory_entries = memory_entries
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._in_flight: dict[str, Future] = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tool_results (
+                key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                result TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(tool: str, arguments: dict) -> str:
+        payload = json.dumps(
+            [tool, normalize_arguments(arguments)],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def ttl(self, source: str | None) -> float:
+        """Seconds the results of a source are kept."""
+        return self.ttl_seconds.get(source or "", self.default_ttl)
+
+    def _remember(self, key: str, expires_at: float, result: Any) -> None:
+        self._memory[key] = (expires_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key: str, tool: str, decode: Callable[[str], Any]) -> Any:
+        """The cached result of a call from the memory or the disk tier."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                REGISTRY.inc(TOOL_CACHE_LOOKUPS, tool=tool, outcome="memory")
+                return entry[1]
+
+            row = self._db.execute(
+                "SELECT result, expires_at FROM tool_results "
+                "WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                self._memory.pop(key, None)
+                return _MISSING
+
+            result = decode(row[0])
+            self._remember(key, row[1], result)
+            REGISTRY.inc(TOOL_CACHE_LOOKUPS, tool=tool, outcome="disk")
+            return result
+
+    def _store(
+        self, key: str, tool: str, result: Any, ttl: float, encode: Callable
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now + ttl, result)
+            self._db.execute("DELETE FROM tool_results WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_results (key, tool, result, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, tool, encode(result), now + ttl),
+            )
+            self._db.commit()
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        """The future of the call in flight for a key, and whether it is ours."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def _settle(self, key: str, future: Future, result: Any = None, error=None) -> None:
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # Cancelled: the waiting callers make the call themselves
+            future.set_exception(_AbandonedCallError())
+
+    def call(
+        self,
+        tool: str,
+        arguments: dict,
+        compute: Callable[[], Any],
+        source: str | None = None,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+        keep: Callable[[Any], bool] | None = None,
+    ) -> Any:
+        """The result of a tool call, computed only when it is not cached.
+
+        `encode` and `decode` turn the result into the text stored on disk, and
+        `keep` tells whether a result can be cached (not an error message).
+        """
+        key = self.key(tool, arguments)
+        while True:
+            result = self._lookup(key, tool, decode)
+            if result is not _MISSING:
+                return result
+
+            future, leader = self._join(key)
+            if not leader:
+                REGISTRY.inc(TOOL_CACHE_LOOKUPS, tool=tool, outcome="coalesced")
+                try:
+                    return future.result()
+                except _AbandonedCallError:
+                    continue
+
+            REGISTRY.inc(TOOL_CACHE_LOOKUPS, tool=tool, outcome="miss")
+            try:
+                result = compute()
+            except BaseException as e:
+                self._settle(key, future, error=e)
+                raise
+            self._settle(key, future, result)
+            if keep is None or keep(result):
+                self._store(key, tool, result, self.ttl(source), encode)
+            return result
+
+    async def acall(
+        self,
+        tool: str,
+        arguments: dict,
+        compute: Callable[[], Awaitable[Any]],
+        source: str | None = None,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+        keep: Callable[[Any], bool] | None = None,
+    ) -> Any:
+        """Async version of `call`, coalesced with the calls of any thread."""
+        key = self.key(tool, arguments)
+        while True:
+            result = self._lookup(key, tool, decode)
+            if result is not _MISSING:
+                return result
+
+            future, leader = self._join(key)
+            if not leader:
+                REGISTRY.inc(TOOL_CACHE_LOOKUPS, tool=tool, outcome="coalesced")
+                try:
+                    # Shielded: cancelling one waiter must not cancel the
+                    # future the leader and the other waiters share
+                    return await asyncio.shield(asyncio.wrap_future(future))
+                except _AbandonedCallError:
+                    continue
+
+            REGISTRY.inc(TOOL_CACHE_LOOKUPS, tool=tool, outcome="miss")
+            try:
+                result = await compute()
+            except BaseException as e:
+                self._settle(key, future, error=e)
+                raise
+            self._settle(key, future, result)
+            if keep is None or keep(result):
+                self._store(key, tool, result, self.ttl(source), encode)
+            return result
+
+    def clear(self) -> None:
+        """Remove every cached result."""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM tool_results")
+            self._db.commit()
+
+
+_tool_cache: ToolResultCache | None = None
+_tool_cache_lock = threading.Lock()
+
+
+def get_tool_cache() -> ToolResultCache | None:
+    """Get the process-wide tool result cache, or None when it is disabled."""
+    global _tool_cache
+
+    settings = get_settings()
+    if not settings.TOOL_CACHE_ENABLED:
+        return None
+
+    with _tool_cache_lock:
+        if _tool_cache is None:
+            _tool_cache = ToolResultCache(
+                path=os.path.join(settings.CACHE_DIR, "tools.sqlite3"),
+                ttl_seconds=settings.TOOL_CACHE_TTL_SECONDS,
+                default_ttl=settings.TOOL_CACHE_DEFAULT_TTL,
+                memory_entries=settings.TOOL_CACHE_MEMORY_ENTRIES,
+            )
+        return _tool_cache
+
+
+def cache_tool(
+    tool: T, source: str | None = None, keep: Callable[[Any], bool] | None = None
+) -> T:
+    """Serve the results of any crewai `BaseTool` from the tool result cache.
+
+    The `_run` and `_arun` methods of the tool are wrapped on the instance, and
+    their calls are keyed by the tool name and arguments. The results must be
+    JSON serializable, as the text most tools return is.
+    """
+
+    def arguments(args: tuple, kwargs: dict) -> dict:
+        return {"args": list(args), **kwargs} if args else kwargs
+
+    run = tool._run
+
+    def cached_run(*args, **kwargs):
+        cache = get_tool_cache()
+        compute = partial(run, *args, **kwargs)
+        if cache is None:
+            return compute()
+        return cache.call(
+            tool.name, arguments(args, kwargs), compute, source=source, keep=keep
+        )
+
+    object.__setattr__(tool, "_run", cached_run)
+
+    arun = getattr(tool, "_arun", None)
+    if arun is not None:
+
+        async def cached_arun(*args, **kwargs):
+            cache = get_tool_cache()
+            compute = partial(arun, *args, **kwargs)
+            if cache is None:
+                return await compute()
+            return await cache.acall(
+                tool.name, arguments(args, kwargs), compute, source=source, keep=keep
+            )
+
+        object.__setattr__(tool, "_arun", cached_arun)
+    return tool
@@ -1,5 +1,7 @@
+from .corpus_tool import SSLCorpusSearchTool
 from .wikipedia_tool import WikipediaSearchTool
 
 __all__ = [
+    "SSLCorpusSearchTool",
     "WikipediaSearchTool",
 ]
@@ -0,0 +1,65 @@
+from typing import Optional, Type
+
+from crewai.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from small_size_league_expert.corpus import get_corpus_index
+from small_size_league_expert.deadline import (
+    BUDGET_SPENT_MESSAGE,
+    answer_reserve,
+    current_deadline,
+)
+from small_size_league_expert.metrics import log_event, tool_call
+
+
+class SSLCorpusSearchInput(BaseModel):
+    """Input schema for SSLCorpusSearchTool."""
+
+    query: str = Field(..., description="What to search for in the SSL documents.")
+    source: Optional[str] = Field(
+        default=None,
+        description=(
+            "Restrict the search to one source: 'rules' for the rulebook, "
+            "'website' for the SSL website or 'tdp' for team description papers."
+        ),
+    )
+    top_k: int = Field(default=5, description="How many passages to return.")
+
+
+class SSLCorpusSearchTool(BaseTool):
+    name: str = "SSL Corpus Search"
+    description: str = (
+        "Searches a local index of the official SSL rulebook, the SSL website and "
+        "the team description papers. It is fast and works even when the other "
+        "SSL tools are unavailable, so try it first for rules and technical questions."
+    )
+    args_schema: Type[BaseModel] = SSLCorpusSearchInput
+
+    def _run(self, query: str, source: str | None = None, top_k: int = 5) -> str:
+        """
+        Search the local SSL corpus index.
+
+        Args:
+            query: What to search for.
+            source: Optional source to search in ('rules', 'website' or 'tdp').
+            top_k: How many passages to return.
+
+        Returns:
+            String with the matching passages and their references.
+        """
+        deadline = current_deadline()
+        if deadline is not None and deadline.spent(answer_reserve()):
+            return BUDGET_SPENT_MESSAGE
+
+        with tool_call("corpus"):
+            chunks = get_corpus_index().search(
+                query, top_k, [source] if source else None
+            )
+        if not chunks:
+            return f"No passage found in the SSL corpus for '{query}'."
+
+        log_event("corpus_search", query=query, source=source, passages=len(chunks))
+        return "\n\n".join(
+            f"[{chunk.source}] {chunk.title}\n{chunk.text}\nReference: {chunk.reference}"
+            for chunk in chunks
+        )
@@ -1,30 +1,350 @@
-from typing import Type
+import asyncio
+import re
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Awaitable, Optional, Type
 
-import requests
+import httpx
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
+from small_size_league_expert.deadline import (
+    BUDGET_SPENT_MESSAGE,
+    answer_reserve,
+    time_left,
+)
+from small_size_league_expert.embeddings import tokenize
+from small_size_league_expert.hedging import get_hedger
+from small_size_league_expert.metrics import log_event, tool_call
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.tool_cache import get_tool_cache
+
+USER_AGENT = (
+    "small-size-league-expert/0.1 "
+    "(https://github.com/brunoocastro/small_size_league_expert)"
+)
+
+# Sections that never hold content worth sending to the LLM
+SKIPPED_SECTIONS = {
+    "see also",
+    "references",
+    "external links",
+    "further reading",
+    "notes",
+    "bibliography",
+    "sources",
+}
+
+_HEADING = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
+
+
+@dataclass
+class WikipediaSection:
+    title: str
+    text: str
+
+
+@dataclass
+class WikipediaArticle:
+    title: str
+    url: str
+    sections: list[WikipediaSection]
+
+    def to_text(self) -> str:
+        parts = [f"# {self.title}\n({self.url})"]
+        parts += [f"## {section.title}\n{section.text}" for section in self.sections]
+        return "\n\n".join(parts)
+
+
+def split_sections(text: str) -> list[WikipediaSection]:
+    """Split a plain text article into its sections, the intro first."""
+    sections = []
+    matches = list(_HEADING.finditer(text))
+    intro = text[: matches[0].start()] if matches else text
+    if intro.strip():
+        sections.append(WikipediaSection("Introduction", intro.strip()))
+
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        body = text[match.end() : end].strip()
+        if body and match.group(2).lower() not in SKIPPED_SECTIONS:
+            sections.append(WikipediaSection(match.group(2), body))
+    return sections
+
+
+def select_sections(
+    sections: list[WikipediaSection], terms: list[str], max_chars: int
+) -> list[WikipediaSection]:
+    """Keep the first section and the ones that best match the terms, within budget.
+
+    Sections are scored by how often the terms appear in their title (counted
+    double) and text. The selected sections keep their article order.
+    """
+    if not sections:
+        return []
+
+    terms_set = set(tokenize(" ".join(terms)))
+
+    def score(section: WikipediaSection) -> int:
+        title_hits = sum(token in terms_set for token in tokenize(section.title))
+        text_hits = sum(token in terms_set for token in tokenize(section.text))
+        return 2 * title_hits + text_hits
+
+    scores = [score(section) for section in sections]
+    ranked = sorted(
+        (index for index in range(1, len(sections)) if scores[index] > 0),
+        key=lambda index: scores[index],
+        reverse=True,
+    )
+
+    chosen = {0: sections[0].text[:max_chars]}
+    budget = max_chars - len(chosen[0])
+    for index in ranked:
+        if budget <= 0:
+            break
+        chosen[index] = sections[index].text[:budget]
+        budget -= len(chosen[index])
+
+    return [WikipediaSection(sections[i].title, chosen[i]) for i in sorted(chosen)]
+
 
 class WikipediaSearchInput(BaseModel):
     """Input schema for WikipediaSearchTool."""
 
-    query: str = Field(..., description="The search term to look up on Wikipedia.")
+    query: str = Field(
+        ...,
+        description=(
+            "The article title to look up on Wikipedia. "
+            "Several titles can be separated by '|', e.g. 'RoboCup|Omni wheel'."
+        ),
+    )
     language: str = Field(
         default="pt",
         description="The language code for Wikipedia (e.g., 'pt' for Portuguese).",
     )
+    keywords: Optional[str] = Field(
+        default=None,
+        description="Keywords used to pick the relevant sections of the articles.",
+    )
+
+
+_sync_client: httpx.Client | None = None
+_sync_client_lock = threading.Lock()
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _client_options() -> dict:
+    return {
+        "timeout": httpx.Timeout(get_settings().WIKIPEDIA_TIMEOUT),
+        "headers": {"User-Agent": USER_AGENT},
+        "limits": httpx.Limits(max_keepalive_connections=10, max_connections=20),
+        "follow_redirects": True,
+    }
+
+
+def get_sync_client() -> httpx.Client:
+    """The HTTP client shared by every synchronous Wikipedia lookup."""
+    global _sync_client
+
+    with _sync_client_lock:
+        if _sync_client is None:
+            _sync_client = httpx.Client(**_client_options())
+        return _sync_client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """The HTTP client shared by the Wikipedia lookups of the running loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(**_client_options())
+        _async_clients[loop] = client
+    return client
 
 
 class WikipediaSearchTool(BaseTool):
     name: str = "Wikipedia Search"
     description: str = (
-        "Searches Wikipedia for information about a specific topic. "
-        "Returns the extracted text from the Wikipedia article. "
+        "Searches Wikipedia for information about specific topics. "
+        "Several article titles can be looked up at once by separating them with '|'. "
+        "Returns the sections of each article that match the keywords. "
         "Useful for researching factual information about various subjects."
     )
     args_schema: Type[BaseModel] = WikipediaSearchInput
 
-    def _run(self, query: str, language: str = "en") -> str:
+    # Titles looked up per search. Wikipedia returns a single full plain text
+    # extract per request, so each title is a request of its own.
+    max_titles: int = 20
+
+    @staticmethod
+    def _split_titles(query: str) -> list[str]:
+        return list(dict.fromkeys(t.strip() for t in query.split("|") if t.strip()))
+
+    @staticmethod
+    def _params(title: str) -> dict:
+        return {
+            "action": "query",
+            "prop": "extracts",
+            "explaintext": "1",
+            "exsectionformat": "wiki",
+            "titles": title,
+            "format": "json",
+            "formatversion": "2",
+            "utf8": "1",
+            "redirects": "1",
+        }
+
+    @staticmethod
+    def _extract(data: dict) -> tuple[str, str] | None:
+        """The title and plain text extract of the article of a response."""
+        for page in data.get("query", {}).get("pages", []):
+            if not page.get("missing") and page.get("extract"):
+                return page["title"], page["extract"]
+        return None
+
+    def _articles(
+        self, extracts: dict[str, str], language: str, terms: list[str], max_chars: int
+    ) -> list[WikipediaArticle]:
+        if not extracts:
+            return []
+
+        budget = max_chars // len(extracts)
+        return [
+            WikipediaArticle(
+                title=title,
+                url=f"https://{language}.wikipedia.org/wiki/{title.replace(' ', '_')}",
+                sections=select_sections(split_sections(extract), terms, budget),
+            )
+            for title, extract in extracts.items()
+        ]
+
+    @staticmethod
+    def _log_failure(title: str, language: str, error: Exception) -> None:
+        log_event(
+            "wikipedia_error",
+            sample_rate=1.0,
+            title=title,
+            language=language,
+            error=repr(error),
+        )
+
+    @staticmethod
+    def _cache_arguments(title: str, language: str) -> dict:
+        # The terms of the question are left out, the same article fetched for
+        # another question is the same call
+        return {"title": title, "language": language}
+
+    def fetch(
+        self, titles: list[str], language: str = "en", terms: list[str] | None = None
+    ) -> list[WikipediaArticle]:
+        """Fetch several articles and keep their relevant sections.
+
+        Each article is a request of its own, and the requests are made in
+        parallel on the shared client. The plain text extracts are cached, and
+        their sections selected for the terms afterwards.
+        """
+        titles = titles[: self.max_titles]
+        if not titles:
+            return []
+        terms = terms or titles
+        max_chars = get_settings().WIKIPEDIA_MAX_CHARS
+
+        def request(title: str) -> tuple[str, str] | None:
+            with tool_call("wikipedia"):
+                response = get_sync_client().get(
+                    f"https://{language}.wikipedia.org/w/api.php",
+                    params=self._params(title),
+                    timeout=time_left(get_settings().WIKIPEDIA_TIMEOUT),
+                )
+                response.raise_for_status()
+            return self._extract(response.json())
+
+        def lookup(title: str) -> tuple[str, str] | None:
+            cache = get_tool_cache()
+            try:
+                if cache is None:
+                    return request(title)
+                return cache.call(
+                    "wikipedia",
+                    self._cache_arguments(title, language),
+                    partial(request, title),
+                    source="wikipedia",
+                    keep=lambda extract: extract is not None,
+                )
+            except Exception as e:
+                # The other articles are still returned
+                self._log_failure(title, language, e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(titles)) as executor:
+            found = list(executor.map(lookup, titles))
+        extracts = dict(extract for extract in found if extract is not None)
+        return self._articles(extracts, language, terms, max_chars)
+
+    async def afetch(
+        self, titles: list[str], language: str = "en", terms: list[str] | None = None
+    ) -> list[WikipediaArticle]:
+        """Async version of `fetch`, on the shared client of the running loop."""
+        titles = titles[: self.max_titles]
+        if not titles:
+            return []
+        terms = terms or titles
+        max_chars = get_settings().WIKIPEDIA_MAX_CHARS
+
+        def send(title: str) -> Awaitable[httpx.Response]:
+            return get_async_client().get(
+                f"https://{language}.wikipedia.org/w/api.php",
+                params=self._params(title),
+            )
+
+        async def request(title: str) -> tuple[str, str] | None:
+            with tool_call("wikipedia"):
+                hedger = get_hedger()
+                call = partial(send, title)
+                response = await (hedger.call("wikipedia", call) if hedger else call())
+                response.raise_for_status()
+            return self._extract(response.json())
+
+        async def lookup(title: str) -> tuple[str, str] | None:
+            cache = get_tool_cache()
+            try:
+                if cache is None:
+                    return await request(title)
+                return await cache.acall(
+                    "wikipedia",
+                    self._cache_arguments(title, language),
+                    partial(request, title),
+                    source="wikipedia",
+                    keep=lambda extract: extract is not None,
+                )
+            except Exception as e:
+                # The other articles are still returned
+                self._log_failure(title, language, e)
+                return None
+
+        found = await asyncio.gather(*(lookup(title) for title in titles))
+        extracts = dict(extract for extract in found if extract is not None)
+        return self._articles(extracts, language, terms, max_chars)
+
+    def _format(self, query: str, articles: list[WikipediaArticle]) -> str:
+        if not articles:
+            return f"No Wikipedia article found for '{query}'. Try a different search term."
+
+        text = "\n\n".join(article.to_text() for article in articles)
+        log_event(
+            "wikipedia_search",
+            query=query,
+            articles=len(articles),
+            characters=len(text),
+        )
+        return text
+
+    def _run(
+        self, query: str, language: str = "en", keywords: str | None = None
+    ) -> str:
         """
         Fetch content from Wikipedia API based on the search query.
         Use mainly for getting general information about a topic.
@@ -38,54 +358,36 @@ class WikipediaSearchTool(BaseTool):
             - "Machine Learning"
             - "Deep Learning"
             - "Robotics"
+            - "Computer Vision|Kalman filter"
 
         Args:
-            query: The search term to look up on Wikipedia.
+            query: The titles to look up on Wikipedia, separated by '|'.
             language: The language code for Wikipedia (default: 'en' for English).
+            keywords: Keywords used to pick the relevant sections.
 
         Returns:
-            String with the extracted content from Wikipedia.
+            String with the relevant sections of each article found.
         """
-        try:
-            # Format the URL for the Wikipedia API
-            url = f"https://{language}.wikipedia.org/w/api.php"
-
-            # Set up the parameters for the API request
-            params = {
-                "action": "query",
-                "prop": "extracts",
-                "exlimit": "1",
-                "explaintext": "1",
-                "titles": query,
-                "format": "json",
-                "utf8": "1",
-                "redirects": "1",
-            }
-
-            # Make the request to the Wikipedia API
-            response = requests.get(url, params=params)
-            response.raise_for_status()  # Raise an exception for HTTP errors
-
-            # Parse the response
-            data = response.json()
+        if time_left(get_settings().WIKIPEDIA_TIMEOUT, answer_reserve()) <= 0:
+            return BUDGET_SPENT_MESSAGE
 
-            # Extract the page content
-            pages = data["query"]["pages"]
-            page_id = next(iter(pages))
-
-            # Check if page exists
-            if page_id == "-1":
-                return f"No Wikipedia article found for '{query}'. Try a different search term."
-
-            # Get the extracted text
-            extract = pages[page_id].get("extract", "")
-
-            print(f"\nWikipedia article for '{query}': {extract}\n")
-
-            if not extract:
-                return f"The Wikipedia article for '{query}' exists but has no extractable content."
+        titles = self._split_titles(query)
+        terms = [keywords] if keywords else titles
+        try:
+            return self._format(query, self.fetch(titles, language, terms))
+        except Exception as e:
+            return f"Error accessing Wikipedia: {str(e)}"
 
-            return extract
+    async def _arun(
+        self, query: str, language: str = "en", keywords: str | None = None
+    ) -> str:
+        """Async version of `_run`, which does not block the event loop."""
+        if time_left(get_settings().WIKIPEDIA_TIMEOUT, answer_reserve()) <= 0:
+            return BUDGET_SPENT_MESSAGE
 
+        titles = self._split_titles(query)
+        terms = [keywords] if keywords else titles
+        try:
+            return self._format(query, await self.afetch(titles, language, terms))
         except Exception as e:
             return f"Error accessing Wikipedia: {str(e)}"
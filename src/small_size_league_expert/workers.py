@@ -0,0 +1,391 @@
+"""Crew execution in a fleet of worker processes.
+
+The gateway (the Discord bot, for instance) only schedules questions. Crews
+run in worker processes that take jobs from a `JobQueue` and send back the
+chunks of the streamed answer and the final `DiscordAnswer`. This keeps
+blocking tool code and CPU-bound parsing off the gateway event loop, and
+spreads the crews over all the cores.
+
+Workers are spawned locally by `WorkerFleet`. Setting `WORKER_QUEUE_ADDRESS`
+also serves the queue over TCP, so workers on other hosts can join with:
+
+    python -m small_size_league_expert.workers --connect gateway-host:50000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+import uuid
+from abc import ABC, abstractmethod
+from multiprocessing.managers import BaseManager
+from typing import Any, Protocol
+
+from small_size_league_expert.deadline import with_deadline
+from small_size_league_expert.metrics import REGISTRY, start_metrics_server
+from small_size_league_expert.models import DiscordAnswer
+from small_size_league_expert.settings import get_settings
+from small_size_league_expert.startup import startup_report, startup_step
+from small_size_league_expert.streaming import AnswerStream
+
+# Messages sent back by the workers: (kind, job id, payload)
+STARTED = "started"
+CHUNK = "chunk"
+RESULT = "result"
+ERROR = "error"
+METRICS = "metrics"
+
+
+class CrewEngine(Protocol):
+    """Runs crews for the gateway, in-process (`CrewPool`) or not (`WorkerFleet`)."""
+
+    async def start(self) -> None: ...
+
+    async def answer(
+        self, inputs: dict[str, Any], stream: AnswerStream | None = None
+    ) -> DiscordAnswer | None: ...
+
+    async def close(self) -> None: ...
+
+
+class JobQueue(ABC):
+    """Carries jobs to the workers and their responses back to the gateway.
+
+    Jobs are `(job_id, inputs)` tuples, or None to stop a worker. Responses
+    are `(kind, job_id, payload)` tuples.
+    """
+
+    jobs: Any
+    responses: Any
+
+    @abstractmethod
+    def worker_args(self) -> tuple:
+        """What a spawned worker needs to reach the queue."""
+
+    def close(self) -> None:
+        pass
+
+
+class LocalJobQueue(JobQueue):
+    """Multiprocessing queues shared with the workers spawned on this host."""
+
+    def __init__(self, jobs: Any, responses: Any):
+        self.jobs = jobs
+        self.responses = responses
+
+    @classmethod
+    def create(cls, context: multiprocessing.context.BaseContext) -> "LocalJobQueue":
+        return cls(context.Queue(), context.Queue())
+
+    def worker_args(self) -> tuple:
+        return (self.jobs, self.responses)
+
+
+_served_jobs: queue.Queue = queue.Queue()
+_served_responses: queue.Queue = queue.Queue()
+
+
+def _get_jobs() -> queue.Queue:
+    return _served_jobs
+
+
+def _get_responses() -> queue.Queue:
+    return _served_responses
+
+
+class _QueueManager(BaseManager):
+    pass
+
+
+_QueueManager.register("jobs", callable=_get_jobs)
+_QueueManager.register("responses", callable=_get_responses)
+
+
+def _parse_address(address: str) -> tuple[str, int]:
+    """The host and port of a queue address, on the loopback without a host."""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class RemoteJobQueue(JobQueue):
+    """Queues served over TCP, reachable by workers on other hosts.
+
+    The queues send pickled objects, so anyone holding the authkey can run
+    code in the gateway and the workers: it must be a secret, never a default.
+    """
+
+    def __init__(self, address: str, authkey: str, serve: bool = False):
+        if not authkey:
+            raise ValueError(
+                "WORKER_QUEUE_AUTHKEY must be set to a secret to serve or join "
+                "the job queue"
+            )
+        self.address = address
+        self.authkey = authkey
+        self._manager = _QueueManager(_parse_address(address), authkey.encode())
+        if serve:
+            self._manager.start()
+        else:
+            self._manager.connect()
+        self._serving = serve
+        self.jobs = self._manager.jobs()
+        self.responses = self._manager.responses()
+
+    def worker_args(self) -> tuple:
+        host, port = _parse_address(self.address)
+        address = f"{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+        return (address, self.authkey)
+
+    def close(self) -> None:
+        if self._serving:
+            self._manager.shutdown()
+
+
+def _connect(args: tuple) -> JobQueue:
+    """Rebuild, in a worker, the queue described by `JobQueue.worker_args`."""
+    if isinstance(args[0], str):
+        return RemoteJobQueue(*args)
+
+    return LocalJobQueue(*args)
+
+
+async def _serve(job_queue: JobQueue, concurrency: int) -> None:
+    """Answer the jobs of the queue with a pool of crews, until told to stop."""
+    # Only the workers build crews
+    from small_size_league_expert.crew_pool import CrewPool
+
+    startup_step("imports")
+    settings = get_settings()
+    crew_pool = CrewPool(size=concurrency)
+    await crew_pool.start()
+    startup_step("crews")
+    slots = asyncio.Semaphore(concurrency)
+    running: set[asyncio.Task] = set()
+
+    async def forward(job_id: str, stream: AnswerStream) -> None:
+        sent = 0
+        async for text in stream.updates(settings.WORKER_STREAM_INTERVAL):
+            job_queue.responses.put((CHUNK, job_id, text[sent:]))
+            sent = len(text)
+
+    async def handle(job_id: str, inputs: dict) -> None:
+        try:
+            job_queue.responses.put((STARTED, job_id, os.getpid()))
+            stream = AnswerStream()
+            forwarding = asyncio.create_task(forward(job_id, stream))
+            try:
+                answer = await crew_pool.answer(inputs, stream)
+            finally:
+                stream.close()
+                await forwarding
+            job_queue.responses.put(
+                (RESULT, job_id, answer.model_dump_json() if answer else None)
+            )
+        except Exception as e:
+            traceback.print_exc()
+            job_queue.responses.put((ERROR, job_id, repr(e)))
+        finally:
+            # The gateway serves the metrics of every worker
+            job_queue.responses.put((METRICS, job_id, REGISTRY.drain()))
+            slots.release()
+
+    print(f"👷 Worker {os.getpid()} ready with {concurrency} crews")
+    startup_report("worker")
+    try:
+        while True:
+            await slots.acquire()
+            job = await asyncio.to_thread(job_queue.jobs.get)
+            if job is None:
+                break
+            task = asyncio.create_task(handle(*job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        await asyncio.gather(*running)
+    finally:
+        await crew_pool.close()
+
+
+def run_worker(queue_args: tuple, concurrency: int) -> None:
+    """Entry point of a worker process."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    asyncio.run(_serve(_connect(queue_args), concurrency))
+
+
+class WorkerFleet:
+    """Runs the crews in worker processes and collects their answers.
+
+    Offers the same `start`, `answer` and `close` methods as `CrewPool`, so
+    the gateway can use either of them.
+    """
+
+    def __init__(self, processes: int | None = None, concurrency: int | None = None):
+        settings = get_settings()
+        self.processes = (
+            processes if processes is not None else settings.WORKER_PROCESSES
+        )
+        self.concurrency = concurrency or settings.CREW_POOL_SIZE
+        self._context = multiprocessing.get_context("spawn")
+        self._job_queue: JobQueue | None = None
+        self._workers: list[multiprocessing.process.BaseProcess] = []
+        self._pending: dict[str, tuple[asyncio.Future, AnswerStream | None]] = {}
+        self._assigned: dict[str, int] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._monitor: asyncio.Task | None = None
+        self._closing = False
+
+    def _spawn(self) -> multiprocessing.process.BaseProcess:
+        worker = self._context.Process(
+            target=run_worker,
+            args=(self._job_queue.worker_args(), self.concurrency),
+            name="crew-worker",
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    async def start(self) -> None:
+        """Start the queue, the workers and the thread reading their responses."""
+        if self._job_queue is not None:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        settings = get_settings()
+        if settings.WORKER_QUEUE_ADDRESS:
+            self._job_queue = RemoteJobQueue(
+                settings.WORKER_QUEUE_ADDRESS, settings.WORKER_QUEUE_AUTHKEY, serve=True
+            )
+            print(f"📡 Serving the job queue on {settings.WORKER_QUEUE_ADDRESS}")
+        else:
+            self._job_queue = LocalJobQueue.create(self._context)
+
+        print(f"🏗️ Starting {self.processes} crew workers...")
+        self._workers = [self._spawn() for _ in range(self.processes)]
+        threading.Thread(
+            target=self._read_responses, name="worker-responses", daemon=True
+        ).start()
+        self._monitor = asyncio.create_task(self._watch_workers())
+
+    def _read_responses(self) -> None:
+        while not self._closing:
+            try:
+                response = self._job_queue.responses.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            self._loop.call_soon_threadsafe(self._dispatch, *response)
+
+    def _dispatch(self, kind: str, job_id: str, payload: Any) -> None:
+        if kind == METRICS:
+            REGISTRY.merge(payload)
+            return
+
+        pending = self._pending.get(job_id)
+        if pending is None:
+            return
+        future, stream = pending
+
+        if kind == STARTED:
+            self._assigned[job_id] = payload
+        elif kind == CHUNK:
+            if stream is not None:
+                stream.push(payload)
+        elif not future.done():
+            if kind == RESULT:
+                answer = DiscordAnswer.model_validate_json(payload) if payload else None
+                future.set_result(answer)
+            else:
+                future.set_exception(RuntimeError(f"Crew worker failed: {payload}"))
+
+    async def _watch_workers(self) -> None:
+        """Replace crashed workers and fail the jobs they were running."""
+        while not self._closing:
+            await asyncio.sleep(2)
+            for index, worker in enumerate(self._workers):
+                if worker.is_alive() or self._closing:
+                    continue
+
+                print(f"💥 Crew worker {worker.pid} died, starting a new one")
+                for job_id, pid in list(self._assigned.items()):
+                    if pid == worker.pid:
+                        self._dispatch(ERROR, job_id, "worker process died")
+                self._workers[index] = self._spawn()
+
+    async def answer(
+        self, inputs: dict[str, Any], stream: AnswerStream | None = None
+    ) -> DiscordAnswer | None:
+        """Send a question to the workers and wait for its answer."""
+        if self._job_queue is None:
+            await self.start()
+
+        job_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[job_id] = (future, stream)
+        # The time spent waiting for a worker counts against the deadline
+        inputs = with_deadline(inputs)
+        try:
+            await asyncio.to_thread(self._job_queue.jobs.put, (job_id, inputs))
+            # A job lost with its worker before it was reported as started
+            # would never be answered otherwise
+            return await asyncio.wait_for(future, get_settings().WORKER_JOB_TIMEOUT)
+        finally:
+            self._pending.pop(job_id, None)
+            self._assigned.pop(job_id, None)
+            if stream is not None:
+                stream.close()
+
+    async def close(self) -> None:
+        """Stop the workers once they finish their current jobs."""
+        if self._job_queue is None:
+            return
+
+        self._closing = True
+        if self._monitor:
+            self._monitor.cancel()
+        for _ in self._workers:
+            self._job_queue.jobs.put(None)
+        for worker in self._workers:
+            await asyncio.to_thread(worker.join, 30)
+            if worker.is_alive():
+                worker.terminate()
+        self._job_queue.close()
+
+
+def get_engine() -> CrewEngine:
+    """The crew engine of the gateway: a worker fleet, or in-process crews.
+
+    Also starts serving the metrics of the crews, which the gateway collects.
+    """
+    start_metrics_server()
+    if get_settings().WORKER_PROCESSES > 0:
+        return WorkerFleet()
+
+    from small_size_league_expert.crew_pool import CrewPool
+
+    return CrewPool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a crew worker.")
+    parser.add_argument(
+        "--connect", required=True, help="host:port of the gateway job queue."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=get_settings().CREW_POOL_SIZE
+    )
+    arguments = parser.parse_args()
+    if not get_settings().WORKER_QUEUE_AUTHKEY:
+        parser.error("WORKER_QUEUE_AUTHKEY must be set to the secret of the gateway")
+
+    run_worker(
+        (arguments.connect, get_settings().WORKER_QUEUE_AUTHKEY), arguments.concurrency
+    )
+
+
+if __name__ == "__main__":
+    main()
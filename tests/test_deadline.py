@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+from small_size_league_expert.deadline import (
+    DEADLINE_INPUT,
+    Deadline,
+    deadline_scope,
+    partial_markdown,
+    pop_deadline,
+    time_left,
+    with_deadline,
+)
+from small_size_league_expert.models import RankedAnswer, RankResult
+from small_size_league_expert.settings import get_settings
+
+
+def test_deadline_travels_with_the_crew_inputs(monkeypatch):
+    monkeypatch.setattr(get_settings(), "DEADLINE_SECONDS", 60.0)
+
+    inputs = with_deadline({"original_question": "How big is the field?"})
+    assert inputs[DEADLINE_INPUT] - time.time() == pytest.approx(60.0, abs=1.0)
+    # A deadline set when the question was accepted is kept
+    assert with_deadline(inputs) is inputs
+
+    crew_inputs, deadline = pop_deadline(inputs)
+    assert crew_inputs == {"original_question": "How big is the field?"}
+    assert deadline.expires_at == inputs[DEADLINE_INPUT]
+    assert pop_deadline(crew_inputs) == (crew_inputs, None)
+
+
+def test_no_deadline_when_disabled(monkeypatch):
+    monkeypatch.setattr(get_settings(), "DEADLINE_SECONDS", 0.0)
+    assert with_deadline({"original_question": "Why?"}) == {"original_question": "Why?"}
+
+
+def test_time_left_is_capped_by_the_deadline_of_the_scope():
+    assert time_left(10.0) == 10.0
+
+    async def in_task():
+        return time_left(10.0, reserve=3.0)
+
+    async def scenario():
+        with deadline_scope(Deadline.after(5.0)):
+            in_thread = await asyncio.to_thread(time_left, 10.0)
+            task = asyncio.create_task(in_task())
+        return in_thread, await task
+
+    in_thread, in_task_left = asyncio.run(scenario())
+    assert 4.0 < in_thread <= 5.0
+    assert 1.0 < in_task_left <= 2.0
+    assert time_left(10.0) == 10.0
+
+
+def test_spent_deadline_leaves_no_time():
+    deadline = Deadline(time.time() - 1)
+    assert deadline.remaining() == 0.0
+    assert deadline.spent()
+    assert Deadline.after(10.0).spent(reserve=30.0)
+
+    with deadline_scope(deadline):
+        assert time_left(10.0) == 0.0
+
+
+def test_partial_answer_is_made_of_the_best_passages():
+    passages = [
+        RankedAnswer(answer="Third passage.", references=["c"], rank=3),
+        RankedAnswer(
+            answer="The best   passage\nabout the ball " + "word " * 200,
+            references=["https://ssl.robocup.org/rules/", "corpus://rules/a", "x"],
+            rank=1,
+        ),
+        RankedAnswer(answer="Second passage.", references=[], rank=2),
+    ]
+    result = RankResult(
+        question="What is the ball?",
+        language_code="en",
+        keywords=["ball"],
+        technical_domains=["rules"],
+        sub_questions=[],
+        ranked_answers=passages,
+    )
+
+    markdown = partial_markdown(result, max_passages=2, max_chars=100)
+    blocks = markdown.split("\n\n")
+
+    assert blocks[0].startswith("⏱️")
+    assert len(blocks) == 3
+    assert blocks[1].startswith("> The best passage about the ball word")
+    assert blocks[1].split("\n")[0].endswith("...")
+    assert len(blocks[1].split("\n")[0]) <= len("> ") + 100 + len("...")
+    assert blocks[1].split("\n")[1] == (
+        "[source 1](https://ssl.robocup.org/rules/), [source 2](corpus://rules/a)"
+    )
+    assert blocks[2] == "> Second passage."
@@ -0,0 +1,87 @@
+import asyncio
+
+from small_size_league_expert.hedging import Hedger, LatencyTracker
+from small_size_league_expert.metrics import TOOL_HEDGES
+
+
+def test_p95_of_the_recent_latencies():
+    latencies = LatencyTracker(window=100)
+    assert latencies.percentile("search", 0.95) is None
+
+    for milliseconds in range(1, 201):
+        latencies.record("search", milliseconds / 1000)
+
+    # Only the last 100 calls are kept
+    assert latencies.percentile("search", 0.95) == 0.196
+    assert latencies.percentile("search", 0.95, min_samples=101) is None
+    assert latencies.percentile("other", 0.95) is None
+
+
+def test_no_hedge_until_the_latency_is_known():
+    hedger = Hedger(min_samples=3, min_delay=0.05)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        return "passages"
+
+    async def scenario():
+        results = [await hedger.call("search", compute) for _ in range(3)]
+        return results, hedger.delay("search")
+
+    results, delay = asyncio.run(scenario())
+    assert results == ["passages"] * 3
+    assert calls == 3
+    # The calls were instant, the delay is the minimum one
+    assert delay == 0.05
+
+
+def test_slow_call_is_hedged_at_the_p95_and_the_loser_is_not_sampled():
+    hedger = Hedger(min_samples=5, min_delay=0.01)
+    for _ in range(20):
+        hedger.latencies.record("wikipedia", 0.02)
+    attempts = []
+    cancelled = []
+
+    async def compute():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "slow"
+        return "fast"
+
+    before = TOOL_HEDGES.values.get(("wikipedia", "hedge_won"), 0)
+    result = asyncio.run(hedger.call("wikipedia", compute))
+
+    assert result == "fast"
+    assert attempts == [0, 1]
+    assert cancelled == [True]
+    assert TOOL_HEDGES.values.get(("wikipedia", "hedge_won"), 0) == before + 1
+    # The hedge was sampled, the cancelled primary was not
+    samples = list(hedger.latencies._samples["wikipedia"])
+    assert len(samples) == 21
+    assert samples[-1] < 0.02
+
+
+def test_failed_primary_falls_back_to_the_hedge():
+    hedger = Hedger(min_samples=1, min_delay=0.01)
+    hedger.latencies.record("search", 0.01)
+    attempts = 0
+
+    async def compute():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            await asyncio.sleep(0.05)
+            raise ConnectionError("server went away")
+        await asyncio.sleep(0.1)
+        return "passages"
+
+    assert asyncio.run(hedger.call("search", compute)) == "passages"
+    assert attempts == 2
+    assert len(hedger.latencies._samples["search"]) == 2
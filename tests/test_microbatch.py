@@ -0,0 +1,12 @@
+from small_size_league_expert.microbatch import split_shares
+
+
+def test_batch_usage_is_split_by_prompt_size():
+    assert split_shares(100, [1, 3]) == [25, 75]
+    assert sum(split_shares(1001, [120, 45, 310])) == 1001
+    assert split_shares(1, [10, 30]) == [0, 1]
+
+
+def test_requests_without_size_share_evenly():
+    assert split_shares(9, [0, 0, 0]) == [3, 3, 3]
+    assert split_shares(5, []) == []
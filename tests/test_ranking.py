@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from small_size_league_expert.models import Answer, Question
+from small_size_league_expert.ranking import LocalRanker, bm25_scores, source_of
+
+
+class FixedEmbedder:
+    """Embeds each text to its vector in `vectors`, the others to unit vectors of their own."""
+
+    dimension = 8
+
+    def __init__(self, vectors: dict[str, list[float]] | None = None):
+        self.vectors = vectors or {}
+        self._others: dict[str, int] = {}
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        rows = []
+        for text in texts:
+            if text in self.vectors:
+                vector = np.zeros(self.dimension)
+                vector[: len(self.vectors[text])] = self.vectors[text]
+            else:
+                vector = np.eye(self.dimension)[
+                    self._others.setdefault(text, len(self._others))
+                ]
+            rows.append(vector)
+        rows = np.array(rows, dtype=np.float32)
+        return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def question(text: str = "What is the size of the ball?") -> Question:
+    return Question(
+        question=text,
+        language_code="en",
+        keywords=["ball", "size"],
+        technical_domains=["rules"],
+        sub_questions=[],
+    )
+
+
+def test_bm25_favours_documents_with_the_rare_query_terms():
+    scores = bm25_scores(
+        [["ball", "dribbler"], ["goal"]],
+        [["ball", "dribbler", "kick"], ["ball", "kick"], ["ball", "field"], ["goal"]],
+    )
+
+    assert scores.shape == (2, 4)
+    assert scores[0, 0] > scores[0, 1] > 0
+    assert scores[0, 1] == scores[0, 2]
+    assert scores[0, 3] == 0
+    assert scores[1].argmax() == 3
+
+
+def test_bm25_without_query_terms_scores_nothing():
+    assert not bm25_scores([[]], [["ball"], ["goal"]]).any()
+    assert bm25_scores([["ball"]], []).shape == (1, 0)
+
+
+def test_source_of_a_passage_comes_from_its_references():
+    assert source_of(["corpus://rules/ssl-rules.pdf"]) == "rules"
+    assert source_of(["mcp://search_tdp_papers"]) == "tdp"
+    assert source_of(["https://en.wikipedia.org/wiki/RoboCup"]) == "wikipedia"
+    assert source_of(["https://ssl.robocup.org/rules/"]) == "website"
+    # An unknown MCP tool tells nothing, the next reference does
+    assert source_of(["mcp://lookup", "https://robocup-ssl.github.io/"]) == "website"
+    assert source_of(["https://example.com"]) is None
+    assert source_of([]) is None
+
+
+def test_official_sources_outrank_equally_relevant_ones():
+    answers = [
+        Answer(
+            answer="The ball is an orange golf ball, its size is 43 mm.",
+            references=["https://en.wikipedia.org/wiki/Golf_ball"],
+        ),
+        Answer(
+            answer="The ball size is 43 mm, an orange golf ball.",
+            references=["corpus://rules/ssl-rules.pdf"],
+        ),
+    ]
+    ranker = LocalRanker(FixedEmbedder(), lexical_weight=1.0)
+
+    scores, _ = ranker.scores(question(), answers)
+    result = ranker.rank(question(), answers)
+
+    assert scores[1] / scores[0] == pytest.approx(1.0 / 0.5)
+    assert [answer.references for answer in result.ranked_answers] == [
+        ["corpus://rules/ssl-rules.pdf"],
+        ["https://en.wikipedia.org/wiki/Golf_ball"],
+    ]
+
+
+def test_near_duplicates_are_merged_into_the_better_passage():
+    rules = "The ball size is 43 mm, an orange golf ball."
+    copy = "The ball size is 43 mm: an orange golf ball."
+    other = "The field size is 12 by 9 m."
+    answers = [
+        Answer(answer=copy, references=["https://ssl.robocup.org/rules/"]),
+        Answer(answer=rules, references=["corpus://rules/ssl-rules.pdf"]),
+        Answer(answer=other, references=["corpus://tdp/team.pdf"]),
+    ]
+    embedder = FixedEmbedder({rules: [1, 0.1], copy: [1, 0.12], other: [0, 1]})
+
+    result = LocalRanker(embedder, lexical_weight=1.0).rank(question(), answers)
+
+    assert [answer.answer for answer in result.ranked_answers] == [rules, other]
+    assert result.ranked_answers[0].references == [
+        "corpus://rules/ssl-rules.pdf",
+        "https://ssl.robocup.org/rules/",
+    ]
+    assert [answer.rank for answer in result.ranked_answers] == [1, 2]
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from small_size_league_expert import scheduler as scheduler_module
+from small_size_league_expert.scheduler import (
+    AskScheduler,
+    QueueFullError,
+    RateLimitedError,
+    TokenBucket,
+)
+
+
+def blocked_runner(release: asyncio.Event, answer: str = "answer"):
+    async def run(stream):
+        await release.wait()
+        return answer
+
+    return run
+
+
+def test_batch_is_charged_one_request():
+    async def scenario():
+        scheduler = AskScheduler(max_concurrency=2, max_queue=20, user_rate=(1, 1 / 60))
+        release = asyncio.Event()
+        flights = scheduler.submit_batch(
+            [(f"question {n}?", blocked_runner(release, str(n))) for n in range(5)],
+            user_id="user",
+        )
+        release.set()
+        return [await flight.result() for flight in flights]
+
+    assert asyncio.run(scenario()) == ["0", "1", "2", "3", "4"]
+
+
+def test_batch_over_the_queue_is_refused_as_a_whole():
+    async def scenario():
+        scheduler = AskScheduler(max_concurrency=1, max_queue=2, user_rate=(5, 1))
+        release = asyncio.Event()
+        with pytest.raises(QueueFullError):
+            scheduler.submit_batch(
+                [(f"question {n}?", blocked_runner(release)) for n in range(4)],
+                user_id="user",
+            )
+        return scheduler.running, scheduler.queued
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+
+def test_token_bucket_refills_over_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(capacity=2, rate=0.5)
+
+    bucket.consume()
+    bucket.consume()
+    assert bucket.retry_after() == pytest.approx(2.0)
+
+    now[0] += 1
+    assert bucket.retry_after() == pytest.approx(1.0)
+    now[0] += 1
+    assert bucket.retry_after() == 0.0
+    now[0] += 60
+    assert bucket.full
+    assert bucket.tokens == 2
+
+
+def test_user_over_the_rate_is_refused():
+    async def scenario():
+        scheduler = AskScheduler(max_concurrency=2, max_queue=5, user_rate=(1, 0.1))
+        release = asyncio.Event()
+        scheduler.submit("first question?", blocked_runner(release), user_id="user")
+        with pytest.raises(RateLimitedError) as refused:
+            scheduler.submit("second question?", blocked_runner(release), "user")
+        scheduler.submit("other question?", blocked_runner(release), "other user")
+        release.set()
+        return refused.value.retry_after
+
+    assert asyncio.run(scenario()) == pytest.approx(10.0, rel=0.01)
+
+
+def test_identical_questions_share_one_run():
+    async def scenario():
+        scheduler = AskScheduler(max_concurrency=1, max_queue=5, user_rate=(5, 1))
+        release = asyncio.Event()
+        calls = []
+
+        async def run(stream):
+            calls.append(stream)
+            await release.wait()
+            return "answer"
+
+        first = scheduler.submit("What is the ball size?", run, user_id="a")
+        second = scheduler.submit("what is the  ball size", run, user_id="b")
+        release.set()
+        return first, second, await second.result(), len(calls)
+
+    first, second, result, calls = asyncio.run(scenario())
+    assert first is second
+    assert first.callers == 2
+    assert result == "answer"
+    assert calls == 1
+
+
+def test_waiting_runs_are_served_round_robin():
+    async def scenario():
+        scheduler = AskScheduler(max_concurrency=1, max_queue=10, user_rate=(10, 1))
+        release = asyncio.Event()
+        started = []
+
+        def runner(name):
+            async def run(stream):
+                started.append(name)
+                await release.wait()
+                return name
+
+            return run
+
+        flights = [scheduler.submit("question a0?", runner("a0"), user_id="a")]
+        for name in ("a1", "a2", "a3"):
+            flights.append(scheduler.submit(f"question {name}?", runner(name), "a"))
+        flights.append(scheduler.submit("question b1?", runner("b1"), user_id="b"))
+        positions = [flight.position for flight in flights]
+
+        release.set()
+        await asyncio.gather(*(flight.result() for flight in flights))
+        return positions, started
+
+    positions, started = asyncio.run(scenario())
+    assert positions == [0, 1, 3, 4, 2]
+    assert started == ["a0", "a1", "b1", "a2", "a3"]
+
+
+def test_follow_ups_are_shared_only_within_their_session():
+    async def scenario():
+        scheduler = AskScheduler(max_concurrency=4, max_queue=5, user_rate=(5, 1))
+        release = asyncio.Event()
+        follow_up = "and for Division B?"
+        first = scheduler.submit(follow_up, blocked_runner(release), "a", session="1")
+        same = scheduler.submit(follow_up, blocked_runner(release), "b", session="1")
+        other = scheduler.submit(follow_up, blocked_runner(release), "c", session="2")
+        standalone = [
+            scheduler.submit(
+                "What is the ball size?", blocked_runner(release), user, session=session
+            )
+            for user, session in (("a", "1"), ("c", "2"))
+        ]
+        release.set()
+        return first, same, other, standalone
+
+    first, same, other, standalone = asyncio.run(scenario())
+    assert first is same
+    assert first is not other
+    assert standalone[0] is standalone[1]
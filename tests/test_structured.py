@@ -0,0 +1,121 @@
+from crewai import Task
+
+from small_size_league_expert.metrics import STRUCTURED_OUTPUTS
+from small_size_league_expert.models import Question, RankResult
+from small_size_league_expert.stages import StageTask
+from small_size_league_expert.structured import load_json, parse_output
+
+QUESTION = {
+    "question": "What is the size of the ball?",
+    "language_code": "en",
+    "keywords": ["ball", "size"],
+    "technical_domains": ["rules"],
+    "sub_questions": ["What is the diameter of the ball?"],
+}
+
+
+def outputs(stage: str, outcome: str) -> float:
+    return STRUCTURED_OUTPUTS.values.get((stage, outcome), 0)
+
+
+def stage_task(name: str, known: dict | None = None) -> StageTask:
+    return StageTask(
+        name=name,
+        description="Analyze the question",
+        expected_output="The analyzed question",
+        output_pydantic=Question,
+        known_fields=(lambda: known) if known is not None else None,
+    )
+
+
+def test_almost_json_replies_are_repaired():
+    assert load_json('{"a": 1}') == ({"a": 1}, False)
+    assert load_json('Here it is:\n```json\n{"a": [1, 2,],}\n```') == (
+        {"a": [1, 2]},
+        True,
+    )
+    assert load_json("{'a': True, 'b': None}") == ({"a": True, "b": None}, True)
+    # Cut by the token limit in the middle of the last item
+    assert load_json('{"a": [1, 2], "b": "cut') == ({"a": [1, 2], "b": "cut"}, True)
+    assert load_json('[{"a": 1}, {"a": 2}, {"a": ') == ([{"a": 1}, {"a": 2}], True)
+    assert load_json("No JSON in this reply") == (None, False)
+
+
+def test_valid_output_is_parsed_as_it_is():
+    question, repaired = parse_output(Question(**QUESTION).model_dump_json(), Question)
+
+    assert question == Question(**QUESTION)
+    assert not repaired
+
+
+def test_output_is_reshaped_with_the_known_fields():
+    reply = """```json
+    {"Question": {"question": "What is the size of the ball?",
+      "keywords": "ball",
+      "sub_questions": ["a?", "b?", "c?", "d?"],
+      "language_code": null}}
+    ```"""
+
+    question, repaired = parse_output(
+        reply, Question, known={"language_code": "en", "technical_domains": ["rules"]}
+    )
+
+    assert repaired
+    assert question.language_code == "en"
+    assert question.keywords == ["ball"]
+    assert question.technical_domains == ["rules"]
+    assert question.sub_questions == ["a?", "b?", "c?"]
+
+
+def test_ranked_answers_without_rank_get_their_position():
+    reply = {
+        **QUESTION,
+        "ranked_answers": [
+            {"answer": "The ball is an orange golf ball.", "references": "rules"},
+            {"answer": "Its diameter is 43 mm.", "references": ["rules"]},
+        ],
+    }
+
+    result, repaired = parse_output(str(reply), RankResult)
+
+    assert repaired
+    assert [answer.rank for answer in result.ranked_answers] == [1, 2]
+    assert result.ranked_answers[0].references == ["rules"]
+
+
+def test_unusable_output_is_not_repaired():
+    assert parse_output("I could not find anything.", Question) == (None, False)
+    assert parse_output('{"question": "Size?"}', Question) == (None, False)
+
+
+def test_stage_output_is_repaired_before_the_conversion_call(monkeypatch):
+    def conversion(self, result):
+        raise AssertionError("The conversion LLM call must not be made")
+
+    monkeypatch.setattr(Task, "_export_output", conversion)
+    task = stage_task("repaired_stage", known={"technical_domains": ["rules"]})
+    reply = '{"question": "What is the size of the ball?", "language_code": "en", "keywords": ["ball"], "sub_questions": [],}'
+
+    question, json_output = task._export_output(reply)
+
+    assert question.technical_domains == ["rules"]
+    assert json_output is None
+    assert outputs("repaired_stage", "repaired") == 1
+
+
+def test_unrepairable_stage_output_goes_to_the_conversion_call(monkeypatch):
+    converted = Question(**QUESTION)
+    replies = []
+
+    def conversion(self, result):
+        replies.append(result)
+        return (converted, None) if len(replies) == 1 else (None, None)
+
+    monkeypatch.setattr(Task, "_export_output", conversion)
+    task = stage_task("converted_stage")
+
+    assert task._export_output("The question is about the ball.") == (converted, None)
+    assert task._export_output("Nothing here either.") == (None, None)
+    assert replies == ["The question is about the ball.", "Nothing here either."]
+    assert outputs("converted_stage", "converted") == 1
+    assert outputs("converted_stage", "failed") == 1
@@ -0,0 +1,63 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from small_size_league_expert import tool_cache
+from small_size_league_expert.tool_cache import ToolResultCache
+
+
+def test_cancelled_follower_does_not_cancel_the_shared_call(tmp_path):
+    cache = ToolResultCache(str(tmp_path / "tools.sqlite3"))
+    release = asyncio.Event()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"passages": ["The ball is an orange golf ball."]}
+
+    def search():
+        return cache.acall("search", {"query": "ball"}, compute)
+
+    async def scenario():
+        leader = asyncio.create_task(search())
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(search())
+        follower = asyncio.create_task(search())
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        return await asyncio.gather(leader, follower, cancelled, return_exceptions=True)
+
+    leader, follower, cancelled = asyncio.run(scenario())
+
+    expected = {"passages": ["The ball is an orange golf ball."]}
+    assert leader == expected
+    assert follower == expected
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert calls == 1
+
+
+def test_cache_tool_serves_repeated_calls(tmp_path, monkeypatch):
+    cache = ToolResultCache(str(tmp_path / "tools.sqlite3"))
+    monkeypatch.setattr(tool_cache, "get_tool_cache", lambda: cache)
+
+    class SearchTool(BaseModel):
+        name: str = "Search"
+        calls: int = 0
+
+        def _run(self, query: str) -> str:
+            self.calls += 1
+            return "Error" if query == "fail" else f"passages for {query}"
+
+    tool = tool_cache.cache_tool(SearchTool(), keep=lambda result: result != "Error")
+
+    assert tool._run(query="ball  size") == "passages for ball  size"
+    assert tool._run(query="ball size") == "passages for ball  size"
+    assert tool._run(query="fail") == "Error"
+    assert tool._run(query="fail") == "Error"
+    assert tool.calls == 3